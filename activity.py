@@ -0,0 +1,86 @@
+from sqlalchemy import case, func, inspect, select, text, update
+from models import db, Query, Response
+
+# ------------------------------
+# Denormalized response activity on queries
+# ------------------------------
+# queries.response_count / first_response_at / last_response_at (and
+# answered = response_count > 0) are kept in step with the responses table by
+# single UPDATE statements inside the writer's transaction:
+#   record_response()  after one response is added (respond_to_query)
+#   recompute()        after responses were deleted (moderation), from the
+#                      responses that are left
+# `flask backfill-response-activity` adds the columns to an existing database
+# and recomputes every query.
+
+ACTIVITY_COLUMNS = ('response_count', 'first_response_at', 'last_response_at')
+
+
+# Returns True if this response is the query's first (answered flipped)
+def record_response(query_id, created_at):
+    newly_answered = db.session.execute(
+        update(Query).where(Query.id == query_id, Query.answered.isnot(True)).values(answered=True)
+        .execution_options(synchronize_session=False)
+    ).rowcount == 1
+    db.session.execute(
+        update(Query).where(Query.id == query_id).values(
+            response_count=Query.response_count + 1,
+            first_response_at=func.coalesce(Query.first_response_at, created_at),
+            last_response_at=case((Query.last_response_at > created_at, Query.last_response_at),
+                                  else_=created_at),
+        ).execution_options(synchronize_session=False)
+    )
+    return newly_answered
+
+
+def _recompute_statement():
+    responses = Response.__table__
+    count = select(func.count(responses.c.id)) \
+        .where(responses.c.query_id == Query.id).scalar_subquery()
+    first = select(func.min(responses.c.created_at)) \
+        .where(responses.c.query_id == Query.id).scalar_subquery()
+    last = select(func.max(responses.c.created_at)) \
+        .where(responses.c.query_id == Query.id).scalar_subquery()
+    return update(Query).values(response_count=count, first_response_at=first,
+                                last_response_at=last, answered=count > 0)
+
+
+# Recount the given queries from their remaining responses.
+# Returns (newly_answered_ids, reopened_ids) so callers can fix stats/triage.
+def recompute(query_ids):
+    query_ids = list(query_ids)
+    if not query_ids:
+        return [], []
+    before = dict(db.session.query(Query.id, Query.answered).filter(Query.id.in_(query_ids)))
+    db.session.execute(
+        _recompute_statement().where(Query.id.in_(query_ids))
+        .execution_options(synchronize_session=False)
+    )
+    after = dict(db.session.query(Query.id, Query.answered).filter(Query.id.in_(query_ids)))
+    newly_answered = [qid for qid, answered in after.items() if answered and not before.get(qid)]
+    reopened = [qid for qid, answered in after.items() if not answered and before.get(qid)]
+    return newly_answered, reopened
+
+
+def ensure_columns():
+    existing = {column['name'] for column in inspect(db.engine).get_columns('queries')}
+    dialect = db.engine.dialect
+    for name in ACTIVITY_COLUMNS:
+        if name in existing:
+            continue
+        column = Query.__table__.c[name]
+        ddl = f"ALTER TABLE queries ADD COLUMN {name} {column.type.compile(dialect=dialect)}"
+        if name == 'response_count':
+            ddl += " NOT NULL DEFAULT 0"
+        db.session.execute(text(ddl))
+    db.session.commit()
+
+
+# Add missing columns and recompute every query (`flask backfill-response-activity`)
+def backfill():
+    ensure_columns()
+    updated = db.session.execute(
+        _recompute_statement().execution_options(synchronize_session=False)
+    ).rowcount
+    db.session.commit()
+    return updated
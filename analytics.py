@@ -0,0 +1,342 @@
+import json
+import math
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import delete, false, func, insert, select, update
+from sqlalchemy.dialects.postgresql import array, insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from models import db, User, Query, Response, ResponseTimeRollup
+from feed import parse_datetime_arg
+from serializers import timestamp
+import stats
+
+# ------------------------------
+# Time-to-first-response rollups
+# ------------------------------
+# response_time_rollups keeps one row per (granularity, faculty_id, bucket)
+# for hourly and daily buckets in UTC, faculty_id 0 standing for everyone.
+# The write routes update them inside their own transaction, like
+# stats.bump():
+#   record_query()           create_query: queries_created in the bucket
+#                            the query was asked in
+#   record_first_response()  respond_to_query, when the response answers
+#                            the query: first_responses, seconds_total and
+#                            the sketch in the bucket it was answered in,
+#                            for everyone and for the responding faculty
+# Each row carries a mergeable Sketch of the response times, so p50/p90 over
+# any window merges the sketches of its buckets: dashboards read O(buckets)
+# rows whatever the number of queries.
+#
+# Rollups record history as it happened: moderation deleting a query or its
+# first response does not rewrite them. `flask rebuild-analytics` recomputes
+# everything from the tables.
+
+GRANULARITIES = {'hour': timedelta(hours=1), 'day': timedelta(days=1)}
+DEFAULT_SPAN = {'hour': timedelta(hours=48), 'day': timedelta(days=30)}
+ALL_FACULTY = 0
+QUANTILES = (0.5, 0.9)
+RELATIVE_ACCURACY = 0.01
+MAX_BUCKETS = 2000
+REBUILD_BATCH = 1000
+
+
+class Sketch:
+    # Log-bucketed histogram (DDSketch): a value v goes to bin
+    # ceil(log_gamma(v)), so every quantile is within RELATIVE_ACCURACY of the
+    # true one. Merging adds bin counts, which makes it exact across buckets.
+    GAMMA = (1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY)
+    LOG_GAMMA = math.log(GAMMA)
+    MIN_VALUE = 1.0  # seconds; anything faster counts as zero
+
+    def __init__(self, bins=None, zero=0):
+        self.bins = dict(bins or {})
+        self.zero = zero
+
+    @property
+    def count(self):
+        return self.zero + sum(self.bins.values())
+
+    def add(self, value, count=1):
+        if value < self.MIN_VALUE:
+            self.zero += count
+            return
+        key = math.ceil(math.log(value) / self.LOG_GAMMA)
+        self.bins[key] = self.bins.get(key, 0) + count
+
+    def merge(self, other):
+        self.zero += other.zero
+        for key, count in other.bins.items():
+            self.bins[key] = self.bins.get(key, 0) + count
+        return self
+
+    def quantile(self, q):
+        total = self.count
+        if not total:
+            return None
+        rank = q * (total - 1)
+        seen = self.zero
+        if rank < seen:
+            return 0.0
+        for key in sorted(self.bins):
+            seen += self.bins[key]
+            if rank < seen:
+                return 2 * self.GAMMA ** key / (self.GAMMA + 1)
+        return 2 * self.GAMMA ** max(self.bins) / (self.GAMMA + 1)
+
+    def to_json(self):
+        return json.dumps({'zero': self.zero, 'bins': {str(k): n for k, n in sorted(self.bins.items())}},
+                          separators=(',', ':'))
+
+    @classmethod
+    def from_json(cls, raw):
+        data = json.loads(raw or '{}')
+        return cls({int(k): n for k, n in data.get('bins', {}).items()}, data.get('zero', 0))
+
+
+# Naive UTC, as the columns store it
+def _utc(value):
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def bucket_start(value, granularity):
+    value = _utc(value).replace(minute=0, second=0, microsecond=0)
+    return value.replace(hour=0) if granularity == 'day' else value
+
+
+def _keys(at, faculty_ids):
+    # Sorted, so concurrent writers lock rows in the same order
+    return sorted((granularity, faculty_id, bucket_start(at, granularity))
+                  for granularity in GRANULARITIES for faculty_id in set(faculty_ids))
+
+
+def _key_filter(key):
+    granularity, faculty_id, start = key
+    return (ResponseTimeRollup.granularity == granularity, ResponseTimeRollup.faculty_id == faculty_id,
+            ResponseTimeRollup.bucket_start == start)
+
+
+def _ensure_rows(keys):
+    dialect = db.session.get_bind().dialect.name
+    stmt = (pg_insert if dialect == 'postgresql' else sqlite_insert)(ResponseTimeRollup)
+    db.session.execute(stmt.values([
+        {'granularity': granularity, 'faculty_id': faculty_id, 'bucket_start': start,
+         'queries_created': 0, 'first_responses': 0, 'seconds_total': 0, 'sketch': '{}'}
+        for granularity, faculty_id, start in keys
+    ]).on_conflict_do_nothing())
+
+
+def record_query(created_at):
+    keys = _keys(created_at, (ALL_FACULTY,))
+    _ensure_rows(keys)
+    for key in keys:
+        db.session.execute(
+            update(ResponseTimeRollup).where(*_key_filter(key))
+            .values(queries_created=ResponseTimeRollup.queries_created + 1)
+            .execution_options(synchronize_session=False)
+        )
+
+
+def record_first_response(query_created_at, responded_at, faculty_id):
+    seconds = max((_utc(responded_at) - _utc(query_created_at)).total_seconds(), 0.0)
+    keys = _keys(responded_at, (ALL_FACULTY, faculty_id))
+    _ensure_rows(keys)
+    for key in keys:
+        # The sketch is read-modify-write: lock the row (FOR UPDATE on
+        # PostgreSQL; SQLite already serializes writers)
+        row = db.session.execute(
+            select(ResponseTimeRollup).where(*_key_filter(key))
+            .with_for_update().execution_options(populate_existing=True)
+        ).scalar_one()
+        sketch = Sketch.from_json(row.sketch)
+        sketch.add(seconds)
+        row.first_responses += 1
+        row.seconds_total += seconds
+        row.sketch = sketch.to_json()
+
+
+def _first_responses():
+    # The first response's author, through ix_responses_query_created
+    first_faculty = select(Response.faculty_id).where(Response.query_id == Query.id) \
+        .order_by(Response.created_at, Response.id).limit(1).scalar_subquery()
+    return select(Query.created_at, Query.first_response_at, first_faculty) \
+        .where(Query.first_response_at.isnot(None)).execution_options(yield_per=REBUILD_BATCH)
+
+
+# Recompute every rollup from queries and responses (`flask rebuild-analytics`)
+def rebuild():
+    rollups = {}
+
+    def rollup(key):
+        if key not in rollups:
+            rollups[key] = {'queries_created': 0, 'first_responses': 0, 'seconds_total': 0.0,
+                            'sketch': Sketch()}
+        return rollups[key]
+
+    stmt = select(Query.created_at).where(Query.created_at.isnot(None)) \
+        .execution_options(yield_per=REBUILD_BATCH)
+    for (created_at,) in db.session.execute(stmt):
+        for key in _keys(created_at, (ALL_FACULTY,)):
+            rollup(key)['queries_created'] += 1
+
+    for created_at, responded_at, faculty_id in db.session.execute(_first_responses()):
+        seconds = max((responded_at - created_at).total_seconds(), 0.0) if created_at else 0.0
+        faculty_ids = (ALL_FACULTY,) if faculty_id is None else (ALL_FACULTY, faculty_id)
+        for key in _keys(responded_at, faculty_ids):
+            row = rollup(key)
+            row['first_responses'] += 1
+            row['seconds_total'] += seconds
+            row['sketch'].add(seconds)
+
+    db.session.execute(delete(ResponseTimeRollup))
+    rows = [dict(values, granularity=granularity, faculty_id=faculty_id, bucket_start=start,
+                 sketch=values['sketch'].to_json())
+            for (granularity, faculty_id, start), values in rollups.items()]
+    for offset in range(0, len(rows), REBUILD_BATCH):
+        db.session.execute(insert(ResponseTimeRollup), rows[offset:offset + REBUILD_BATCH])
+    db.session.commit()
+    return len(rows)
+
+
+def _parse_datetime(args, name):
+    value = parse_datetime_arg(args, name)
+    return _utc(value) if value is not None else None
+
+
+# Read ?granularity=&since=&until=&faculty_id= into series()/summary() kwargs.
+# The window defaults to the last DEFAULT_SPAN up to the current bucket.
+def parse_window(args):
+    granularity = (args.get('granularity') or 'day').lower()
+    if granularity not in GRANULARITIES:
+        raise ValueError(f"Unknown granularity '{granularity}'. Use {', '.join(GRANULARITIES)}")
+    step = GRANULARITIES[granularity]
+    until = _parse_datetime(args, 'until') or bucket_start(datetime.utcnow(), granularity) + step
+    since = _parse_datetime(args, 'since') or until - DEFAULT_SPAN[granularity]
+    if since >= until:
+        raise ValueError('since must be before until')
+    if (until - since) / step > MAX_BUCKETS:
+        raise ValueError(f'At most {MAX_BUCKETS} {granularity} buckets per request')
+    try:
+        faculty_id = int(args.get('faculty_id', ALL_FACULTY))
+    except ValueError:
+        raise ValueError('faculty_id must be an integer')
+    return {'granularity': granularity, 'since': bucket_start(since, granularity), 'until': until,
+            'faculty_id': faculty_id}
+
+
+def _rollups(granularity, since, until, faculty_id=None):
+    stmt = select(ResponseTimeRollup).where(
+        ResponseTimeRollup.granularity == granularity,
+        ResponseTimeRollup.bucket_start >= since, ResponseTimeRollup.bucket_start < until)
+    if faculty_id is not None:
+        stmt = stmt.where(ResponseTimeRollup.faculty_id == faculty_id)
+    return db.session.execute(stmt.order_by(ResponseTimeRollup.faculty_id,
+                                            ResponseTimeRollup.bucket_start)).scalars()
+
+
+def _response_times(first_responses, seconds_total, sketch):
+    result = {'first_responses': first_responses,
+              'mean_seconds': round(seconds_total / first_responses, 1) if first_responses else None}
+    for q in QUANTILES:
+        value = sketch.quantile(q)
+        result[f'p{round(q * 100)}_seconds'] = round(value, 1) if value is not None else None
+    return result
+
+
+# One entry per bucket in the window, empty buckets included
+def series(granularity, since, until, faculty_id=ALL_FACULTY):
+    rows = {row.bucket_start: row for row in _rollups(granularity, since, until, faculty_id)}
+    step = GRANULARITIES[granularity]
+    buckets = []
+    start = since
+    while start < until:
+        row = rows.get(start)
+        if row is None:
+            entry = _response_times(0, 0.0, Sketch())
+        else:
+            entry = _response_times(row.first_responses, row.seconds_total, Sketch.from_json(row.sketch))
+        if faculty_id == ALL_FACULTY:
+            entry['queries_created'] = row.queries_created if row is not None else 0
+        buckets.append(dict(entry, bucket_start=timestamp(start)))
+        start += step
+    return buckets
+
+
+# created_at of the oldest unanswered query and at each fraction of the
+# unanswered ones, oldest first. PostgreSQL answers with one percentile_disc
+# aggregate; elsewhere the rows are read once in created_at order from the
+# partial index ix_queries_unanswered, up to the largest fraction's position.
+# Either way the cost is one ordered pass over the pending queries, O(pending).
+def _backlog_created_at(pending, fractions):
+    unanswered = Query.answered == false()
+    if db.session.get_bind().dialect.name == 'postgresql':
+        oldest, values = db.session.execute(
+            select(func.min(Query.created_at),
+                   func.percentile_disc(array(fractions)).within_group(Query.created_at))
+            .where(unanswered)
+        ).one()
+        return oldest, list(values or [None] * len(fractions))
+
+    positions = [round(fraction * (pending - 1)) for fraction in fractions]
+    at = {}
+    rows = db.session.execute(
+        select(Query.created_at).where(unanswered).order_by(Query.created_at, Query.id)
+        .limit(max(positions) + 1).execution_options(yield_per=1000)
+    ).scalars()
+    wanted = {0, *positions}
+    for position, created_at in enumerate(rows):
+        if position in wanted:
+            at[position] = created_at
+    return at.get(0), [at.get(position) for position in positions]
+
+
+# Unanswered queries right now: ages of the oldest and at QUANTILES, from the
+# table (see _backlog_created_at), no rollup needed
+def backlog(now=None):
+    now = now or datetime.utcnow()
+    counters = stats.read_stats()
+    pending = counters.total_queries - counters.answered_queries
+    result = {'pending': pending, 'oldest_age_seconds': None}
+    result.update({f'p{round(q * 100)}_age_seconds': None for q in QUANTILES})
+    if pending <= 0:
+        return result
+
+    def age(created_at):
+        return round(max((now - _utc(created_at)).total_seconds(), 0.0), 1) if created_at else None
+
+    # The q-quantile age is the (1 - q) quantile of created_at
+    oldest, created = _backlog_created_at(pending, [1 - q for q in QUANTILES])
+    result['oldest_age_seconds'] = age(oldest)
+    for q, created_at in zip(QUANTILES, created):
+        result[f'p{round(q * 100)}_age_seconds'] = age(created_at)
+    return result
+
+
+# The window merged: everyone, each faculty member, and the current backlog
+def summary(granularity, since, until):
+    merged = {}
+    queries_created = 0
+    for row in _rollups(granularity, since, until):
+        if row.faculty_id == ALL_FACULTY:
+            queries_created += row.queries_created
+        total = merged.setdefault(row.faculty_id, [0, 0.0, Sketch()])
+        total[0] += row.first_responses
+        total[1] += row.seconds_total
+        total[2].merge(Sketch.from_json(row.sketch))
+
+    overall = _response_times(*merged.pop(ALL_FACULTY, (0, 0.0, Sketch())))
+    names = dict(db.session.query(User.id, User.username).filter(User.id.in_(list(merged)))) if merged else {}
+    by_faculty = sorted(
+        (dict(_response_times(*total), faculty_id=member, username=names.get(member))
+         for member, total in merged.items() if total[0]),
+        key=lambda entry: (-entry['first_responses'], entry['faculty_id']),
+    )
+    return {
+        'granularity': granularity,
+        'since': timestamp(since),
+        'until': timestamp(until),
+        'queries_created': queries_created,
+        'overall': overall,
+        'by_faculty': by_faculty,
+        'backlog': backlog(),
+    }
@@ -0,0 +1,209 @@
+import hashlib
+import os
+import tempfile
+import time
+from flask import current_app, send_file
+from sqlalchemy import or_, select
+from werkzeug.utils import secure_filename
+from models import db, Attachment, Response
+from serializers import timestamp
+
+# ------------------------------
+# Evidence attachments in a content-addressed blob store
+# ------------------------------
+# Uploads are read from the request body CHUNK_BYTES at a time, hashed and
+# written to a temporary file as they arrive, then renamed to
+# <ATTACHMENT_DIR>/<sha[:2]>/<sha[2:4]>/<sha>. A file whose hash is already
+# stored is dropped instead, so the same viral image is kept once however
+# many attachments point at it.
+#
+# Downloads go through send_file(): the WSGI server's file wrapper sends the
+# file with sendfile(2) (or set USE_X_SENDFILE to hand it to the proxy),
+# Range requests answer 206, and since an attachment id always names the
+# same bytes the response is cacheable forever (ETag = the SHA-256).
+#
+# Deleting an attachment, its query or its response only removes the row;
+# `flask gc-attachments` deletes blobs no row points at any more.
+
+DEFAULT_DIR = 'attachments'
+DEFAULT_MAX_BYTES = 25 * 1024 * 1024
+DEFAULT_TYPES = ('image/png', 'image/jpeg', 'image/gif', 'image/webp', 'application/pdf',
+                 'text/plain', 'text/csv')
+# Shown in the browser; anything else downloads as a file
+INLINE_TYPES = ('image/png', 'image/jpeg', 'image/gif', 'image/webp', 'application/pdf', 'text/plain')
+CHUNK_BYTES = 64 * 1024
+CACHE_SECONDS = 365 * 24 * 3600
+DEFAULT_GC_GRACE = 24 * 3600
+
+
+class AttachmentTooLarge(Exception):
+    pass
+
+
+class UnsupportedType(Exception):
+    pass
+
+
+class EmptyAttachment(Exception):
+    pass
+
+
+class BlobStore:
+    def __init__(self, root):
+        self.root = root
+        self.tmp = os.path.join(root, 'tmp')
+
+    def path(self, sha256):
+        return os.path.join(self.root, sha256[:2], sha256[2:4], sha256)
+
+    # Returns (sha256, size, stored); stored is False when the bytes were
+    # already there
+    def put(self, stream, max_bytes=DEFAULT_MAX_BYTES):
+        os.makedirs(self.tmp, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.tmp)
+        digest = hashlib.sha256()
+        size = 0
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                while True:
+                    chunk = stream.read(CHUNK_BYTES)
+                    if not chunk:
+                        break
+                    size += len(chunk)
+                    if size > max_bytes:
+                        raise AttachmentTooLarge(f'Attachments are limited to {max_bytes} bytes')
+                    digest.update(chunk)
+                    out.write(chunk)
+                if not size:
+                    raise EmptyAttachment('The attachment is empty')
+                out.flush()
+                os.fsync(out.fileno())
+
+            sha256 = digest.hexdigest()
+            target = self.path(sha256)
+            if os.path.exists(target):
+                # Fresh mtime keeps gc() off a blob that is about to be referenced again
+                try:
+                    os.utime(target)
+                    return sha256, size, False
+                except FileNotFoundError:
+                    pass  # collected meanwhile: store it again
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            os.replace(tmp_path, target)
+            return sha256, size, True
+        finally:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+
+    def exists(self, sha256):
+        return os.path.exists(self.path(sha256))
+
+    def remove(self, sha256):
+        try:
+            os.unlink(self.path(sha256))
+        except FileNotFoundError:
+            pass
+
+    # (sha256, path) for every stored blob
+    def iter_blobs(self):
+        for directory, subdirs, files in os.walk(self.root):
+            if directory == self.root:
+                subdirs[:] = [d for d in subdirs if d != 'tmp']
+            for name in files:
+                if len(name) == 64:
+                    yield name, os.path.join(directory, name)
+
+
+def get_store(app=None):
+    app = app or current_app._get_current_object()
+    store = app.extensions.get('attachments')
+    if store is None:
+        root = app.config.get('ATTACHMENT_DIR', DEFAULT_DIR)
+        store = BlobStore(os.path.join(app.root_path, root))
+        app.extensions['attachments'] = store
+    return store
+
+
+def allowed_types():
+    return current_app.config.get('ATTACHMENT_TYPES', DEFAULT_TYPES)
+
+
+def max_bytes():
+    return current_app.config.get('ATTACHMENT_MAX_BYTES', DEFAULT_MAX_BYTES)
+
+
+# Stream the upload into the store and record it on a query or a response.
+# Returns (attachment, stored).
+def save(stream, content_type, filename, uploaded_by, query_id=None, response_id=None):
+    content_type = (content_type or '').split(';')[0].strip().lower()
+    if content_type not in allowed_types():
+        raise UnsupportedType(f"Unsupported content type '{content_type}'. Use {', '.join(allowed_types())}")
+    sha256, size, stored = get_store().put(stream, max_bytes())
+    attachment = Attachment(sha256=sha256, size=size, content_type=content_type,
+                            filename=secure_filename(filename or '') or 'attachment',
+                            query_id=query_id, response_id=response_id, uploaded_by=uploaded_by)
+    db.session.add(attachment)
+    db.session.commit()
+    return attachment, stored
+
+
+# A query's attachments and those of its responses, oldest first
+def for_query(query_id):
+    response_ids = select(Response.id).where(Response.query_id == query_id)
+    return db.session.query(Attachment).filter(or_(
+        Attachment.query_id == query_id, Attachment.response_id.in_(response_ids)
+    )).order_by(Attachment.id).all()
+
+
+def send(attachment):
+    path = get_store().path(attachment.sha256)
+    if not os.path.exists(path):
+        return None
+    response = send_file(
+        path,
+        mimetype=attachment.content_type,
+        as_attachment=attachment.content_type not in INLINE_TYPES,
+        download_name=attachment.filename,
+        conditional=True,
+        etag=attachment.sha256,
+        last_modified=attachment.created_at,
+        max_age=CACHE_SECONDS,
+    )
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    response.headers['X-Content-Type-Options'] = 'nosniff'
+    return response
+
+
+# Delete blobs no attachment points at (and abandoned uploads) untouched for
+# grace_seconds; the grace covers uploads still between put() and commit
+def gc(grace_seconds=DEFAULT_GC_GRACE):
+    store = get_store()
+    referenced = {sha256 for (sha256,) in db.session.query(Attachment.sha256).distinct()}
+    cutoff = time.time() - grace_seconds
+    removed = 0
+    for sha256, path in store.iter_blobs():
+        if sha256 not in referenced and os.path.getmtime(path) < cutoff:
+            store.remove(sha256)
+            removed += 1
+    if os.path.isdir(store.tmp):
+        for name in os.listdir(store.tmp):
+            path = os.path.join(store.tmp, name)
+            if os.path.getmtime(path) < cutoff:
+                os.unlink(path)
+    return removed
+
+
+def serialize_attachment(attachment):
+    return {
+        'id': attachment.id,
+        'sha256': attachment.sha256,
+        'size': attachment.size,
+        'content_type': attachment.content_type,
+        'filename': attachment.filename,
+        'query_id': attachment.query_id,
+        'response_id': attachment.response_id,
+        'uploaded_by': attachment.uploaded_by,
+        'created_at': timestamp(attachment.created_at),
+        'url': f'/api/attachments/{attachment.id}',
+    }
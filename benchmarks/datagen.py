@@ -0,0 +1,155 @@
+"""Synthetic forum generator for benchmarks.
+
+    DATABASE_URL=sqlite:///bench.db python benchmarks/datagen.py --queries 10000
+
+Recreates every table and fills them with users by role, queries and
+responses using multi-row inserts, then rebuilds the derived state
+(response activity, counters, search index, triage queue, response-time
+rollups, duplicate index).
+Every generated user's password is "secret"; usernames are student<N>,
+faculty<N> and admin<N>.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from flask import current_app
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db'))
+
+from sqlalchemy import insert  # noqa: E402
+from models import db, User, Query, Response  # noqa: E402
+import activity  # noqa: E402
+import analytics  # noqa: E402
+import dedup  # noqa: E402
+import migrations  # noqa: E402
+import passwords  # noqa: E402
+import search  # noqa: E402
+import stats  # noqa: E402
+import triage  # noqa: E402
+
+PASSWORD = 'secret'
+CHUNK = 5000
+WORDS = (
+    'vaccine climate election study report claim viral video photo source '
+    'university professor research data statistics government policy health '
+    'water energy covid science history quote article fake real evidence '
+    'survey percent million scientists published journal experiment result'
+).split()
+
+
+class Spec:
+    def __init__(self, students=200, faculty=20, admins=2, queries=1000,
+                 responses_per_query=1.5, answered_ratio=0.6,
+                 title_words=8, description_words=60, response_words=80, seed=7):
+        self.students = students
+        self.faculty = faculty
+        self.admins = admins
+        self.queries = queries
+        self.responses_per_query = responses_per_query
+        self.answered_ratio = answered_ratio
+        self.title_words = title_words
+        self.description_words = description_words
+        self.response_words = response_words
+        self.seed = seed
+
+    def as_dict(self):
+        return dict(vars(self))
+
+
+def sentence(rng, words):
+    return ' '.join(rng.choice(WORDS) for _ in range(max(1, int(rng.gauss(words, words / 4)))))
+
+
+def insert_chunked(model, rows):
+    for start in range(0, len(rows), CHUNK):
+        db.session.execute(insert(model), rows[start:start + CHUNK])
+
+
+# Must run inside an app context; returns the generated id ranges
+def generate(spec):
+    rng = random.Random(spec.seed)
+    db.drop_all()
+    migrations.upgrade()
+
+    # One hash shared by every user keeps generation fast
+    method = current_app.config.get('PASSWORD_HASH_METHOD', passwords.DEFAULT_METHOD)
+    password_hash = passwords.PasswordHasher(method=method, pool_size=0).hash(PASSWORD)
+    users = []
+    for role, count in (('student', spec.students), ('faculty', spec.faculty), ('admin', spec.admins)):
+        users += [{'username': f'{role}{i}', 'password_hash': password_hash, 'role': role, 'active': True}
+                  for i in range(count)]
+    insert_chunked(User, users)
+
+    student_ids = [row.id for row in db.session.query(User.id).filter_by(role='student').order_by(User.id)]
+    faculty_ids = [row.id for row in db.session.query(User.id).filter_by(role='faculty').order_by(User.id)]
+
+    start = datetime.utcnow() - timedelta(days=120)
+    step = timedelta(days=120) / max(spec.queries, 1)
+    queries, answered = [], []
+    for i in range(spec.queries):
+        is_answered = bool(faculty_ids) and rng.random() < spec.answered_ratio
+        answered.append(is_answered)
+        queries.append({
+            'title': sentence(rng, spec.title_words)[:200],
+            'description': sentence(rng, spec.description_words),
+            'student_id': rng.choice(student_ids),
+            'created_at': start + step * i,
+            'answered': is_answered,
+        })
+    insert_chunked(Query, queries)
+
+    query_rows = db.session.query(Query.id, Query.created_at).order_by(Query.id).all()
+    responses = []
+    mean_extra = max(spec.responses_per_query / max(spec.answered_ratio, 0.01) - 1, 0)
+    for (query_id, created_at), is_answered in zip(query_rows, answered):
+        if not is_answered:
+            continue
+        for n in range(1 + int(rng.expovariate(1 / mean_extra)) if mean_extra else 1):
+            responses.append({
+                'query_id': query_id,
+                'faculty_id': rng.choice(faculty_ids),
+                'content': sentence(rng, spec.response_words),
+                'created_at': created_at + timedelta(hours=rng.uniform(0.5, 72) * (n + 1)),
+            })
+    insert_chunked(Response, responses)
+    db.session.commit()
+
+    activity.backfill()
+    stats.reconcile()
+    search.rebuild_index()
+    triage.rebuild()
+    analytics.rebuild()
+    dedup.duplicate_index.build()
+
+    return {
+        'users': len(users),
+        'queries': len(queries),
+        'responses': len(responses),
+        'query_ids': (query_rows[0][0], query_rows[-1][0]) if query_rows else (0, 0),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    defaults = Spec()
+    for name, value in defaults.as_dict().items():
+        parser.add_argument('--' + name.replace('_', '-'), type=type(value), default=value)
+    args = parser.parse_args()
+
+    from app import create_app
+    app = create_app()
+    spec = Spec(**vars(args))
+    started = time.perf_counter()
+    with app.app_context():
+        summary = generate(spec)
+    print(f"✅ Generated {summary['users']} users, {summary['queries']} queries, "
+          f"{summary['responses']} responses in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,158 @@
+"""Query-plan regression check.
+
+    python benchmarks/explain.py --size 5000
+    DATABASE_URL=postgresql://... python benchmarks/explain.py
+
+Seeds a synthetic forum (see datagen.py), drives every benchmark endpoint
+(see run.py) once and EXPLAINs each distinct SELECT / UPDATE / DELETE it
+issued. A plan fails the check when it
+  - reads a whole table instead of an index (SQLite "SCAN <table>",
+    PostgreSQL "Seq Scan"), or
+  - sorts rows no index delivers in order (SQLite "USE TEMP B-TREE",
+    PostgreSQL "Sort"),
+unless ALLOWED names that endpoint and table with the reason. On PostgreSQL
+sequential scans and sorts are switched off while explaining, so a remaining
+one means no index can serve the statement at all, whatever the table size.
+
+Exits 1 when any plan fails, so it can gate a migration or model change.
+"""
+import argparse
+import os
+import re
+import sys
+from collections import namedtuple
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import event  # noqa: E402
+import run  # noqa: E402
+from run import app, datagen, db  # noqa: E402
+from metrics import statement_shape  # noqa: E402
+
+Finding = namedtuple('Finding', ['endpoint', 'table', 'problem', 'detail', 'statement'])
+
+# (endpoint, table) -> why a full read or unindexed sort is expected there
+ALLOWED = {
+    ('*', 'forum_stats'): 'single counters row',
+    ('*', 'schema_migrations'): 'a handful of rows',
+    ('*', 'query_search'): 'FTS5 virtual table, searched through its own index',
+    ('queries.search', 'sort'): 'ranked by relevance, computed per match',
+    ('queries.responses_my', 'sort'): "SQLite median orders one faculty member's response times",
+    ('queries.feed_with_responses', 'sort'): "one page's responses, best first within each query",
+    ('attachments.list', 'sort'): "one query's attachments, merged from its own and its responses'",
+    ('queries.admin_users', 'users'): 'lists every user',
+    ('admin.users', 'users'): 'lists every user',
+    ('admin.export_ndjson', 'queries'): 'full export',
+    ('admin.export_ndjson', 'responses'): 'full export',
+    ('admin.export_ndjson', 'users'): 'full export',
+    ('admin.export_csv_gzip', 'responses'): 'full export',
+}
+
+SKIP = re.compile(r'^\s*(INSERT|PRAGMA|CREATE|ALTER|DROP|SAVEPOINT|RELEASE|ROLLBACK|BEGIN|COMMIT|SET|SHOW)\b', re.I)
+SQLITE_SCAN = re.compile(r'^SCAN (\w+)(?: AS \w+)?$')
+SQLITE_SORT = re.compile(r'USE TEMP B-TREE FOR (ORDER BY|GROUP BY|DISTINCT|RIGHT PART OF ORDER BY|LAST TERM OF ORDER BY)')
+
+
+def allowed(endpoint, table):
+    return (endpoint, table) in ALLOWED or ('*', table) in ALLOWED
+
+
+def sqlite_findings(connection, statement, parameters):
+    rows = connection.exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters).fetchall()
+    for row in rows:
+        detail = row[-1]
+        scan = SQLITE_SCAN.match(detail)
+        if scan and scan.group(1) not in ('CONSTANT',):
+            yield scan.group(1), 'full scan', detail
+        elif SQLITE_SORT.search(detail):
+            yield 'sort', 'unindexed sort', detail
+
+
+def _plan_nodes(node):
+    yield node
+    for child in node.get('Plans', []):
+        yield from _plan_nodes(child)
+
+
+def postgresql_findings(connection, statement, parameters):
+    transaction = connection.begin()
+    try:
+        connection.exec_driver_sql('SET LOCAL enable_seqscan = off')
+        connection.exec_driver_sql('SET LOCAL enable_sort = off')
+        plan = connection.exec_driver_sql('EXPLAIN (FORMAT JSON) ' + statement, parameters).scalar()
+    finally:
+        transaction.rollback()
+    for node in _plan_nodes(plan[0]['Plan']):
+        if node['Node Type'] == 'Seq Scan':
+            yield node.get('Relation Name'), 'full scan', f"Seq Scan on {node.get('Relation Name')}"
+        elif node['Node Type'] in ('Sort', 'Incremental Sort'):
+            yield 'sort', 'unindexed sort', f"Sort by {', '.join(node.get('Sort Key', []))}"
+
+
+def capture(ctx, endpoint, engine):
+    statements = []
+
+    def listener(conn, cursor, statement, parameters, context, executemany):
+        if ctx.counting and not executemany and not SKIP.match(statement):
+            statements.append((statement, parameters))
+
+    path, kwargs = endpoint.prepare(ctx, 0)
+    event.listen(engine, 'before_cursor_execute', listener)
+    ctx.counting = True
+    try:
+        status = ctx.client.open(path, method=endpoint.method, **kwargs).status_code
+    finally:
+        ctx.counting = False
+        event.remove(engine, 'before_cursor_execute', listener)
+    return status, statements
+
+
+def check(size, import_rows):
+    with app.app_context():
+        datagen.generate(run.scaled_spec(size, argparse.Namespace(responses_per_query=1.5, seed=7)))
+        query_ids = [row[0] for row in db.session.query(run.Query.id).order_by(run.Query.id)]
+        engine = db.engine
+    explain = postgresql_findings if engine.dialect.name == 'postgresql' else sqlite_findings
+
+    ctx = run.Context(app.test_client(), run_id=f'explain{size}')
+    ctx.faculty = max(5, size // 50)
+    ctx.query_ids = query_ids[::max(1, len(query_ids) // 50)]
+
+    findings, seen, explained = [], set(), 0
+    for endpoint in run.endpoints(ctx, import_rows):
+        status, statements = capture(ctx, endpoint, engine)
+        if status >= 500:
+            print(f"⚠️  {endpoint.name}: HTTP {status}, plans not checked")
+            continue
+        for statement, parameters in statements:
+            shape = statement_shape(statement)
+            if (endpoint.name, shape) in seen:
+                continue
+            seen.add((endpoint.name, shape))
+            explained += 1
+            with engine.connect() as connection:
+                for table, problem, detail in explain(connection, statement, parameters):
+                    if not allowed(endpoint.name, table):
+                        findings.append(Finding(endpoint.name, table, problem, detail, statement))
+    return explained, findings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--size', type=int, default=2000, help='queries in the seeded forum')
+    parser.add_argument('--import-rows', type=int, default=5)
+    parser.add_argument('--hash-method', default='pbkdf2:sha256:1000',
+                        help='PASSWORD_HASH_METHOD for seeding and logins (plans do not depend on it)')
+    args = parser.parse_args()
+    app.config['PASSWORD_HASH_METHOD'] = args.hash_method
+    app.config['RESPONSE_CACHE_SIZE'] = 0
+
+    explained, findings = check(args.size, args.import_rows)
+    for f in findings:
+        print(f"❌ {f.endpoint}: {f.problem} ({f.detail})\n     {' '.join(f.statement.split())[:300]}")
+    print(f"{'❌' if findings else '✅'} {explained} statements explained, {len(findings)} plan problems")
+    sys.exit(1 if findings else 0)
+
+
+if __name__ == '__main__':
+    main()
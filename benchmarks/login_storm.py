@@ -0,0 +1,100 @@
+"""Read latency during a login storm, with and without the hashing pool.
+
+    python benchmarks/login_storm.py --storm-threads 8 --reads 200
+
+Runs the same storm twice against a throwaway SQLite database: once hashing
+inline (PASSWORD_POOL_SIZE=0) and once on the process pool, and prints the
+latency of GET /api/queries/<id> measured while the storm is running.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db'))
+
+from app import create_app  # noqa: E402
+from models import db, User, Query  # noqa: E402
+import passwords  # noqa: E402
+import migrations  # noqa: E402
+
+app = create_app()
+
+
+def seed(num_queries):
+    with app.app_context():
+        db.drop_all()
+        migrations.upgrade()
+        student = User(username='storm', role='student', active=True,
+                       password_hash=passwords.PasswordHasher(pool_size=0).hash('secret'))
+        db.session.add(student)
+        db.session.flush()
+        db.session.add_all([
+            Query(title=f'Claim {i}', description='lorem ipsum ' * 20, student_id=student.id)
+            for i in range(num_queries)
+        ])
+        db.session.commit()
+
+
+def percentile(samples, pct):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * pct / 100))]
+
+
+def run(pool_size, storm_threads, reads, num_queries):
+    app.config['PASSWORD_POOL_SIZE'] = pool_size
+    app.extensions.pop('password_hasher', None)
+    stop = threading.Event()
+    logins = [0]
+
+    def storm():
+        client = app.test_client()
+        while not stop.is_set():
+            client.post('/api/auth/login', json={'username': 'storm', 'password': 'secret', 'role': 'student'})
+            logins[0] += 1
+
+    workers = [threading.Thread(target=storm, daemon=True) for _ in range(storm_threads)]
+    for w in workers:
+        w.start()
+    time.sleep(0.5)
+
+    client = app.test_client()
+    samples = []
+    for i in range(reads):
+        start = time.perf_counter()
+        client.get(f'/api/queries/{i % num_queries + 1}')
+        samples.append((time.perf_counter() - start) * 1000)
+
+    stop.set()
+    for w in workers:
+        w.join()
+    return {
+        'pool_size': pool_size,
+        'logins': logins[0],
+        'read_p50_ms': round(statistics.median(samples), 3),
+        'read_p95_ms': round(percentile(samples, 95), 3),
+        'read_p99_ms': round(percentile(samples, 99), 3),
+        'pool': passwords.get_hasher(app).snapshot(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--storm-threads', type=int, default=8)
+    parser.add_argument('--reads', type=int, default=200)
+    parser.add_argument('--queries', type=int, default=100)
+    parser.add_argument('--pool-size', type=int, default=passwords.DEFAULT_POOL_SIZE)
+    args = parser.parse_args()
+
+    seed(args.queries)
+    results = [run(size, args.storm_threads, args.reads, args.queries) for size in (0, args.pool_size)]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,427 @@
+"""Endpoint benchmark suite.
+
+    python benchmarks/run.py --sizes 1000,10000 --iterations 30
+    python benchmarks/run.py --baseline benchmarks/results/<earlier>.json
+
+For each dataset size a synthetic forum is generated (see datagen.py) and
+every route of the auth, query, admin and attachment blueprints is driven
+through the Flask test client. Each endpoint reports p50/p95/p99 latency,
+SQL statements per request and payload size. Results are written as JSON under
+benchmarks/results/; with --baseline the run is diffed against an earlier
+file and the exit status is 1 if anything regressed.
+
+Read endpoints run first, then writes, then deletes; every write picks a
+fresh target outside the timed window so iterations never collide. The
+response cache is disabled unless --cache is given, so reads measure the
+database work rather than cache hits.
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter, namedtuple
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db'))
+
+from sqlalchemy import event, select  # noqa: E402
+from app import create_app  # noqa: E402
+from models import db, User, Query, Response, TriageItem, Job  # noqa: E402
+import datagen  # noqa: E402
+import identity  # noqa: E402
+
+# Endpoint cost, not admission control: every iteration must reach the view.
+# Jobs run inline so their work is timed and never races the next request,
+# and no recovery sweep runs statements behind the timed ones. The URL is
+# passed on because config.py may have been imported (by tests) before the
+# default above was set.
+app = create_app({'SQLALCHEMY_DATABASE_URI': os.environ['DATABASE_URL'],
+                  'RATE_LIMIT_ENABLED': False, 'JOB_WORKERS': 0, 'JOB_SWEEP_SECONDS': 0,
+                  'VOTE_FLUSH_SECONDS': 0, 'ATTACHMENT_DIR': tempfile.mkdtemp(prefix='bench-attachments-')})
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+
+# prepare(ctx, i) runs untimed and returns (path, request kwargs)
+Endpoint = namedtuple('Endpoint', ['name', 'method', 'role', 'prepare'])
+
+
+def percentile(samples, pct):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * pct / 100))]
+
+
+class Context:
+    def __init__(self, client, run_id):
+        self.client = client
+        self.run_id = run_id
+        self.tokens = {}
+        self.used = set()
+        self.counting = False
+        self.statements = 0
+
+    def token(self, username, role):
+        if username not in self.tokens:
+            resp = self.client.post('/api/auth/login', json={
+                'username': username, 'password': datagen.PASSWORD, 'role': role})
+            self.tokens[username] = resp.get_json()['token']
+        return self.tokens[username]
+
+    def auth(self, username, role):
+        return {'Authorization': 'Bearer ' + self.token(username, role)}
+
+    # Newest row id matching the filters that no earlier iteration touched
+    def fresh(self, column, *filters):
+        with app.app_context():
+            stmt = db.session.query(column).filter(*filters)
+            used = [key for kind, key in self.used if kind == str(column)]
+            if used:
+                stmt = stmt.filter(column.notin_(used))
+            row = stmt.order_by(column.desc()).first()
+        if row is None:
+            raise RuntimeError(f'Dataset ran out of rows for {column}')
+        self.used.add((str(column), row[0]))
+        return row[0]
+
+    # A query of student0's, for the author-only attachment endpoints
+    @property
+    def own_query(self):
+        if not hasattr(self, '_own_query'):
+            with app.app_context():
+                self._own_query = db.session.query(Query.id).join(User, Query.student_id == User.id) \
+                    .filter(User.username == 'student0').order_by(Query.id).first()[0]
+        return self._own_query
+
+    def fresh_student(self):
+        # Leave the first students alone: their tokens drive the read endpoints
+        return self.fresh(User.id, User.role == 'student', User.username.notin_(['student0', 'student1']))
+
+
+def import_csv(ctx, i, rows):
+    lines = ['username,password,role']
+    lines += [f'imp_{ctx.run_id}_{i}_{n},{datagen.PASSWORD},student' for n in range(rows)]
+    return io.BytesIO('\n'.join(lines).encode())
+
+
+def release_claimed(ctx, i):
+    # Claim one query untimed so the release has something to release
+    headers = ctx.auth(f'faculty{i % ctx.faculty}', 'faculty')
+    resp = ctx.client.post('/api/queries/triage/claim', headers=headers)
+    return f"/api/queries/triage/{resp.get_json()['query']['id']}/release", {'headers': headers}
+
+
+def withdraw_vote(ctx, i):
+    # Vote untimed so there is a vote to withdraw
+    path = f'/api/queries/responses/{ctx.fresh(Response.id)}/vote'
+    headers = ctx.auth('student0', 'student')
+    ctx.client.put(path, headers=headers, json={'helpful': True})
+    return path, {'headers': headers}
+
+
+ATTACHMENT_BYTES = 256 * 1024
+
+
+def attachment_upload(ctx, i):
+    # A distinct image each time, so every upload stores a new blob
+    return f'/api/attachments/queries/{ctx.own_query}', {
+        'headers': dict(ctx.auth('student0', 'student'), **{'X-Filename': f'evidence-{i}.png'}),
+        'data': os.urandom(ATTACHMENT_BYTES), 'content_type': 'image/png'}
+
+
+def new_attachment(ctx, i):
+    # Uploaded untimed for the endpoints that need one
+    path, kwargs = attachment_upload(ctx, f'seed-{i}')
+    return ctx.client.post(path, **kwargs).get_json()['id']
+
+
+def attachment_list(ctx, i):
+    new_attachment(ctx, i)
+    return f'/api/attachments/queries/{ctx.own_query}', {}
+
+
+def new_job(status):
+    # An empty moderation job in the given state, created untimed
+    with app.app_context():
+        job = Job(kind='moderate', params='{}', status=status, max_attempts=1)
+        db.session.add(job)
+        db.session.commit()
+        return job.id
+
+
+def pending_query(ctx):
+    # Unanswered and not leased to another faculty member
+    claimed = select(TriageItem.query_id).where(TriageItem.claimed_by.isnot(None))
+    return ctx.fresh(Query.id, Query.answered.is_(False), Query.id.notin_(claimed))
+
+
+def endpoints(ctx, import_rows):
+    student = lambda: ctx.auth('student0', 'student')  # noqa: E731
+    faculty = lambda: ctx.auth('faculty0', 'faculty')  # noqa: E731
+    admin = lambda: ctx.auth('admin0', 'admin')  # noqa: E731
+
+    def any_query(ctx, i):
+        return ctx.query_ids[i % len(ctx.query_ids)]
+
+    return [
+        # auth_routes
+        Endpoint('auth.login', 'POST', 'student', lambda ctx, i: (
+            '/api/auth/login', {'json': {'username': 'student1', 'password': datagen.PASSWORD,
+                                         'role': 'student'}})),
+        Endpoint('auth.profile', 'GET', 'student', lambda ctx, i: (
+            '/api/auth/profile', {'headers': student()})),
+        # query_routes reads
+        Endpoint('queries.feed', 'GET', None, lambda ctx, i: ('/api/queries/', {})),
+        Endpoint('queries.feed_with_responses', 'GET', None, lambda ctx, i: (
+            '/api/queries/?include=responses', {})),
+        Endpoint('queries.feed_titles', 'GET', None, lambda ctx, i: (
+            '/api/queries/?fields=id,title,created_at', {})),
+        Endpoint('queries.feed_unanswered', 'GET', None, lambda ctx, i: (
+            '/api/queries/?answered=false', {})),
+        Endpoint('queries.feed_activity', 'GET', None, lambda ctx, i: (
+            '/api/queries/?sort=activity', {})),
+        Endpoint('queries.search', 'GET', None, lambda ctx, i: (
+            '/api/queries/search?q=vaccine+evidence', {})),
+        Endpoint('queries.changes', 'GET', None, lambda ctx, i: ('/api/queries/changes?since=0', {})),
+        Endpoint('queries.detail', 'GET', None, lambda ctx, i: (
+            f'/api/queries/{any_query(ctx, i)}', {})),
+        Endpoint('queries.my', 'GET', 'student', lambda ctx, i: ('/api/queries/my', {'headers': student()})),
+        Endpoint('queries.responses_my', 'GET', 'faculty', lambda ctx, i: (
+            '/api/queries/responses/my', {'headers': faculty()})),
+        Endpoint('queries.triage', 'GET', 'faculty', lambda ctx, i: (
+            '/api/queries/triage', {'headers': faculty()})),
+        Endpoint('queries.admin_queries', 'GET', 'admin', lambda ctx, i: (
+            '/api/queries/admin/queries', {'headers': admin()})),
+        Endpoint('queries.admin_stats', 'GET', 'admin', lambda ctx, i: (
+            '/api/queries/admin/stats', {'headers': admin()})),
+        Endpoint('queries.admin_users', 'GET', 'admin', lambda ctx, i: (
+            '/api/queries/admin/users', {'headers': admin()})),
+        # admin_routes reads
+        Endpoint('admin.overview', 'GET', 'admin', lambda ctx, i: ('/api/admin/overview', {'headers': admin()})),
+        Endpoint('admin.users', 'GET', 'admin', lambda ctx, i: ('/api/admin/users', {'headers': admin()})),
+        Endpoint('admin.password_pool', 'GET', 'admin', lambda ctx, i: (
+            '/api/admin/password_pool', {'headers': admin()})),
+        Endpoint('admin.export_ndjson', 'GET', 'admin', lambda ctx, i: ('/api/admin/export', {'headers': admin()})),
+        Endpoint('admin.export_csv_gzip', 'GET', 'admin', lambda ctx, i: (
+            '/api/admin/export?format=csv&entity=responses&gzip=true', {'headers': admin()})),
+        Endpoint('admin.response_times', 'GET', 'admin', lambda ctx, i: (
+            '/api/admin/analytics/response-times?granularity=hour', {'headers': admin()})),
+        Endpoint('admin.response_times_summary', 'GET', 'admin', lambda ctx, i: (
+            '/api/admin/analytics/response-times/summary', {'headers': admin()})),
+        # attachment_routes reads
+        Endpoint('attachments.list', 'GET', None, attachment_list),
+        Endpoint('attachments.download', 'GET', None, lambda ctx, i: (
+            f'/api/attachments/{new_attachment(ctx, i)}', {})),
+        Endpoint('admin.job', 'GET', 'admin', lambda ctx, i: (
+            f"/api/admin/jobs/{new_job('succeeded')}", {'headers': admin()})),
+        Endpoint('admin.jobs', 'GET', 'admin', lambda ctx, i: ('/api/admin/jobs', {'headers': admin()})),
+        # writes
+        Endpoint('auth.register', 'POST', None, lambda ctx, i: (
+            '/api/auth/register', {'json': {'username': f'reg_{ctx.run_id}_{i}',
+                                            'password': datagen.PASSWORD, 'role': 'student'}})),
+        Endpoint('queries.new', 'POST', 'student', lambda ctx, i: (
+            '/api/queries/new', {'headers': student(), 'json': {
+                'title': f'Is claim {ctx.run_id}-{i} about the new vaccine study true',
+                'description': f'Seen on social media, reference {ctx.run_id}-{i}. ' * 5}})),
+        Endpoint('queries.respond', 'POST', 'faculty', lambda ctx, i: (
+            f'/api/queries/respond/{pending_query(ctx)}',
+            {'headers': faculty(), 'json': {'content': 'Checked against the original source: ' * 8}})),
+        Endpoint('queries.vote', 'PUT', 'student', lambda ctx, i: (
+            f'/api/queries/responses/{ctx.fresh(Response.id)}/vote',
+            {'headers': student(), 'json': {'helpful': True}})),
+        Endpoint('attachments.upload', 'POST', 'student', attachment_upload),
+        Endpoint('queries.triage_claim', 'POST', 'faculty', lambda ctx, i: (
+            '/api/queries/triage/claim', {'headers': ctx.auth(f'faculty{(i + 1) % ctx.faculty}', 'faculty')})),
+        Endpoint('queries.triage_release', 'POST', 'faculty', release_claimed),
+        Endpoint('queries.triage_priority', 'PATCH', 'admin', lambda ctx, i: (
+            f'/api/queries/triage/{ctx.fresh(TriageItem.query_id)}/priority',
+            {'headers': admin(), 'json': {'priority': i % 5}})),
+        Endpoint('queries.admin_add_user', 'POST', 'admin', lambda ctx, i: (
+            '/api/queries/admin/add_user', {'headers': admin(), 'json': {
+                'username': f'add_{ctx.run_id}_{i}', 'password': datagen.PASSWORD, 'role': 'faculty'}})),
+        Endpoint(f'queries.admin_import_users[{import_rows}]', 'POST', 'admin', lambda ctx, i: (
+            '/api/queries/admin/import_users?format=csv',
+            {'headers': admin(), 'data': import_csv(ctx, i, import_rows), 'content_type': 'text/csv'})),
+        Endpoint('queries.admin_suspend_user', 'PATCH', 'admin', lambda ctx, i: (
+            f'/api/queries/admin/suspend_user/{ctx.fresh_student()}', {'headers': admin()})),
+        Endpoint('queries.admin_unsuspend_user', 'PATCH', 'admin', lambda ctx, i: (
+            f'/api/queries/admin/unsuspend_user/{ctx.fresh_student()}', {'headers': admin()})),
+        Endpoint('admin.user_role', 'PUT', 'admin', lambda ctx, i: (
+            f'/api/admin/user/{ctx.fresh_student()}/role', {'headers': admin(), 'json': {'role': 'faculty'}})),
+        Endpoint('admin.job_cancel', 'POST', 'admin', lambda ctx, i: (
+            f"/api/admin/jobs/{new_job('queued')}/cancel", {'headers': admin()})),
+        Endpoint('admin.job_retry', 'POST', 'admin', lambda ctx, i: (
+            f"/api/admin/jobs/{new_job('cancelled')}/retry", {'headers': admin()})),
+        # deletes
+        Endpoint('queries.unvote', 'DELETE', 'student', withdraw_vote),
+        Endpoint('attachments.delete', 'DELETE', 'student', lambda ctx, i: (
+            f'/api/attachments/{new_attachment(ctx, i)}', {'headers': student()})),
+        Endpoint('queries.admin_delete_response', 'DELETE', 'admin', lambda ctx, i: (
+            f'/api/queries/admin/delete_response/{ctx.fresh(Response.id)}', {'headers': admin()})),
+        Endpoint('queries.admin_delete_query', 'DELETE', 'admin', lambda ctx, i: (
+            f'/api/queries/admin/delete_query/{ctx.fresh(Query.id)}', {'headers': admin()})),
+        Endpoint('queries.admin_moderate', 'POST', 'admin', lambda ctx, i: (
+            '/api/queries/admin/moderate', {'headers': admin(), 'json': {
+                'queries': [ctx.fresh(Query.id)], 'responses': [ctx.fresh(Response.id)]}})),
+        Endpoint('queries.admin_delete_user', 'DELETE', 'admin', lambda ctx, i: (
+            f'/api/queries/admin/delete_user/{ctx.fresh_student()}', {'headers': admin()})),
+        Endpoint('admin.user_delete', 'DELETE', 'admin', lambda ctx, i: (
+            f'/api/admin/user/{ctx.fresh_student()}', {'headers': admin()})),
+    ]
+
+
+def measure(ctx, endpoint, iterations, warmup):
+    latencies, statements, sizes, statuses = [], [], [], Counter()
+    for i in range(warmup + iterations):
+        path, kwargs = endpoint.prepare(ctx, i)
+        ctx.statements = 0
+        ctx.counting = True
+        started = time.perf_counter()
+        resp = ctx.client.open(path, method=endpoint.method, **kwargs)
+        body = resp.get_data()
+        elapsed = time.perf_counter() - started
+        ctx.counting = False
+        if i < warmup:
+            continue
+        latencies.append(elapsed * 1000)
+        statements.append(ctx.statements)
+        sizes.append(len(body))
+        statuses[str(resp.status_code)] += 1
+    return {
+        'method': endpoint.method,
+        'role': endpoint.role,
+        'status': dict(statuses),
+        'p50_ms': round(percentile(latencies, 50), 3),
+        'p95_ms': round(percentile(latencies, 95), 3),
+        'p99_ms': round(percentile(latencies, 99), 3),
+        'sql_p50': percentile(statements, 50),
+        'sql_max': max(statements),
+        'bytes_p50': percentile(sizes, 50),
+    }
+
+
+def scaled_spec(size, args):
+    return datagen.Spec(students=max(10, size // 5), faculty=max(5, size // 50), admins=2, queries=size,
+                        responses_per_query=args.responses_per_query, seed=args.seed)
+
+
+def run_dataset(size, args):
+    app.config['RESPONSE_CACHE_SIZE'] = app.config.get('RESPONSE_CACHE_SIZE') if args.cache else 0
+    for name in ('response_cache', 'password_hasher'):
+        app.extensions.pop(name, None)
+    identity.clear()
+
+    spec = scaled_spec(size, args)
+    started = time.perf_counter()
+    with app.app_context():
+        counts = datagen.generate(spec)
+        query_ids = [row[0] for row in db.session.query(Query.id).order_by(Query.id)]
+        engine = db.engine
+    print(f"  seeded {counts['queries']} queries / {counts['responses']} responses "
+          f"in {time.perf_counter() - started:.1f}s")
+
+    ctx = Context(app.test_client(), run_id=f'{size}')
+    ctx.faculty = spec.faculty
+    ctx.query_ids = query_ids[::max(1, len(query_ids) // 50)]
+
+    def count_statement(*_):
+        if ctx.counting:
+            ctx.statements += 1
+
+    event.listen(engine, 'before_cursor_execute', count_statement)
+    results = {}
+    try:
+        for endpoint in endpoints(ctx, args.import_rows):
+            results[endpoint.name] = measure(ctx, endpoint, args.iterations, args.warmup)
+            r = results[endpoint.name]
+            print(f"  {endpoint.name:<40} p50 {r['p50_ms']:>8.2f}ms  p95 {r['p95_ms']:>8.2f}ms  "
+                  f"sql {r['sql_p50']:>3}  {r['bytes_p50']:>8}B  {r['status']}")
+    finally:
+        event.remove(engine, 'before_cursor_execute', count_statement)
+    return {'size': size, 'spec': spec.as_dict(), 'counts': {k: v for k, v in counts.items() if k != 'query_ids'},
+            'endpoints': results}
+
+
+# Prints every endpoint that got slower or chattier; returns the count
+def compare(current, baseline, tolerance):
+    regressions = 0
+    previous = {d['size']: d for d in baseline['datasets']}
+    for dataset in current['datasets']:
+        before = previous.get(dataset['size'])
+        if before is None:
+            continue
+        for name, now in dataset['endpoints'].items():
+            old = before['endpoints'].get(name)
+            if old is None:
+                continue
+            notes = []
+            # Ignore sub-millisecond noise on fast endpoints
+            if now['p95_ms'] > old['p95_ms'] * (1 + tolerance) and now['p95_ms'] - old['p95_ms'] > 1:
+                notes.append(f"p95 {old['p95_ms']:.2f} -> {now['p95_ms']:.2f}ms")
+            if now['sql_max'] > old['sql_max']:
+                notes.append(f"sql {old['sql_max']} -> {now['sql_max']}")
+            if notes:
+                regressions += 1
+                print(f"⚠️  [{dataset['size']}] {name}: " + ', '.join(notes))
+    return regressions
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(RESULTS_DIR)).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default='1000,10000', help='comma separated query counts')
+    parser.add_argument('--iterations', type=int, default=30)
+    parser.add_argument('--warmup', type=int, default=2)
+    parser.add_argument('--responses-per-query', type=float, default=1.5)
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--import-rows', type=int, default=100)
+    parser.add_argument('--hash-method', help='override PASSWORD_HASH_METHOD, e.g. pbkdf2:sha256:1000')
+    parser.add_argument('--cache', action='store_true', help='keep the response cache enabled')
+    parser.add_argument('--output', help='result file (default benchmarks/results/<timestamp>.json)')
+    parser.add_argument('--baseline', help='earlier result file to diff against')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed p95 slowdown (0.2 = 20%%)')
+    args = parser.parse_args()
+
+    if args.hash_method:
+        app.config['PASSWORD_HASH_METHOD'] = args.hash_method
+
+    started = datetime.utcnow()
+    results = {
+        'started_at': started.isoformat(timespec='seconds'),
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'database': app.config['SQLALCHEMY_DATABASE_URI'].split(':', 1)[0],
+        'iterations': args.iterations,
+        'cache': args.cache,
+        'datasets': [],
+    }
+    for size in (int(s) for s in args.sizes.split(',') if s.strip()):
+        print(f"📊 Dataset: {size} queries")
+        results['datasets'].append(run_dataset(size, args))
+
+    output = args.output or os.path.join(RESULTS_DIR, started.strftime('%Y%m%dT%H%M%S') + '.json')
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"✅ Results written to {output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        print(f"{regressions} regression(s) against {args.baseline}")
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,167 @@
+import csv
+import io
+import json
+from sqlalchemy import insert
+from models import db, User
+import identity
+import passwords
+import stats
+
+# ------------------------------
+# Streaming bulk user import (CSV / NDJSON)
+# ------------------------------
+# Rows are read from the upload one at a time and handled in batches of
+# BATCH_SIZE: one SELECT checks the whole batch for existing usernames,
+# passwords are hashed in parallel on the hashing pool, and the batch is
+# written with COPY (PostgreSQL + psycopg2) or a single executemany insert.
+# Each batch commits on its own, so a bad row never loses the good ones.
+#
+# CSV needs a header row: username,password,role[,active]
+# NDJSON is one {"username", "password", "role", "active"?} object per line.
+
+BATCH_SIZE = 1000
+VALID_ROLES = ('student', 'faculty', 'admin')
+FORMATS = ('csv', 'ndjson')
+
+
+def detect_format(content_type, explicit=None):
+    if explicit:
+        return explicit.lower()
+    content_type = (content_type or '').lower()
+    if 'ndjson' in content_type or 'jsonl' in content_type or 'json' in content_type:
+        return 'ndjson'
+    return 'csv'
+
+
+def iter_rows(text_stream, fmt):
+    # Yields (line_number, dict or None, parse_error)
+    if fmt == 'csv':
+        reader = csv.DictReader(text_stream)
+        for row in reader:
+            yield reader.line_num, row, None
+    else:
+        for line_number, line in enumerate(text_stream, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                yield line_number, None, f'Invalid JSON: {e}'
+                continue
+            if not isinstance(row, dict):
+                yield line_number, None, 'Each line must be a JSON object'
+                continue
+            yield line_number, row, None
+
+
+def parse_active(value):
+    if value is None or value == '':
+        return True
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() not in ('false', '0', 'no')
+
+
+def validate(row):
+    # NDJSON values can be any JSON type
+    for field in ('username', 'password', 'role'):
+        if row.get(field) is not None and not isinstance(row[field], str):
+            return None, f'{field.capitalize()} must be a string'
+    username = (row.get('username') or '').strip()
+    password = row.get('password') or ''
+    role = (row.get('role') or '').lower().strip()
+    if not username or not password or not role:
+        return None, 'Username, password, and role are required'
+    if len(username) > 50:
+        return None, 'Username is longer than 50 characters'
+    if role not in VALID_ROLES:
+        return None, 'Invalid role. Must be student, faculty, or admin'
+    return {'username': username, 'password': password, 'role': role,
+            'active': parse_active(row.get('active'))}, None
+
+
+def copy_users(records):
+    dbapi_conn = db.session.connection().connection.dbapi_connection
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for r in records:
+        writer.writerow([r['username'], r['password_hash'], r['role'], 't' if r['active'] else 'f'])
+    buffer.seek(0)
+    with dbapi_conn.cursor() as cursor:
+        cursor.copy_expert(
+            "COPY users (username, password_hash, role, active) FROM STDIN WITH (FORMAT csv)", buffer
+        )
+
+
+def insert_batch(batch, hasher, errors):
+    usernames = [r['username'] for _, r in batch]
+    taken = {
+        name for (name,) in
+        db.session.query(User.username).filter(User.username.in_(usernames))
+    }
+    fresh = []
+    for line_number, record in batch:
+        if record['username'] in taken:
+            errors.append({'line': line_number, 'username': record['username'],
+                           'error': 'Username already exists'})
+        else:
+            fresh.append(record)
+    if not fresh:
+        return 0
+
+    for record, password_hash in zip(fresh, hasher.hash_many([r['password'] for r in fresh])):
+        record['password_hash'] = password_hash
+
+    columns = [{k: r[k] for k in ('username', 'password_hash', 'role', 'active')} for r in fresh]
+    dialect = db.session.get_bind().dialect
+    if dialect.name == 'postgresql' and dialect.driver == 'psycopg2':
+        copy_users(columns)
+    else:
+        db.session.execute(insert(User), columns)
+
+    role_counts = {}
+    for r in fresh:
+        column = stats.ROLE_COLUMNS[r['role']]
+        role_counts[column] = role_counts.get(column, 0) + 1
+    stats.bump(**role_counts)
+    db.session.commit()
+
+    for r in fresh:
+        identity.restore(r['username'])
+    return len(fresh)
+
+
+# Returns {'created', 'failed', 'errors': [{'line', 'username', 'error'}]}
+def import_users(text_stream, fmt, hasher=None, batch_size=BATCH_SIZE):
+    if fmt not in FORMATS:
+        raise ValueError(f"Unsupported format '{fmt}'. Use csv or ndjson")
+    hasher = hasher or passwords.get_hasher()
+
+    created = 0
+    errors = []
+    seen = set()
+    batch = []
+    for line_number, row, parse_error in iter_rows(text_stream, fmt):
+        if parse_error:
+            errors.append({'line': line_number, 'username': None, 'error': parse_error})
+            continue
+        record, error = validate(row)
+        if error:
+            errors.append({'line': line_number, 'username': row.get('username'), 'error': error})
+            continue
+        if record['username'] in seen:
+            errors.append({'line': line_number, 'username': record['username'],
+                           'error': 'Duplicate username in upload'})
+            continue
+        seen.add(record['username'])
+        batch.append((line_number, record))
+
+        if len(batch) >= batch_size:
+            created += insert_batch(batch, hasher, errors)
+            batch = []
+
+    if batch:
+        created += insert_batch(batch, hasher, errors)
+
+    errors.sort(key=lambda e: e['line'])
+    return {'created': created, 'failed': len(errors), 'errors': errors}
@@ -0,0 +1,97 @@
+from datetime import datetime, timedelta
+from sqlalchemy import delete, func, insert, text
+from sqlalchemy.orm import selectinload
+from models import db, Query, Response, ChangeLog
+from serializers import serialize_query, serialize_response
+
+# ------------------------------
+# Change log for delta sync
+# ------------------------------
+# Every write route appends (entity, id, upsert|delete) rows inside its own
+# transaction. ChangeLog.id is the sync cursor: a client that holds state
+# asks for everything after its cursor and gets back the current version of
+# each touched row plus tombstones for deleted ones.
+#
+# On PostgreSQL writers take a transaction-scoped advisory lock before
+# appending, so ids become visible in commit order and a reader can never
+# skip past a row that commits later with a smaller id. SQLite already
+# serialises writers.
+#
+# Ids only ever grow (AUTOINCREMENT on SQLite, a sequence on PostgreSQL) and
+# prune() keeps the newest row, so latest_cursor() never goes backwards. A
+# cursor past it comes from another database and is expired like one the
+# log was pruned past.
+
+DEFAULT_LIMIT = 500
+MAX_LIMIT = 2000
+LOG_LOCK_KEY = 72_410_011
+
+
+class CursorExpired(Exception):
+    pass
+
+
+def record(entity, entity_ids, op='upsert'):
+    entity_ids = list(entity_ids)
+    if not entity_ids:
+        return
+    if db.session.get_bind().dialect.name == 'postgresql':
+        db.session.execute(text('SELECT pg_advisory_xact_lock(:key)'), {'key': LOG_LOCK_KEY})
+    now = datetime.utcnow()
+    db.session.execute(insert(ChangeLog), [
+        {'entity': entity, 'entity_id': entity_id, 'op': op, 'created_at': now}
+        for entity_id in entity_ids
+    ])
+
+
+def latest_cursor():
+    return db.session.query(func.max(ChangeLog.id)).scalar() or 0
+
+
+def changes_since(since, limit=DEFAULT_LIMIT):
+    oldest, latest = db.session.query(func.min(ChangeLog.id), func.max(ChangeLog.id)).one()
+    if (oldest is not None and since < oldest - 1) or since > (latest or 0):
+        raise CursorExpired()
+
+    rows = db.session.query(ChangeLog.id, ChangeLog.entity, ChangeLog.entity_id, ChangeLog.op) \
+        .filter(ChangeLog.id > since).order_by(ChangeLog.id).limit(limit + 1).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    # Only the last operation per row matters within one page
+    final = {}
+    for _, entity, entity_id, op in rows:
+        final[(entity, entity_id)] = op
+
+    upserted = {'query': [], 'response': []}
+    deleted = {'query': [], 'response': []}
+    for (entity, entity_id), op in final.items():
+        (upserted if op == 'upsert' else deleted)[entity].append(entity_id)
+
+    queries = []
+    if upserted['query']:
+        queries = db.session.query(Query).options(selectinload(Query.responses)) \
+            .filter(Query.id.in_(upserted['query'])).order_by(Query.id).all()
+    responses = []
+    if upserted['response']:
+        responses = db.session.query(Response) \
+            .filter(Response.id.in_(upserted['response'])).order_by(Response.id).all()
+
+    # Rows missing here were deleted later; their tombstones are further on
+    return {
+        'cursor': rows[-1][0] if rows else since,
+        'has_more': has_more,
+        'queries': [serialize_query(q) for q in queries],
+        'responses': [dict(serialize_response(r), query_id=r.query_id) for r in responses],
+        'deleted': {'queries': sorted(deleted['query']), 'responses': sorted(deleted['response'])},
+    }
+
+
+# Drop log rows older than `days` (also exposed as `flask prune-changes`),
+# except the newest, which holds the current cursor
+def prune(days):
+    cutoff = datetime.utcnow() - timedelta(days=days)
+    result = db.session.execute(delete(ChangeLog).where(ChangeLog.created_at < cutoff,
+                                                        ChangeLog.id < latest_cursor()))
+    db.session.commit()
+    return result.rowcount
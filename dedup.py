@@ -0,0 +1,189 @@
+import hashlib
+import re
+import threading
+from sqlalchemy import func
+from models import db, ChangeLog, Query
+import changes
+
+# ------------------------------
+# Near-duplicate claim detection (MinHash + LSH)
+# ------------------------------
+# Every query's title + description is reduced to a MinHash signature of
+# NUM_PERM values, cut into BANDS bands. Two queries that share any band land
+# in the same bucket, so a lookup only touches a handful of candidates instead
+# of scanning the text of every query. Candidates are then filtered by the
+# estimated Jaccard similarity against the configured threshold.
+#
+# The index lives in each worker's memory. The worker that handles a write
+# updates it at once; every other worker catches up in get_index() before a
+# lookup by replaying the query rows of the change log (changes.py) past the
+# cursor it was built at. With nothing new that costs one max(id) on the log's
+# primary key; a cursor the log was pruned past (or that is ahead of the log,
+# e.g. after a restore) means a full rebuild.
+
+NUM_PERM = 64
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+SHINGLE_SIZE = 2
+
+DEFAULT_THRESHOLD = 0.6
+DEFAULT_MODE = 'warn'  # warn | block | off
+
+_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+
+
+def _permutations():
+    # Deterministic (a, b) pairs so signatures are stable across workers
+    perms = []
+    for i in range(NUM_PERM):
+        digest = hashlib.blake2b(f"perm-{i}".encode(), digest_size=16).digest()
+        a = int.from_bytes(digest[:8], 'big') % (_PRIME - 1) + 1
+        b = int.from_bytes(digest[8:], 'big') % _PRIME
+        perms.append((a, b))
+    return perms
+
+
+PERMUTATIONS = _permutations()
+
+
+def shingles(title, description):
+    words = re.findall(r'\w+', f"{title or ''} {description or ''}".lower())
+    if len(words) < SHINGLE_SIZE:
+        return set(words)
+    return {' '.join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)}
+
+
+def signature(shingle_set):
+    hashes = [
+        int.from_bytes(hashlib.blake2b(s.encode(), digest_size=8).digest(), 'big')
+        for s in shingle_set
+    ]
+    return tuple(
+        min(((a * h + b) % _PRIME) & _MAX_HASH for h in hashes)
+        for a, b in PERMUTATIONS
+    )
+
+
+def similarity(sig_a, sig_b):
+    return sum(1 for x, y in zip(sig_a, sig_b) if x == y) / NUM_PERM
+
+
+class DuplicateIndex:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.buckets = [dict() for _ in range(BANDS)]
+        self.entries = {}  # query_id -> (signature, title, answered)
+        self.built = False
+        self.cursor = 0  # change log id the index reflects
+        self.refresh_lock = threading.Lock()
+
+    def _bands(self, sig):
+        return [sig[i * ROWS:(i + 1) * ROWS] for i in range(BANDS)]
+
+    def add(self, query_id, title, description, answered=False):
+        shingle_set = shingles(title, description)
+        if not shingle_set:
+            return
+        sig = signature(shingle_set)
+        with self.lock:
+            self._remove(query_id)
+            self.entries[query_id] = (sig, title, answered)
+            for band, key in zip(self.buckets, self._bands(sig)):
+                band.setdefault(key, set()).add(query_id)
+
+    def remove(self, query_id):
+        with self.lock:
+            self._remove(query_id)
+
+    def _remove(self, query_id):
+        entry = self.entries.pop(query_id, None)
+        if entry is None:
+            return
+        for band, key in zip(self.buckets, self._bands(entry[0])):
+            bucket = band.get(key)
+            if bucket is not None:
+                bucket.discard(query_id)
+                if not bucket:
+                    del band[key]
+
+    def mark_answered(self, query_id, answered=True):
+        with self.lock:
+            entry = self.entries.get(query_id)
+            if entry is not None:
+                self.entries[query_id] = (entry[0], entry[1], answered)
+
+    # Returns likely duplicates, answered ones first, then most similar
+    def find(self, title, description, threshold=DEFAULT_THRESHOLD, limit=5):
+        shingle_set = shingles(title, description)
+        if not shingle_set:
+            return []
+        sig = signature(shingle_set)
+
+        with self.lock:
+            candidates = set()
+            for band, key in zip(self.buckets, self._bands(sig)):
+                candidates |= band.get(key, set())
+            matches = []
+            for query_id in candidates:
+                other_sig, other_title, answered = self.entries[query_id]
+                score = similarity(sig, other_sig)
+                if score >= threshold:
+                    matches.append({
+                        'query_id': query_id,
+                        'title': other_title,
+                        'answered': answered,
+                        'similarity': round(score, 3),
+                        'url': f'/api/queries/{query_id}',
+                    })
+
+        matches.sort(key=lambda m: (not m['answered'], -m['similarity'], m['query_id']))
+        return matches[:limit]
+
+    def build(self):
+        # Cursor first: writes racing the scan are replayed by refresh()
+        cursor = changes.latest_cursor()
+        rows = db.session.query(Query.id, Query.title, Query.description, Query.answered).yield_per(1000)
+        fresh = DuplicateIndex()
+        for query_id, title, description, answered in rows:
+            fresh.add(query_id, title, description, bool(answered))
+        with self.lock:
+            self.buckets, self.entries = fresh.buckets, fresh.entries
+            self.cursor = cursor
+            self.built = True
+
+    # Apply the queries other workers created, answered or deleted since the
+    # cursor; builds the index if it is not built or the cursor no longer fits
+    # the log
+    def refresh(self):
+        with self.refresh_lock:
+            if not self.built:
+                self.build()
+                return
+            latest = changes.latest_cursor()
+            if latest == self.cursor:
+                return
+            oldest = db.session.query(func.min(ChangeLog.id)).scalar()
+            if latest < self.cursor or (oldest is not None and self.cursor < oldest - 1):
+                self.build()
+                return
+            touched = {query_id for (query_id,) in db.session.query(ChangeLog.entity_id).filter(
+                ChangeLog.entity == 'query', ChangeLog.id > self.cursor, ChangeLog.id <= latest)}
+            if touched:
+                rows = db.session.query(Query.id, Query.title, Query.description, Query.answered) \
+                    .filter(Query.id.in_(touched)).all()
+                for query_id, title, description, answered in rows:
+                    self.add(query_id, title, description, bool(answered))
+                for query_id in touched - {row[0] for row in rows}:
+                    self.remove(query_id)
+            self.cursor = latest
+
+
+duplicate_index = DuplicateIndex()
+
+
+# Built on first use in each worker process (startup calls this too), then
+# brought up to date with the change log before every lookup
+def get_index():
+    duplicate_index.refresh()
+    return duplicate_index
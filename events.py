@@ -0,0 +1,196 @@
+import json
+import queue
+import threading
+from collections import deque
+from flask import current_app
+from itsdangerous import BadSignature, SignatureExpired, URLSafeTimedSerializer
+
+# ------------------------------
+# Server-Sent Events: in-process pub/sub with resumable history
+# ------------------------------
+# Write routes publish small events after they commit. Every event names its
+# audience (roles and/or user ids); each open /api/events stream only receives
+# events addressed to its user. Recent events are kept in a ring buffer so a
+# reconnecting client can resume from its Last-Event-ID.
+#
+# With EVENTS_BACKEND_URL=redis://... events are fanned out through Redis
+# pub/sub, so a response posted on one worker reaches streams held by others.
+#
+# EventSource cannot send an Authorization header, and a JWT in the URL ends
+# up in access logs. Clients instead POST /api/events/ticket with their token
+# and open the stream with ?ticket=: a signed (username, role) that only
+# opens event streams and expires after EVENTS_TICKET_SECONDS.
+#
+# disconnect() ends the open streams of suspended, deleted or re-roled users
+# on every worker (a 'session_revoked' event, then end of stream) instead of
+# leaving them subscribed until they reconnect.
+
+DEFAULT_HISTORY = 1000
+SUBSCRIBER_QUEUE_SIZE = 256
+HEARTBEAT_SECONDS = 15
+DEFAULT_TICKET_SECONDS = 30
+REVOKED = 'session_revoked'
+
+
+class InvalidTicket(Exception):
+    pass
+
+
+class Subscription:
+    def __init__(self, user_id, role):
+        self.user_id = user_id
+        self.role = role
+        self.queue = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+
+    def wants(self, event):
+        return self.role in event['roles'] or self.user_id in event['user_ids']
+
+
+class Broker:
+    def __init__(self, history=DEFAULT_HISTORY):
+        self.lock = threading.Lock()
+        self.history = deque(maxlen=history)
+        self.subscribers = set()
+        self.last_id = 0
+
+    def next_id(self):
+        with self.lock:
+            self.last_id += 1
+            return self.last_id
+
+    def dispatch(self, event):
+        with self.lock:
+            self.last_id = max(self.last_id, event['id'])
+            self.history.append(event)
+            subscribers = list(self.subscribers)
+        for sub in subscribers:
+            if sub.wants(event):
+                try:
+                    sub.queue.put_nowait(event)
+                except queue.Full:
+                    # A stalled client: drop it, it will resume via Last-Event-ID
+                    self.unsubscribe(sub)
+                    continue
+                if event['type'] == REVOKED:
+                    self.unsubscribe(sub)
+
+    def subscribe(self, user_id, role, last_event_id=None):
+        sub = Subscription(user_id, role)
+        with self.lock:
+            self.subscribers.add(sub)
+            history = list(self.history)
+        backlog = []
+        if last_event_id is not None:
+            if history and history[0]['id'] > last_event_id + 1:
+                backlog.append({'id': history[-1]['id'], 'type': 'resync', 'data': {}})
+            backlog += [e for e in history
+                        if e['id'] > last_event_id and e['type'] != REVOKED and sub.wants(e)]
+        return sub, backlog
+
+    def unsubscribe(self, sub):
+        with self.lock:
+            self.subscribers.discard(sub)
+        try:
+            sub.queue.put_nowait(None)
+        except queue.Full:
+            pass
+
+    def publish(self, event_type, data, roles=(), user_ids=()):
+        event = {'id': self.next_id(), 'type': event_type, 'data': data,
+                 'roles': list(roles), 'user_ids': list(user_ids)}
+        self.dispatch(event)
+
+
+class RedisBroker(Broker):
+    # Needs the optional `redis` package. Ids come from one shared counter and
+    # every worker (including the publisher) dispatches from the channel.
+    def __init__(self, url, history=DEFAULT_HISTORY, channel='forum-events'):
+        super().__init__(history)
+        import redis
+        self.client = redis.Redis.from_url(url)
+        self.channel = channel
+        self.pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        self.pubsub.subscribe(channel)
+        threading.Thread(target=self._listen, daemon=True).start()
+
+    def _listen(self):
+        for message in self.pubsub.listen():
+            try:
+                self.dispatch(json.loads(message['data']))
+            except (ValueError, KeyError):
+                continue
+
+    def publish(self, event_type, data, roles=(), user_ids=()):
+        event = {'id': self.client.incr(self.channel + ':id'), 'type': event_type, 'data': data,
+                 'roles': list(roles), 'user_ids': list(user_ids)}
+        self.client.publish(self.channel, json.dumps(event))
+
+
+def get_broker(app=None):
+    app = app or current_app
+    broker = app.extensions.get('events')
+    if broker is None:
+        url = app.config.get('EVENTS_BACKEND_URL')
+        history = app.config.get('EVENTS_HISTORY', DEFAULT_HISTORY)
+        broker = RedisBroker(url, history) if url else Broker(history)
+        app.extensions['events'] = broker
+    return broker
+
+
+def publish(event_type, data, roles=(), user_ids=()):
+    get_broker().publish(event_type, data, roles=roles, user_ids=user_ids)
+
+
+# Close these users' open streams, on every worker
+def disconnect(user_ids):
+    user_ids = sorted(set(user_ids))
+    if user_ids:
+        publish(REVOKED, {}, user_ids=user_ids)
+
+
+def _ticket_serializer():
+    return URLSafeTimedSerializer(current_app.config['JWT_SECRET_KEY'], salt='event-stream-ticket')
+
+
+def ticket_seconds():
+    return current_app.config.get('EVENTS_TICKET_SECONDS', DEFAULT_TICKET_SECONDS)
+
+
+def issue_ticket(username, role):
+    return _ticket_serializer().dumps({'sub': username, 'role': role})
+
+
+# The ticket's {'sub', 'role'}, shaped like a JWT payload for identity.py
+def redeem_ticket(ticket):
+    try:
+        payload = _ticket_serializer().loads(ticket, max_age=ticket_seconds())
+    except SignatureExpired:
+        raise InvalidTicket('Stream ticket expired. Request a new one.')
+    except BadSignature:
+        raise InvalidTicket('Invalid stream ticket')
+    if not isinstance(payload, dict) or not isinstance(payload.get('sub'), str):
+        raise InvalidTicket('Invalid stream ticket')
+    return payload
+
+
+def format_event(event):
+    payload = json.dumps(dict(event['data'], type=event['type']))
+    return f"id: {event['id']}\nevent: {event['type']}\ndata: {payload}\n\n"
+
+
+def stream(broker, sub, backlog):
+    try:
+        yield 'retry: 3000\n\n'
+        for event in backlog:
+            yield format_event(event)
+        while True:
+            try:
+                event = sub.queue.get(timeout=HEARTBEAT_SECONDS)
+            except queue.Empty:
+                yield ': keep-alive\n\n'
+                continue
+            if event is None:
+                break
+            yield format_event(event)
+    finally:
+        broker.unsubscribe(sub)
@@ -0,0 +1,142 @@
+import csv
+import io
+import json
+import zlib
+from datetime import datetime
+from sqlalchemy import select
+from models import db, Query, Response, User
+from feed import parse_bool, parse_datetime_arg
+from serializers import timestamp
+
+# ------------------------------
+# Streaming full-forum export (NDJSON / CSV)
+# ------------------------------
+# Rows come off the database YIELD_PER at a time (a server-side cursor on
+# PostgreSQL), are encoded straight into text and leave in CHUNK_BYTES
+# pieces, optionally through an incremental gzip compressor. Nothing holds
+# more than one batch, so memory stays flat however large the forum is.
+#
+#   NDJSON  any mix of entities, one {"entity": ..., ...} object per line
+#   CSV     one entity per file, with a header row
+#
+# since/until filter queries and responses on created_at; users have no
+# timestamp and are always exported whole. Password hashes never leave.
+
+ENTITIES = ('queries', 'responses', 'users')
+FORMATS = ('ndjson', 'csv')
+YIELD_PER = 1000
+CHUNK_BYTES = 64 * 1024
+
+COLUMNS = {
+    'queries': (Query.id, Query.title, Query.description, Query.student_id, Query.created_at,
+                Query.answered, Query.response_count, Query.first_response_at, Query.last_response_at),
+    'responses': (Response.id, Response.query_id, Response.faculty_id, Response.content,
+                  Response.created_at),
+    'users': (User.id, User.username, User.role, User.active),
+}
+CREATED_AT = {'queries': Query.created_at, 'responses': Response.created_at}
+
+
+def _names(raw):
+    return [name.strip() for name in (raw or '').split(',') if name.strip()]
+
+
+# Read ?format=&entity=&since=&until=&gzip= into iter_export kwargs (+ gzip)
+def parse_export_args(args):
+    fmt = (args.get('format') or 'ndjson').lower()
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown format '{fmt}'. Use {', '.join(FORMATS)}")
+    entities = _names(args.get('entity')) or list(ENTITIES)
+    unknown = [e for e in entities if e not in ENTITIES]
+    if unknown:
+        raise ValueError(f"Unknown entity '{', '.join(unknown)}'. Use {', '.join(ENTITIES)}")
+    if fmt == 'csv' and len(entities) != 1:
+        raise ValueError('CSV exports one entity at a time; pass entity=queries, responses or users')
+    return {
+        'entities': entities,
+        'fmt': fmt,
+        'since': parse_datetime_arg(args, 'since'),
+        'until': parse_datetime_arg(args, 'until'),
+        'gzip': bool(parse_bool(args.get('gzip'))),
+    }
+
+
+def _value(value):
+    return timestamp(value) if isinstance(value, datetime) else value
+
+
+def iter_rows(entity, since=None, until=None):
+    columns = COLUMNS[entity]
+    stmt = select(*columns)
+    created_at = CREATED_AT.get(entity)
+    if created_at is not None:
+        if since is not None:
+            stmt = stmt.where(created_at >= since)
+        if until is not None:
+            stmt = stmt.where(created_at < until)
+    stmt = stmt.order_by(columns[0]).execution_options(yield_per=YIELD_PER)
+    names = [column.key for column in columns]
+    for row in db.session.execute(stmt):
+        yield dict(zip(names, (_value(v) for v in row)))
+
+
+def _ndjson_lines(entities, since, until):
+    for entity in entities:
+        for row in iter_rows(entity, since, until):
+            yield json.dumps(dict(row, entity=entity), ensure_ascii=False) + '\n'
+
+
+def _csv_lines(entity, since, until):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([column.key for column in COLUMNS[entity]])
+    for row in iter_rows(entity, since, until):
+        writer.writerow(row.values())
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+
+def _batched(lines):
+    parts, size = [], 0
+    for line in lines:
+        data = line.encode('utf-8')
+        parts.append(data)
+        size += len(data)
+        if size >= CHUNK_BYTES:
+            yield b''.join(parts)
+            parts, size = [], 0
+    if parts:
+        yield b''.join(parts)
+
+
+def _gzipped(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # 31: gzip container
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+# Yields the export as bytes chunks
+def iter_export(entities=ENTITIES, fmt='ndjson', since=None, until=None, gzip=False):
+    if fmt == 'csv':
+        lines = _csv_lines(entities[0], since, until)
+    else:
+        lines = _ndjson_lines(entities, since, until)
+    chunks = _batched(lines)
+    return _gzipped(chunks) if gzip else chunks
+
+
+def filename(entities, fmt, gzip=False):
+    stamp = datetime.utcnow().strftime('%Y%m%d-%H%M%S')
+    name = f"forum-{'-'.join(entities) if len(entities) < len(ENTITIES) else 'export'}-{stamp}.{fmt}"
+    return name + '.gz' if gzip else name
+
+
+def mimetype(fmt, gzip=False):
+    if gzip:
+        return 'application/gzip'
+    return 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
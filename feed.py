@@ -0,0 +1,269 @@
+import base64
+import binascii
+from datetime import datetime
+from sqlalchemy import and_, false, func, or_, text, true
+from models import db, Query, Response
+from serializers import FULL, parse_fieldset, query_load_options
+
+# ------------------------------
+# Keyset-paginated query feed
+# ------------------------------
+# Pages are ordered by (created_at, id), or with ?sort=activity by
+# (last_response_at, id) newest first over the queries that have responses,
+# and continue from an opaque cursor, so page N costs the same as page 1. Only the columns of the requested
+# fieldset are loaded; embedded responses for the whole page come from one
+# extra SELECT ... WHERE query_id IN (...).
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+SORTS = ('created', 'activity')
+
+
+# `at` names the timestamp the page is ordered by
+def encode_cursor(row, at='created_at'):
+    raw = f"{getattr(row, at).isoformat()}|{row.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        created_at, query_id = base64.urlsafe_b64decode(padded).decode().rsplit('|', 1)
+        return datetime.fromisoformat(created_at), int(query_id)
+    except (ValueError, binascii.Error, UnicodeDecodeError):
+        raise ValueError('Invalid cursor')
+
+
+def parse_bool(value):
+    if value is None or value == '':
+        return None
+    value = value.strip().lower()
+    if value in ('true', '1', 'yes'):
+        return True
+    if value in ('false', '0', 'no'):
+        return False
+    raise ValueError(f"Invalid boolean '{value}'")
+
+
+# Read ?limit=&after=&sort=&answered=&student_id=&min_responses=&active_since=
+# (and ?fields=&include=, see serializers.py) into fetch_query_page kwargs
+def parse_feed_args(args):
+    try:
+        limit = int(args.get('limit', DEFAULT_PAGE_SIZE))
+    except ValueError:
+        raise ValueError('limit must be an integer')
+    if limit < 1:
+        raise ValueError('limit must be positive')
+
+    student_id = args.get('student_id')
+    if student_id is not None:
+        try:
+            student_id = int(student_id)
+        except ValueError:
+            raise ValueError('student_id must be an integer')
+
+    min_responses = args.get('min_responses')
+    if min_responses is not None:
+        try:
+            min_responses = int(min_responses)
+        except ValueError:
+            raise ValueError('min_responses must be an integer')
+
+    active_since = args.get('active_since')
+    if active_since:
+        try:
+            active_since = datetime.fromisoformat(active_since)
+        except ValueError:
+            raise ValueError('active_since must be an ISO date or datetime')
+
+    sort = args.get('sort') or 'created'
+    if sort not in SORTS:
+        raise ValueError(f"sort must be one of: {', '.join(SORTS)}")
+
+    return {
+        'limit': min(limit, MAX_PAGE_SIZE),
+        'after': args.get('after') or None,
+        'sort': sort,
+        'answered': parse_bool(args.get('answered')),
+        'student_id': student_id,
+        'min_responses': min_responses,
+        'active_since': active_since or None,
+        'fieldset': parse_fieldset(args),
+    }
+
+
+# Returns (queries, next_cursor); next_cursor is None on the last page
+def fetch_query_page(limit=DEFAULT_PAGE_SIZE, after=None, sort='created', answered=None, student_id=None,
+                     min_responses=None, active_since=None, fieldset=FULL):
+    stmt = db.session.query(Query).options(*query_load_options(fieldset))
+
+    if answered is not None:
+        # A literal, not a bound value, so the planner can match the partial
+        # ix_queries_unanswered index
+        stmt = stmt.filter(Query.answered == (true() if answered else false()))
+    if student_id is not None:
+        stmt = stmt.filter(Query.student_id == student_id)
+    # Activity filters read the denormalized columns, not responses
+    if min_responses is not None:
+        stmt = stmt.filter(Query.response_count >= min_responses)
+    if active_since is not None:
+        stmt = stmt.filter(Query.last_response_at >= active_since)
+
+    if sort == 'activity':
+        # Most recently responded to first, over ix_queries_last_response
+        stmt = stmt.filter(Query.last_response_at.isnot(None))
+        if after:
+            last_response_at, query_id = decode_cursor(after)
+            stmt = stmt.filter(or_(
+                Query.last_response_at < last_response_at,
+                and_(Query.last_response_at == last_response_at, Query.id < query_id),
+            ))
+        stmt = stmt.order_by(Query.last_response_at.desc(), Query.id.desc())
+        at = 'last_response_at'
+    else:
+        if after:
+            created_at, query_id = decode_cursor(after)
+            stmt = stmt.filter(or_(
+                Query.created_at > created_at,
+                and_(Query.created_at == created_at, Query.id > query_id),
+            ))
+        stmt = stmt.order_by(Query.created_at, Query.id)
+        at = 'created_at'
+
+    # Fetch one extra row to learn whether another page exists
+    rows = stmt.limit(limit + 1).all()
+    next_cursor = encode_cursor(rows[limit - 1], at) if len(rows) > limit else None
+    return rows[:limit], next_cursor
+
+
+def page_headers(next_cursor):
+    # The body stays a plain list for the frontend; the cursor rides in a header
+    return {'X-Next-Cursor': next_cursor} if next_cursor else {}
+
+
+# ------------------------------
+# A faculty member's responses, newest first
+# ------------------------------
+# One SELECT joining responses to their queries, keyset-paginated on
+# (responses.created_at, responses.id) DESC over ix_responses_faculty_created,
+# so every page costs the same however many responses the faculty has.
+
+# Median seconds from a query being posted to this faculty's response to it
+PG_MEDIAN_TIME_TO_RESPOND = """
+    SELECT percentile_cont(0.5) WITHIN GROUP (
+        ORDER BY extract(epoch FROM r.created_at - q.created_at))
+    FROM responses r JOIN queries q ON q.id = r.query_id
+    WHERE {where}
+"""
+
+SQLITE_MEDIAN_TIME_TO_RESPOND = """
+    SELECT avg(seconds) FROM (
+        SELECT (julianday(r.created_at) - julianday(q.created_at)) * 86400.0 AS seconds
+        FROM responses r JOIN queries q ON q.id = r.query_id
+        WHERE {where}
+        ORDER BY seconds
+        LIMIT :middle OFFSET :skip
+    )
+"""
+
+
+def parse_datetime_arg(args, name):
+    value = args.get(name)
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f'{name} must be an ISO date or datetime')
+
+
+# Read ?limit=&after=&answered=&since=&until= into fetch_response_page kwargs
+def parse_response_args(args):
+    try:
+        limit = int(args.get('limit', DEFAULT_PAGE_SIZE))
+    except ValueError:
+        raise ValueError('limit must be an integer')
+    if limit < 1:
+        raise ValueError('limit must be positive')
+    return {
+        'limit': min(limit, MAX_PAGE_SIZE),
+        'after': args.get('after') or None,
+        'answered': parse_bool(args.get('answered')),
+        'since': parse_datetime_arg(args, 'since'),
+        'until': parse_datetime_arg(args, 'until'),
+    }
+
+
+def response_filters(faculty_id, answered=None, since=None, until=None):
+    conditions = [Response.faculty_id == faculty_id]
+    if answered is not None:
+        conditions.append(Query.answered == answered)
+    if since is not None:
+        conditions.append(Response.created_at >= since)
+    if until is not None:
+        conditions.append(Response.created_at < until)
+    return and_(*conditions)
+
+
+# Returns (rows, next_cursor); rows carry the response and its query's columns
+def fetch_response_page(faculty_id, limit=DEFAULT_PAGE_SIZE, after=None, answered=None,
+                        since=None, until=None):
+    stmt = db.session.query(
+        Response.id, Response.content, Response.created_at, Response.query_id,
+        Query.title.label('query_title'), Query.description.label('query_description'),
+        Query.answered.label('query_answered'),
+    ).join(Query, Query.id == Response.query_id) \
+        .filter(response_filters(faculty_id, answered, since, until))
+
+    if after:
+        created_at, response_id = decode_cursor(after)
+        stmt = stmt.filter(or_(
+            Response.created_at < created_at,
+            and_(Response.created_at == created_at, Response.id < response_id),
+        ))
+
+    rows = stmt.order_by(Response.created_at.desc(), Response.id.desc()).limit(limit + 1).all()
+    next_cursor = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return rows[:limit], next_cursor
+
+
+# {'total_responses', 'distinct_queries', 'median_seconds_to_respond'}
+def response_summary(faculty_id, answered=None, since=None, until=None):
+    condition = response_filters(faculty_id, answered, since, until)
+    total, distinct = db.session.query(
+        func.count(Response.id), func.count(Response.query_id.distinct())
+    ).join(Query, Query.id == Response.query_id).filter(condition).one()
+
+    median = None
+    if total:
+        # Same filters as above, rendered once for the raw median SQL
+        where = ['r.faculty_id = :faculty_id']
+        # The middle row, or the two middle rows of an even count
+        params = {'faculty_id': faculty_id, 'middle': 2 - total % 2, 'skip': (total - 1) // 2}
+        if answered is not None:
+            where.append('q.answered = :answered')
+            params['answered'] = answered
+        if since is not None:
+            where.append('r.created_at >= :since')
+            params['since'] = since
+        if until is not None:
+            where.append('r.created_at < :until')
+            params['until'] = until
+        dialect = db.session.get_bind().dialect.name
+        sql = PG_MEDIAN_TIME_TO_RESPOND if dialect == 'postgresql' else SQLITE_MEDIAN_TIME_TO_RESPOND
+        median = db.session.execute(text(sql.format(where=' AND '.join(where))), params).scalar()
+
+    return {
+        'total_responses': total,
+        'distinct_queries': distinct,
+        'median_seconds_to_respond': round(median) if median is not None else None,
+    }
+
+
+def summary_headers(summary):
+    return {
+        'X-Total-Responses': str(summary['total_responses']),
+        'X-Distinct-Queries': str(summary['distinct_queries']),
+        'X-Median-Seconds-To-Respond': '' if summary['median_seconds_to_respond'] is None
+        else str(summary['median_seconds_to_respond']),
+    }
@@ -0,0 +1,110 @@
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from flask import current_app, g
+from flask_jwt_extended import get_jwt_identity
+from models import db, User
+
+# ------------------------------
+# JWT identity -> user record, cached
+# ------------------------------
+# Every authenticated request goes through is_token_revoked() (registered as
+# the JWT blocklist loader in app.py). It resolves the token's username to a
+# small cached record and rejects the token if the user was deleted,
+# suspended or re-roled since it was issued. Routes then read the same record
+# via current_user() instead of running their own SELECT.
+#
+# Admin routes call invalidate()/revoke()/restore() so changes take effect on
+# this worker immediately; other workers pick them up within the TTL.
+
+CachedUser = namedtuple('CachedUser', ['id', 'username', 'role', 'active'])
+
+DEFAULT_TTL = 60
+MAX_ENTRIES = 10000
+
+_lock = threading.Lock()
+_records = OrderedDict()  # username -> (CachedUser or None, expires_at)
+_revoked = {}             # username -> expires_at, suspended/deleted on this worker
+
+
+def _ttl():
+    return current_app.config.get('IDENTITY_CACHE_TTL', DEFAULT_TTL)
+
+
+def resolve(username):
+    if username is None:
+        return None
+    now = time.monotonic()
+    with _lock:
+        entry = _records.get(username)
+        if entry is not None and entry[1] > now:
+            return entry[0]
+
+    user = db.session.query(User.id, User.username, User.role, User.active) \
+        .filter_by(username=username).first()
+    record = CachedUser(user.id, user.username, user.role, bool(user.active)) if user else None
+
+    with _lock:
+        _records[username] = (record, now + _ttl())
+        _records.move_to_end(username)
+        while len(_records) > MAX_ENTRIES:
+            _records.popitem(last=False)
+    return record
+
+
+def current_username():
+    identity = get_jwt_identity()
+    if isinstance(identity, dict):
+        return identity.get("username")
+    return identity
+
+
+# The resolved record for this request's token (None if the user is gone)
+def current_user():
+    if 'current_user' not in g:
+        g.current_user = resolve(current_username())
+    return g.current_user
+
+
+def invalidate(username):
+    with _lock:
+        _records.pop(username, None)
+
+
+def revoke(username):
+    with _lock:
+        _records.pop(username, None)
+        _revoked[username] = time.monotonic() + _ttl()
+
+
+def restore(username):
+    with _lock:
+        _records.pop(username, None)
+        _revoked.pop(username, None)
+
+
+# Drop every cached record and revocation (benchmarks, tests)
+def clear():
+    with _lock:
+        _records.clear()
+        _revoked.clear()
+
+
+def is_token_revoked(jwt_header, jwt_payload):
+    username = jwt_payload.get('sub')
+    if isinstance(username, dict):
+        username = username.get('username')
+    with _lock:
+        expires_at = _revoked.get(username)
+        if expires_at is not None:
+            if expires_at > time.monotonic():
+                return True
+            # Past the TTL the database record is authoritative again
+            del _revoked[username]
+
+    record = resolve(username)
+    g.current_user = record
+    if record is None or not record.active:
+        return True
+    # A token minted before a role change no longer matches the user
+    return record.role != jwt_payload.get('role')
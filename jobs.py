@@ -0,0 +1,352 @@
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import or_, select, update
+from models import db, Job
+from serializers import timestamp
+import events
+
+# ------------------------------
+# Background jobs for heavy admin operations
+# ------------------------------
+# A route enqueues work with jobs.enqueue(kind, params) and answers 202 with
+# the job id straight away; a small thread pool inside the worker runs the
+# handler registered for `kind` in its own app context. The jobs table holds
+# the durable state, so GET /api/admin/jobs/<id> can report progress from any
+# worker.
+#
+# Handlers that commit in chunks call ctx.advance() between them, which both
+# records progress and raises JobCancelled once an admin asked to cancel, so
+# cancellation stops at the next chunk boundary and the chunks already done
+# stay done; ctx.report() saves what they applied so far as the result even
+# if the job then fails or is cancelled. Handlers that must stay in one
+# transaction call ctx.check() instead, which only raises JobCancelled and so
+# rolls everything back. A handler that raises is retried up to max_attempts
+# times with a growing delay, so handlers must be safe to run again: each
+# attempt recomputes the remaining work and reports progress against that.
+#
+#   JOB_WORKERS          threads per worker (0 = run inline in the request)
+#   JOB_MAX_ATTEMPTS     automatic attempts before a job is marked failed
+#   JOB_RETRY_DELAY      seconds before retry n (times n)
+#   JOB_STALE_SECONDS    a running job silent this long is requeued by recover()
+#   JOB_SWEEP_SECONDS    how often each worker runs recover() (0 = never)
+#
+# The sweep starts with a worker's first request (after any fork), so jobs
+# and buffered votes orphaned by a dead worker are picked up by whichever
+# workers are still serving, however the app was started. init_app() adds
+# other recovery functions to it, e.g. votes.recover.
+#
+#   @jobs.handler('moderate')
+#   def moderate_job(ctx, params): ...
+
+DEFAULT_WORKERS = 2
+DEFAULT_MAX_ATTEMPTS = 3
+DEFAULT_RETRY_DELAY = 5
+DEFAULT_STALE_SECONDS = 300
+DEFAULT_SWEEP_SECONDS = 60
+
+STATUSES = ('queued', 'running', 'succeeded', 'failed', 'cancelled')
+FINISHED = ('succeeded', 'failed', 'cancelled')
+
+HANDLERS = {}
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class JobNotFound(Exception):
+    pass
+
+
+class JobStateError(Exception):
+    pass
+
+
+def handler(kind):
+    def decorator(fn):
+        HANDLERS[kind] = fn
+        return fn
+    return decorator
+
+
+class JobContext:
+    def __init__(self, job_id):
+        self.job_id = job_id
+        self.progress = 0
+        self.result = None
+
+    def _update(self, **values):
+        cancel = db.session.execute(
+            update(Job).where(Job.id == self.job_id)
+            .values(updated_at=datetime.utcnow(), **values)
+            .returning(Job.cancel_requested)
+        ).scalar()
+        db.session.commit()
+        if cancel:
+            raise JobCancelled()
+
+    def set_total(self, total):
+        self._update(progress_total=total)
+
+    # Call after each committed chunk; raises JobCancelled if asked to stop
+    def advance(self, done=1):
+        self.progress += done
+        self._update(progress=self.progress)
+
+    # Inside an open transaction: raises JobCancelled if asked to stop,
+    # without committing
+    def check(self):
+        if db.session.execute(select(Job.cancel_requested).where(Job.id == self.job_id)).scalar():
+            raise JobCancelled()
+
+    # The result so far; kept if the job fails or is cancelled after this
+    def report(self, result):
+        self.result = result
+
+
+class JobRunner:
+    def __init__(self, app, workers=DEFAULT_WORKERS, sweep_seconds=DEFAULT_SWEEP_SECONDS):
+        self.app = app
+        self.workers = workers
+        self.sweep_seconds = sweep_seconds
+        self.sweeps = []
+        self.lock = threading.Lock()
+        self.executor = None
+        self.sweeper_pid = None
+
+    # before_request hook: start this process's sweep thread once
+    def start(self):
+        if not self.sweep_seconds or self.sweeper_pid == os.getpid():
+            return
+        with self.lock:
+            if self.sweeper_pid == os.getpid():
+                return
+            self.sweeper_pid = os.getpid()
+            threading.Thread(target=self._sweep_loop, name='job-sweep', daemon=True).start()
+
+    def _sweep_loop(self):
+        # After the first pass, leave freshly queued jobs (and delayed
+        # retries) to the worker that queued them
+        idle = 0
+        while True:
+            with self.app.app_context():
+                for sweep in [lambda: recover(idle), *self.sweeps]:
+                    try:
+                        sweep()
+                    except Exception:
+                        db.session.rollback()
+                        self.app.logger.exception('Recovery sweep failed')
+                db.session.remove()
+            idle = self.sweep_seconds
+            time.sleep(self.sweep_seconds)
+
+    def _get_executor(self):
+        # Created lazily so each forked web worker gets its own threads
+        with self.lock:
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='job')
+            return self.executor
+
+    def submit(self, job_id, delay=0):
+        if delay:
+            # Inline mode has no pool, so a delayed retry gets its own thread
+            timer = threading.Timer(delay, self.submit if self.workers else self._run, args=(job_id,))
+            timer.daemon = True
+            timer.start()
+        elif self.workers:
+            self._get_executor().submit(self._run, job_id)
+        else:
+            run(job_id)
+
+    def _run(self, job_id):
+        with self.app.app_context():
+            try:
+                run(job_id)
+            except Exception:
+                self.app.logger.exception('Job %s crashed', job_id)
+            finally:
+                db.session.remove()
+
+
+def get_runner(app=None):
+    app = app or current_app._get_current_object()
+    runner = app.extensions.get('jobs')
+    if runner is None:
+        runner = JobRunner(app, workers=app.config.get('JOB_WORKERS', DEFAULT_WORKERS),
+                           sweep_seconds=app.config.get('JOB_SWEEP_SECONDS', DEFAULT_SWEEP_SECONDS))
+        app.extensions['jobs'] = runner
+    return runner
+
+
+# Run recover() and `sweeps` when each worker starts serving and every
+# JOB_SWEEP_SECONDS after
+def init_app(app, sweeps=()):
+    runner = get_runner(app)
+    runner.sweeps.extend(sweeps)
+    app.before_request(runner.start)
+
+
+def enqueue(kind, params, created_by=None):
+    if kind not in HANDLERS:
+        raise ValueError(f"Unknown job kind '{kind}'")
+    job = Job(kind=kind, params=json.dumps(params), created_by=created_by,
+              max_attempts=current_app.config.get('JOB_MAX_ATTEMPTS', DEFAULT_MAX_ATTEMPTS))
+    db.session.add(job)
+    db.session.commit()
+    job_id = job.id
+    get_runner().submit(job_id)
+    return db.session.get(Job, job_id)
+
+
+def _publish(job):
+    events.publish('job_updated', {'job_id': job.id, 'kind': job.kind, 'status': job.status},
+                   roles=('admin',))
+
+
+def _finish(job_id, status, result=None, error=None):
+    now = datetime.utcnow()
+    db.session.execute(
+        update(Job).where(Job.id == job_id).values(
+            status=status, result=json.dumps(result) if result is not None else None,
+            error=error, finished_at=now, updated_at=now)
+    )
+    db.session.commit()
+    _publish(db.session.get(Job, job_id))
+
+
+def run(job_id):
+    now = datetime.utcnow()
+    # Compare-and-set claim: a job recovered by two workers runs once
+    claimed = db.session.execute(
+        update(Job).where(Job.id == job_id, Job.status == 'queued')
+        .values(status='running', attempts=Job.attempts + 1, progress=0, progress_total=None,
+                started_at=now, updated_at=now)
+    ).rowcount
+    db.session.commit()
+    if not claimed:
+        return
+
+    job = db.session.get(Job, job_id)
+    _publish(job)
+    ctx = JobContext(job_id)
+    try:
+        if job.cancel_requested:
+            raise JobCancelled()
+        result = HANDLERS[job.kind](ctx, json.loads(job.params))
+    except JobCancelled:
+        db.session.rollback()
+        _finish(job_id, 'cancelled', result=ctx.result, error='Cancelled by an admin')
+        return
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.exception('Job %s (%s) failed', job_id, job.kind)
+        job = db.session.get(Job, job_id)
+        if job.attempts < job.max_attempts:
+            job.status = 'queued'
+            job.error = str(e)
+            job.result = json.dumps(ctx.result) if ctx.result is not None else None
+            job.updated_at = datetime.utcnow()
+            db.session.commit()
+            delay = current_app.config.get('JOB_RETRY_DELAY', DEFAULT_RETRY_DELAY) * job.attempts
+            get_runner().submit(job_id, delay=delay)
+        else:
+            _finish(job_id, 'failed', result=ctx.result, error=str(e))
+        return
+    _finish(job_id, 'succeeded', result=result)
+
+
+def get(job_id):
+    job = db.session.get(Job, job_id)
+    if job is None:
+        raise JobNotFound(f'Job {job_id} not found')
+    return job
+
+
+# Queued jobs stop at once; running ones at their next chunk
+def cancel(job_id):
+    job = get(job_id)
+    if job.status in FINISHED:
+        raise JobStateError(f'Job {job_id} already {job.status}')
+    now = datetime.utcnow()
+    stopped = db.session.execute(
+        update(Job).where(Job.id == job_id, Job.status == 'queued')
+        .values(status='cancelled', cancel_requested=True, error='Cancelled by an admin',
+                finished_at=now, updated_at=now)
+    ).rowcount
+    if not stopped:
+        db.session.execute(update(Job).where(Job.id == job_id).values(cancel_requested=True))
+    db.session.commit()
+    job = get(job_id)
+    if stopped:
+        _publish(job)
+    return job
+
+
+# Run a failed or cancelled job again; handlers pick up what is left
+def retry(job_id):
+    job = get(job_id)
+    if job.status not in ('failed', 'cancelled'):
+        raise JobStateError(f'Only failed or cancelled jobs can be retried (job {job_id} is {job.status})')
+    job.status = 'queued'
+    job.cancel_requested = False
+    job.error = None
+    job.result = None
+    job.finished_at = None
+    job.max_attempts = job.attempts + current_app.config.get('JOB_MAX_ATTEMPTS', DEFAULT_MAX_ATTEMPTS)
+    job.updated_at = datetime.utcnow()
+    db.session.commit()
+    get_runner().submit(job_id)
+    return get(job_id)
+
+
+def recent(limit=50, status=None):
+    stmt = db.session.query(Job)
+    if status is not None:
+        stmt = stmt.filter(Job.status == status)
+    return stmt.order_by(Job.created_at.desc(), Job.id.desc()).limit(limit).all()
+
+
+# Requeue jobs whose worker died mid-run and resubmit those queued and
+# untouched for idle_seconds (called by the sweep). run() claims a job with a
+# compare-and-set, so every worker may sweep.
+def recover(idle_seconds=0):
+    now = datetime.utcnow()
+    stale = now - timedelta(seconds=current_app.config.get('JOB_STALE_SECONDS', DEFAULT_STALE_SECONDS))
+    orphaned = [job_id for (job_id,) in db.session.query(Job.id)
+                .filter(Job.status == 'running', Job.updated_at < stale)]
+    if orphaned:
+        db.session.execute(
+            update(Job).where(Job.id.in_(orphaned), Job.status == 'running', Job.updated_at < stale)
+            .values(status='queued', updated_at=now)
+        )
+        db.session.commit()
+    idle = now - timedelta(seconds=idle_seconds)
+    queued = [job_id for (job_id,) in db.session.query(Job.id).filter(
+        Job.status == 'queued', or_(Job.updated_at <= idle, Job.id.in_(orphaned)))]
+    for job_id in queued:
+        get_runner().submit(job_id)
+    return len(queued)
+
+
+def serialize_job(job):
+    return {
+        'id': job.id,
+        'kind': job.kind,
+        'status': job.status,
+        'progress': job.progress,
+        'progress_total': job.progress_total,
+        'attempts': job.attempts,
+        'max_attempts': job.max_attempts,
+        'cancel_requested': job.cancel_requested,
+        'result': json.loads(job.result) if job.result else None,
+        'error': job.error,
+        'created_by': job.created_by,
+        'created_at': timestamp(job.created_at),
+        'started_at': timestamp(job.started_at),
+        'finished_at': timestamp(job.finished_at),
+    }
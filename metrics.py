@@ -0,0 +1,262 @@
+import re
+import threading
+import time
+from flask import current_app, g, has_request_context, request
+from flask.json.provider import DefaultJSONProvider
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# ------------------------------
+# Per-request SQL / latency instrumentation, exported at /metrics
+# ------------------------------
+# Engine events count every statement and its time against the request that
+# issued it; the JSON provider times serialization; after_request folds the
+# totals into per-endpoint counters. GET /metrics renders them (plus the
+# password pool and rate limiter decisions) in the Prometheus text format.
+#
+#   SLOW_REQUEST_MS      log requests slower than this, with their SQL (0 = off)
+#   N_PLUS_ONE_THRESHOLD flag a request that runs one statement shape this often
+#   METRICS_TOKEN        if set, /metrics wants "Authorization: Bearer <token>"
+
+DEFAULT_N_PLUS_ONE_THRESHOLD = 5
+MAX_LOGGED_STATEMENTS = 50
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+STATEMENT_BUCKETS = (1, 2, 5, 10, 20, 50, 100)
+
+# Bind markers and expanded IN lists vary between calls of the same statement
+_IN_LIST = re.compile(r'\((?:\s*(?:\?|%\(\w+\)s|:\w+|\$\d+)\s*,?)+\)')
+_POSTCOMPILE = re.compile(r'\(?__\[POSTCOMPILE_\w+\]\)?')
+_SPACE = re.compile(r'\s+')
+
+
+def statement_shape(statement):
+    shape = _POSTCOMPILE.sub('(?)', statement)
+    shape = _IN_LIST.sub('(?)', shape)
+    return _SPACE.sub(' ', shape).strip()
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                return
+        self.counts[-1] += 1
+
+
+class EndpointStats:
+    def __init__(self):
+        self.requests = {}  # (method, status) -> count
+        self.duration = Histogram(DURATION_BUCKETS)
+        self.statements = Histogram(STATEMENT_BUCKETS)
+        self.db_seconds = 0.0
+        self.serialize_seconds = 0.0
+        self.response_bytes = 0
+        self.slow = 0
+        self.n_plus_one = 0
+
+
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.endpoints = {}
+        self.limits = {}  # (bucket, decision) -> count, see ratelimit.py
+
+    def record(self, endpoint, method, status, state, duration, size, slow, n_plus_one):
+        with self.lock:
+            stats = self.endpoints.get(endpoint)
+            if stats is None:
+                stats = self.endpoints[endpoint] = EndpointStats()
+            key = (method, status)
+            stats.requests[key] = stats.requests.get(key, 0) + 1
+            stats.duration.observe(duration)
+            stats.statements.observe(state.statements)
+            stats.db_seconds += state.db_seconds
+            stats.serialize_seconds += state.serialize_seconds
+            stats.response_bytes += size
+            stats.slow += slow
+            stats.n_plus_one += n_plus_one
+
+    def record_limit(self, bucket, decision):
+        with self.lock:
+            key = (bucket, decision)
+            self.limits[key] = self.limits.get(key, 0) + 1
+
+
+class RequestState:
+    def __init__(self, keep_sql):
+        self.started = time.perf_counter()
+        self.statements = 0
+        self.db_seconds = 0.0
+        self.serialize_seconds = 0.0
+        self.shapes = {}
+        self.sql = [] if keep_sql else None
+
+
+def _state():
+    if has_request_context():
+        return g.get('_metrics')
+    return None
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context._metrics_started = time.perf_counter()
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    state = _state()
+    if state is None:
+        return
+    elapsed = time.perf_counter() - context._metrics_started
+    state.statements += 1
+    state.db_seconds += elapsed
+    shape = statement_shape(statement)
+    state.shapes[shape] = state.shapes.get(shape, 0) + 1
+    if state.sql is not None and len(state.sql) < MAX_LOGGED_STATEMENTS:
+        state.sql.append((round(elapsed * 1000, 2), _SPACE.sub(' ', statement)))
+
+
+# Subclasses swap the encoder by overriding encode()
+class TimedJSONProvider(DefaultJSONProvider):
+    def encode(self, obj, **kwargs):
+        return super().dumps(obj, **kwargs)
+
+    def dumps(self, obj, **kwargs):
+        state = _state()
+        if state is None:
+            return self.encode(obj, **kwargs)
+        started = time.perf_counter()
+        try:
+            return self.encode(obj, **kwargs)
+        finally:
+            state.serialize_seconds += time.perf_counter() - started
+
+
+def get_registry(app=None):
+    app = app or current_app
+    return app.extensions['metrics']
+
+
+def _before_request():
+    g._metrics = RequestState(keep_sql=bool(current_app.config.get('SLOW_REQUEST_MS')))
+
+
+def _after_request(response):
+    state = g.pop('_metrics', None)
+    if state is None:
+        return response
+    duration = time.perf_counter() - state.started
+    endpoint = request.endpoint or 'unmatched'
+    # Streamed bodies (SSE) have no length up front
+    size = 0 if response.is_streamed else response.calculate_content_length() or 0
+
+    threshold = current_app.config.get('N_PLUS_ONE_THRESHOLD', DEFAULT_N_PLUS_ONE_THRESHOLD)
+    repeated = {shape: n for shape, n in state.shapes.items() if threshold and n >= threshold}
+    for shape, n in repeated.items():
+        current_app.logger.warning('Possible N+1 in %s %s: %d x %s', request.method, endpoint, n, shape[:300])
+
+    slow_ms = current_app.config.get('SLOW_REQUEST_MS')
+    slow = bool(slow_ms) and duration * 1000 >= slow_ms
+    if slow:
+        lines = '\n'.join(f'    {ms:>8.2f}ms  {sql[:500]}' for ms, sql in state.sql)
+        current_app.logger.warning(
+            'Slow request %s %s: %.1fms, %d statements (%.1fms in DB, %.1fms serializing)\n%s',
+            request.method, request.full_path.rstrip('?'), duration * 1000, state.statements,
+            state.db_seconds * 1000, state.serialize_seconds * 1000, lines)
+
+    get_registry().record(endpoint, request.method, response.status_code, state,
+                          duration, size, int(slow), int(bool(repeated)))
+    return response
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _histogram_lines(name, labels, histogram):
+    lines = []
+    cumulative = 0
+    for bound, count in zip([str(b) for b in histogram.buckets] + ['+Inf'], histogram.counts):
+        cumulative += count
+        lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+    lines.append(f'{name}_sum{{{labels}}} {histogram.sum:.6f}')
+    lines.append(f'{name}_count{{{labels}}} {cumulative}')
+    return lines
+
+
+def render(registry, hasher=None):
+    families = {
+        'forum_http_requests_total': ('counter', 'Requests by endpoint, method and status', []),
+        'forum_http_request_duration_seconds': ('histogram', 'Request latency', []),
+        'forum_db_statements_per_request': ('histogram', 'SQL statements issued per request', []),
+        'forum_db_seconds_total': ('counter', 'Time spent executing SQL', []),
+        'forum_serialize_seconds_total': ('counter', 'Time spent encoding JSON', []),
+        'forum_response_bytes_total': ('counter', 'Response body bytes', []),
+        'forum_slow_requests_total': ('counter', 'Requests over SLOW_REQUEST_MS', []),
+        'forum_n_plus_one_requests_total': ('counter', 'Requests that repeated one statement shape', []),
+        'forum_ratelimit_decisions_total': ('counter', 'Rate limiter decisions by bucket', []),
+    }
+    with registry.lock:
+        for endpoint, stats in sorted(registry.endpoints.items()):
+            labels = f'endpoint="{_label(endpoint)}"'
+            for (method, status), count in sorted(stats.requests.items()):
+                families['forum_http_requests_total'][2].append(
+                    f'forum_http_requests_total{{{labels},method="{method}",status="{status}"}} {count}')
+            families['forum_http_request_duration_seconds'][2].extend(
+                _histogram_lines('forum_http_request_duration_seconds', labels, stats.duration))
+            families['forum_db_statements_per_request'][2].extend(
+                _histogram_lines('forum_db_statements_per_request', labels, stats.statements))
+            for name, value in (('forum_db_seconds_total', f'{stats.db_seconds:.6f}'),
+                                ('forum_serialize_seconds_total', f'{stats.serialize_seconds:.6f}'),
+                                ('forum_response_bytes_total', stats.response_bytes),
+                                ('forum_slow_requests_total', stats.slow),
+                                ('forum_n_plus_one_requests_total', stats.n_plus_one)):
+                families[name][2].append(f'{name}{{{labels}}} {value}')
+        for (bucket, decision), count in sorted(registry.limits.items()):
+            families['forum_ratelimit_decisions_total'][2].append(
+                f'forum_ratelimit_decisions_total{{bucket="{_label(bucket)}",decision="{decision}"}} {count}')
+
+    out = []
+    for name, (kind, help_text, lines) in families.items():
+        out += [f'# HELP {name} {help_text}', f'# TYPE {name} {kind}'] + lines
+
+    if hasher is not None:
+        pool = hasher.snapshot()
+        for name, kind, value in (('in_flight', 'gauge', pool['in_flight']),
+                                  ('peak_in_flight', 'gauge', pool['peak_in_flight']),
+                                  ('rejected_total', 'counter', pool['rejected'])):
+            out += [f'# TYPE forum_password_pool_{name} {kind}', f'forum_password_pool_{name} {value}']
+        out.append('# TYPE forum_password_hash_seconds histogram')
+        cumulative = 0
+        for bound, count in pool['latency_buckets'].items():
+            cumulative += count
+            out.append(f'forum_password_hash_seconds_bucket{{le="{bound}"}} {cumulative}')
+        out.append(f"forum_password_hash_seconds_sum {pool['latency_seconds_sum']}")
+        out.append(f'forum_password_hash_seconds_count {cumulative}')
+    return '\n'.join(out) + '\n'
+
+
+def metrics_view():
+    token = current_app.config.get('METRICS_TOKEN')
+    if token and request.headers.get('Authorization') != f'Bearer {token}':
+        return 'Unauthorized\n', 401, {'Content-Type': 'text/plain'}
+    # Only report the pool if something already started it
+    hasher = current_app.extensions.get('password_hasher')
+    body = render(get_registry(), hasher)
+    return body, 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
+
+def init_app(app):
+    app.extensions['metrics'] = Registry()
+    app.json = TimedJSONProvider(app)
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.add_url_rule('/metrics', 'metrics', metrics_view)
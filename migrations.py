@@ -0,0 +1,234 @@
+from sqlalchemy import MetaData, inspect, text
+from sqlalchemy.schema import CreateTable
+from models import db, SchemaMigration, Query, Response, ResponseTimeRollup, Attachment, ResponseVote, Job, ChangeLog
+import activity
+import analytics
+import search
+import stats
+import triage
+import votes
+
+# ------------------------------
+# Versioned schema migrations
+# ------------------------------
+# `flask db-upgrade` (and `python app.py` on start) applies every step in
+# MIGRATIONS that schema_migrations does not list yet, in version order, and
+# records it. Each step is idempotent (IF NOT EXISTS / checkfirst / recompute),
+# so a step interrupted halfway is simply run again, and a database made by
+# an older db.create_all() converges to the same schema as a fresh one.
+# Migrations run against the primary only; the replica follows replication.
+#
+# New steps go at the end with the next version number:
+#
+#   @migration(13, 'what it does')
+#   def what_it_does(): ...
+
+MIGRATIONS = []
+
+# Indexes replaced by a wider one in models.py
+SUPERSEDED_INDEXES = ('ix_triage_items_claimed_by',)
+
+
+def migration(version, name):
+    def decorator(step):
+        MIGRATIONS.append((version, name, step))
+        MIGRATIONS.sort(key=lambda m: m[0])
+        return step
+    return decorator
+
+
+def dialect():
+    return db.session.get_bind().dialect.name
+
+
+@migration(1, 'create missing tables')
+def create_tables():
+    # Only creates what is absent; existing tables are upgraded below
+    db.create_all()
+
+
+@migration(2, 'response activity columns on queries')
+def response_activity():
+    activity.backfill()
+
+
+@migration(3, 'full-text search index')
+def full_text_search():
+    search.ensure_search_index()
+    search.rebuild_index()
+
+
+# Composite and partial indexes declared in models.py, for tables that
+# predate them (create_all never touches an existing table). Indexes on
+# columns a later step adds are created by that step.
+@migration(4, 'hot-path indexes')
+def hot_path_indexes():
+    connection = db.session.connection()
+    for name in SUPERSEDED_INDEXES:
+        connection.execute(text(f'DROP INDEX IF EXISTS {name}'))
+    for table in db.metadata.sorted_tables:
+        existing = {column['name'] for column in inspect(connection).get_columns(table.name)}
+        for index in sorted(table.indexes, key=lambda i: i.name):
+            if all(column.name in existing for column in index.columns):
+                index.create(connection, checkfirst=True)
+    db.session.commit()
+
+
+def _stale_foreign_keys(table):
+    current = {}
+    for fk in inspect(db.session.connection()).get_foreign_keys(table.name):
+        if len(fk['constrained_columns']) == 1:
+            ondelete = (fk.get('options') or {}).get('ondelete')
+            current[fk['constrained_columns'][0]] = (fk.get('name'), (ondelete or '').upper())
+    stale = []
+    for fk in table.foreign_keys:
+        name, ondelete = current.get(fk.parent.name, (None, ''))
+        if fk.ondelete and ondelete != fk.ondelete.upper():
+            stale.append((fk, name))
+    return stale
+
+
+def _rebuild_sqlite_table(connection, table):
+    # SQLite cannot alter a constraint: copy the rows into a table built
+    # from the model, then swap it in under the old name
+    metadata = MetaData()
+    for other in db.metadata.sorted_tables:
+        if other is not table:
+            other.to_metadata(metadata)
+    staging = table.to_metadata(metadata, name=f'{table.name}_rebuild')
+    existing = {column['name'] for column in inspect(connection).get_columns(table.name)}
+    columns = ', '.join(c.name for c in table.columns if c.name in existing)
+
+    connection.execute(CreateTable(staging))
+    connection.exec_driver_sql(f'INSERT INTO {staging.name} ({columns}) SELECT {columns} FROM {table.name}')
+    connection.exec_driver_sql(f'DROP TABLE {table.name}')
+    connection.exec_driver_sql(f'ALTER TABLE {staging.name} RENAME TO {table.name}')
+    for index in table.indexes:
+        index.create(connection)
+
+
+# Deleting a user or query removes its dependants in the database
+# (ON DELETE CASCADE), which moderation.py relies on
+@migration(5, 'ON DELETE CASCADE foreign keys')
+def cascade_foreign_keys():
+    tables = [table for table in (Query.__table__, Response.__table__) if _stale_foreign_keys(table)]
+    if not tables:
+        db.session.commit()
+        return
+
+    if dialect() == 'postgresql':
+        for table in tables:
+            for fk, name in _stale_foreign_keys(table):
+                name = name or f'{table.name}_{fk.parent.name}_fkey'
+                db.session.execute(text(f'ALTER TABLE {table.name} DROP CONSTRAINT IF EXISTS {name}'))
+                db.session.execute(text(
+                    f'ALTER TABLE {table.name} ADD CONSTRAINT {name} FOREIGN KEY ({fk.parent.name}) '
+                    f'REFERENCES {fk.column.table.name} ({fk.column.name}) ON DELETE {fk.ondelete}'
+                ))
+        db.session.commit()
+        return
+
+    # Dropping the old table must not cascade into its dependants, and
+    # PRAGMA foreign_keys is ignored inside a transaction: use a connection
+    # of our own and switch enforcement off before it begins
+    db.session.commit()
+    with db.engine.connect() as connection:
+        connection.exec_driver_sql('PRAGMA foreign_keys=OFF')
+        connection.commit()
+        try:
+            with connection.begin():
+                for table in tables:
+                    _rebuild_sqlite_table(connection, table)
+                problems = connection.exec_driver_sql('PRAGMA foreign_key_check').fetchall()
+                if problems:
+                    raise RuntimeError(f'Foreign key violations after rebuild: {problems[:5]}')
+        finally:
+            connection.exec_driver_sql('PRAGMA foreign_keys=ON')
+            connection.commit()
+
+
+@migration(6, 'triage queue and counters from the tables')
+def derived_state():
+    triage.rebuild()
+    stats.reconcile()
+
+
+@migration(7, 'response-time rollups')
+def response_time_rollups():
+    ResponseTimeRollup.__table__.create(db.engine, checkfirst=True)
+    analytics.rebuild()
+
+
+@migration(8, 'evidence attachments')
+def evidence_attachments():
+    Attachment.__table__.create(db.engine, checkfirst=True)
+
+
+@migration(9, 'response votes and score counters')
+def response_votes():
+    votes.ensure_columns()
+    ResponseVote.__table__.create(db.engine, checkfirst=True)
+    connection = db.session.connection()
+    for index in Response.__table__.indexes:
+        index.create(connection, checkfirst=True)
+    db.session.commit()
+    votes.recount(response_id for (response_id,) in db.session.query(ResponseVote.response_id).distinct())
+    db.session.commit()
+
+
+# GET /api/admin/jobs without ?status= pages newest first
+@migration(10, 'job list index')
+def job_list_index():
+    ix_jobs_created = next(index for index in Job.__table__.indexes if index.name == 'ix_jobs_created')
+    ix_jobs_created.create(db.session.connection(), checkfirst=True)
+    db.session.commit()
+
+
+# Change log ids are sync cursors; without AUTOINCREMENT SQLite reuses the
+# ids of rows prune() deleted. PostgreSQL's sequence never goes back.
+@migration(11, 'change log ids never reused')
+def change_log_autoincrement():
+    if dialect() == 'sqlite':
+        connection = db.session.connection()
+        sql = connection.exec_driver_sql(
+            "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'change_log'").scalar()
+        if sql and 'AUTOINCREMENT' not in sql.upper():
+            _rebuild_sqlite_table(connection, ChangeLog.__table__)
+    db.session.commit()
+
+
+# ?sort=activity pages on (last_response_at, id); the index used to cover
+# last_response_at alone
+@migration(12, 'activity feed index')
+def activity_feed_index():
+    ix_queries_last_response = next(index for index in Query.__table__.indexes
+                                    if index.name == 'ix_queries_last_response')
+    connection = db.session.connection()
+    connection.execute(text('DROP INDEX IF EXISTS ix_queries_last_response'))
+    ix_queries_last_response.create(connection)
+    db.session.commit()
+
+
+def applied_versions():
+    SchemaMigration.__table__.create(db.engine, checkfirst=True)
+    return {row.version: row for row in db.session.query(SchemaMigration)}
+
+
+def status():
+    applied = applied_versions()
+    return [(version, name, applied[version].applied_at if version in applied else None)
+            for version, name, _ in MIGRATIONS]
+
+
+# Returns the (version, name) steps that ran
+def upgrade(target=None):
+    applied = applied_versions()
+    ran = []
+    for version, name, step in MIGRATIONS:
+        if version in applied or (target is not None and version > target):
+            continue
+        step()
+        db.session.add(SchemaMigration(version=version, name=name))
+        db.session.commit()
+        ran.append((version, name))
+    return ran
@@ -1,7 +1,21 @@
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event, false
+from sqlalchemy.engine import Engine
 from datetime import datetime
+import sqlite3
+from replica import RoutingSession
 
-db = SQLAlchemy()
+# Reads in @replica.reads views may go to the replica bind (see replica.py)
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+
+
+# SQLite only honours ON DELETE CASCADE with foreign keys switched on
+@event.listens_for(Engine, 'connect')
+def enable_sqlite_foreign_keys(dbapi_connection, connection_record):
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA foreign_keys=ON')
+        cursor.close()
 
 class User(db.Model):
     __tablename__ = 'users'
@@ -19,19 +33,183 @@ class Query(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(200))
     description = db.Column(db.Text)
-    student_id = db.Column(db.Integer, db.ForeignKey('users.id'))
+    student_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     answered = db.Column(db.Boolean, default=False)
+    # Maintained from the responses table by activity.py
+    response_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    first_response_at = db.Column(db.DateTime)
+    last_response_at = db.Column(db.DateTime)
 
-    student = db.relationship('User', backref='queries', lazy=True)
+    # Feed order, a student's own queries, the unanswered feed (partial:
+    # only pending rows) and ?sort=activity / active_since; see migrations.py
+    __table_args__ = (
+        db.Index('ix_queries_created', created_at, id),
+        db.Index('ix_queries_student_created', student_id, created_at),
+        db.Index('ix_queries_unanswered', created_at, id,
+                 postgresql_where=(answered == false()), sqlite_where=(answered == false())),
+        db.Index('ix_queries_last_response', last_response_at, id),
+    )
+
+    # Deleting a user deletes their queries in the database (ON DELETE CASCADE)
+    student = db.relationship('User', lazy=True, backref=db.backref(
+        'queries', lazy=True, cascade='all, delete-orphan', passive_deletes=True))
 
 class Response(db.Model):
     __tablename__ = 'responses'
     id = db.Column(db.Integer, primary_key=True)
-    query_id = db.Column(db.Integer, db.ForeignKey('queries.id'))
-    faculty_id = db.Column(db.Integer, db.ForeignKey('users.id'))
+    query_id = db.Column(db.Integer, db.ForeignKey('queries.id', ondelete='CASCADE'))
+    faculty_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'))
     content = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Counted from response_votes in batches by votes.py
+    helpful_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    verified_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    score = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+
+    # A query's responses in order, best first (GET /api/queries/<id>), and a
+    # faculty member's responses newest first (GET /api/queries/responses/my)
+    __table_args__ = (
+        db.Index('ix_responses_query_created', query_id, created_at),
+        db.Index('ix_responses_query_score', query_id, score.desc(), created_at, id),
+        db.Index('ix_responses_faculty_created', faculty_id, created_at, id),
+    )
+
+    # Responses go with their query or their author (ON DELETE CASCADE)
+    query = db.relationship('Query', lazy=True, backref=db.backref(
+        'responses', lazy=True, cascade='all, delete-orphan', passive_deletes=True,
+        order_by=(score.desc(), created_at, id)))
+    faculty = db.relationship('User', lazy=True, backref=db.backref(
+        'responses', lazy=True, cascade='all, delete-orphan', passive_deletes=True))
+
+class ForumStats(db.Model):
+    # Single-row counters table maintained by the write routes (see stats.py)
+    __tablename__ = 'forum_stats'
+    id = db.Column(db.Integer, primary_key=True)
+    students = db.Column(db.Integer, nullable=False, default=0)
+    faculty = db.Column(db.Integer, nullable=False, default=0)
+    admins = db.Column(db.Integer, nullable=False, default=0)
+    total_queries = db.Column(db.Integer, nullable=False, default=0)
+    answered_queries = db.Column(db.Integer, nullable=False, default=0)
+    total_responses = db.Column(db.Integer, nullable=False, default=0)
+
+
+class ChangeLog(db.Model):
+    # Append-only feed of query/response writes for delta sync (see changes.py)
+    __tablename__ = 'change_log'
+    id = db.Column(db.Integer, primary_key=True)
+    entity = db.Column(db.String(10), nullable=False)  # query, response
+    entity_id = db.Column(db.Integer, nullable=False)
+    op = db.Column(db.String(10), nullable=False)  # upsert, delete
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_change_log_created', created_at),
+        # Ids are sync cursors: SQLite must never hand out a deleted one again
+        {'sqlite_autoincrement': True},
+    )
+
+
+class TriageItem(db.Model):
+    # Pending-work queue: one row per unanswered query (see triage.py)
+    __tablename__ = 'triage_items'
+    query_id = db.Column(db.Integer, db.ForeignKey('queries.id', ondelete='CASCADE'), primary_key=True)
+    priority = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    claimed_by = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='SET NULL'), nullable=True)
+    lease_expires_at = db.Column(db.DateTime, nullable=True)
+
+    __table_args__ = (
+        db.Index('ix_triage_items_order', priority.desc(), created_at, query_id),
+        db.Index('ix_triage_items_claimed', claimed_by, lease_expires_at),
+    )
+
+
+class Job(db.Model):
+    # Durable status of background admin work (see jobs.py)
+    __tablename__ = 'jobs'
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)
+    params = db.Column(db.Text, nullable=False, default='{}')  # JSON
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued, running, succeeded, failed, cancelled
+    progress = db.Column(db.Integer, nullable=False, default=0)
+    progress_total = db.Column(db.Integer, nullable=True)
+    result = db.Column(db.Text, nullable=True)  # JSON
+    error = db.Column(db.Text, nullable=True)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=3)
+    cancel_requested = db.Column(db.Boolean, nullable=False, default=False)
+    created_by = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='SET NULL'), nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_jobs_status_created', status, created_at),
+        db.Index('ix_jobs_created', created_at, id),
+        db.Index('ix_jobs_created_by', created_by),
+    )
+
+
+class SchemaMigration(db.Model):
+    # Applied schema versions (see migrations.py)
+    __tablename__ = 'schema_migrations'
+    version = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    applied_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+
+class ResponseTimeRollup(db.Model):
+    # Hourly and daily time-to-first-response rollups (see analytics.py).
+    # faculty_id 0 is everyone; no foreign key, history outlives accounts.
+    __tablename__ = 'response_time_rollups'
+    granularity = db.Column(db.String(5), primary_key=True)  # hour, day
+    faculty_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    bucket_start = db.Column(db.DateTime, primary_key=True)
+    queries_created = db.Column(db.Integer, nullable=False, default=0)
+    first_responses = db.Column(db.Integer, nullable=False, default=0)
+    seconds_total = db.Column(db.Float, nullable=False, default=0)
+    sketch = db.Column(db.Text, nullable=False, default='{}')  # JSON, analytics.Sketch
+
+
+class Attachment(db.Model):
+    # Evidence file on a query or a response. The bytes live once per
+    # SHA-256 in the blob store (see attachments.py); rows only point at them.
+    __tablename__ = 'attachments'
+    id = db.Column(db.Integer, primary_key=True)
+    sha256 = db.Column(db.String(64), nullable=False)
+    size = db.Column(db.BigInteger, nullable=False)
+    content_type = db.Column(db.String(100), nullable=False)
+    filename = db.Column(db.String(255), nullable=False)
+    query_id = db.Column(db.Integer, db.ForeignKey('queries.id', ondelete='CASCADE'), nullable=True)
+    response_id = db.Column(db.Integer, db.ForeignKey('responses.id', ondelete='CASCADE'), nullable=True)
+    uploaded_by = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='SET NULL'), nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.CheckConstraint('(query_id IS NULL) <> (response_id IS NULL)', name='ck_attachments_one_parent'),
+        db.Index('ix_attachments_query', query_id),
+        db.Index('ix_attachments_response', response_id),
+        db.Index('ix_attachments_uploaded_by', uploaded_by),
+        db.Index('ix_attachments_sha256', sha256),
+    )
+
+
+class ResponseVote(db.Model):
+    # One vote per user per response; responses' counters follow in batches
+    # (see votes.py). counted is cleared on every change until a flush has
+    # recounted the response, so a crash never loses a vote from the counters.
+    __tablename__ = 'response_votes'
+    response_id = db.Column(db.Integer, db.ForeignKey('responses.id', ondelete='CASCADE'), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), primary_key=True)
+    helpful = db.Column(db.Boolean, nullable=False, default=False)
+    verified = db.Column(db.Boolean, nullable=False, default=False)  # faculty only
+    counted = db.Column(db.Boolean, nullable=False, default=False)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
 
-    query = db.relationship('Query', backref='responses', lazy=True)
-    faculty = db.relationship('User', backref='responses', lazy=True)
\ No newline at end of file
+    __table_args__ = (
+        db.Index('ix_response_votes_user', user_id),
+        db.Index('ix_response_votes_uncounted', response_id,
+                 postgresql_where=(counted == false()), sqlite_where=(counted == false())),
+    )
@@ -0,0 +1,225 @@
+from sqlalchemy import delete, func, or_
+from models import db, User, Query, Response, ResponseVote
+import activity
+import dedup
+import changes
+import events
+import identity
+import jobs
+import response_cache
+import search
+import stats
+import triage
+import votes
+
+# ------------------------------
+# Set-based deletes for admin moderation
+# ------------------------------
+# Every delete is a single DELETE ... WHERE id IN (...); the database removes
+# dependent rows through ON DELETE CASCADE (see models.py). Before each
+# statement we read just enough (ids, owners, counts) to keep the counters
+# table and search index right inside the same transaction, and to know
+# which caches to drop once the caller has committed.
+#
+#   batch = Moderation()
+#   batch.delete_queries([...]); batch.delete_users([...])
+#   db.session.commit()
+#   batch.apply()
+#
+# Batches run as the background job 'moderate' (see jobs.py). By default the
+# whole batch is one transaction, as the bulk endpoint promises: statements
+# still go CHUNK_SIZE ids at a time, and a failure or a cancel rolls every
+# one of them back. With "partial": true each chunk commits on its own
+# instead, so a huge purge holds no long transaction and reports progress;
+# the job result then lists the ids applied and those still pending, which
+# is what a failed or cancelled job leaves behind.
+
+CHUNK_SIZE = 500
+
+
+class Moderation:
+    def __init__(self):
+        self.deleted = {'queries': 0, 'responses': 0, 'users': 0}
+        self.removed_query_ids = set()
+        self.namespaces = set()
+        self.revoked_usernames = set()
+        self.revoked_user_ids = set()
+        self.reopened_query_ids = set()
+
+    def _execute(self, stmt):
+        return db.session.execute(stmt.execution_options(synchronize_session=False))
+
+    def _touch_queries(self, rows):
+        for query_id, student_id in rows:
+            self.namespaces.update(('feed', f'query:{query_id}', f'student:{student_id}'))
+
+    def _reindex(self, query_ids):
+        # Queries that keep existing but lost responses: recount their
+        # activity (no responses left means unanswered again) and reindex
+        query_ids = set(query_ids) - self.removed_query_ids
+        if not query_ids:
+            return
+        rows = db.session.query(Query.id, Query.student_id).filter(Query.id.in_(query_ids)).all()
+        query_ids = [query_id for query_id, _ in rows]
+        self._touch_queries(rows)
+        search.index_queries(query_ids)
+        changes.record('query', query_ids)
+
+        newly_answered, reopened = activity.recompute(query_ids)
+        triage.complete_many(newly_answered)
+        triage.requeue(reopened)
+        stats.bump(answered_queries=len(newly_answered) - len(reopened))
+        self.reopened_query_ids.update(reopened)
+        self.reopened_query_ids.difference_update(newly_answered)
+
+    # Book-keeping for queries about to disappear, directly or by cascade
+    def _forget_queries(self, condition):
+        rows = db.session.query(Query.id, Query.student_id, Query.answered).filter(condition).all()
+        if not rows:
+            return []
+        query_ids = [query_id for query_id, _, _ in rows]
+        response_count = db.session.query(func.count(Response.id)) \
+            .filter(Response.query_id.in_(query_ids)).scalar()
+
+        search.remove_queries(query_ids)
+        changes.record('query', query_ids, op='delete')
+        stats.bump(total_queries=-len(rows),
+                   answered_queries=-sum(1 for _, _, answered in rows if answered),
+                   total_responses=-response_count)
+
+        self.removed_query_ids.update(query_ids)
+        self._touch_queries((query_id, student_id) for query_id, student_id, _ in rows)
+        self.deleted['queries'] += len(rows)
+        self.deleted['responses'] += response_count
+        return query_ids
+
+    # Same for responses, skipping those already counted with their query
+    def _forget_responses(self, condition):
+        stmt = db.session.query(Response.id, Response.query_id).filter(condition)
+        if self.removed_query_ids:
+            stmt = stmt.filter(Response.query_id.notin_(self.removed_query_ids))
+        rows = stmt.all()
+        if rows:
+            changes.record('response', [response_id for response_id, _ in rows], op='delete')
+            stats.bump(total_responses=-len(rows))
+            self.deleted['responses'] += len(rows)
+        return rows
+
+    def delete_queries(self, query_ids):
+        query_ids = self._forget_queries(Query.id.in_(query_ids))
+        if query_ids:
+            self._execute(delete(Query).where(Query.id.in_(query_ids)))
+        return len(query_ids)
+
+    def delete_responses(self, response_ids):
+        rows = self._forget_responses(Response.id.in_(response_ids))
+        if rows:
+            self._execute(delete(Response).where(Response.id.in_([response_id for response_id, _ in rows])))
+            self._reindex(query_id for _, query_id in rows)
+        return len(rows)
+
+    # Remove everything a user posted but keep the account
+    def purge_users(self, user_ids):
+        query_ids = self._forget_queries(Query.student_id.in_(user_ids))
+        if query_ids:
+            self._execute(delete(Query).where(Query.id.in_(query_ids)))
+        rows = self._forget_responses(Response.faculty_id.in_(user_ids))
+        if rows:
+            self._execute(delete(Response).where(Response.id.in_([response_id for response_id, _ in rows])))
+            self._reindex(query_id for _, query_id in rows)
+        return len(query_ids) + len(rows)
+
+    def delete_users(self, user_ids):
+        rows = db.session.query(User.id, User.username, User.role).filter(User.id.in_(user_ids)).all()
+        if not rows:
+            return 0
+        user_ids = [user_id for user_id, _, _ in rows]
+
+        self._forget_queries(Query.student_id.in_(user_ids))
+        responses = self._forget_responses(Response.faculty_id.in_(user_ids))
+        voted = [response_id for (response_id,) in db.session.query(ResponseVote.response_id)
+                 .filter(ResponseVote.user_id.in_(user_ids)).distinct()]
+        # One statement: queries, responses and votes follow through ON DELETE CASCADE
+        self._execute(delete(User).where(User.id.in_(user_ids)))
+        self._reindex(query_id for _, query_id in responses)
+        # Their votes are gone with them; recount what they had voted on
+        self.namespaces.update(votes.namespaces(votes.recount(voted)))
+
+        role_deltas = {}
+        for _, _, role in rows:
+            for column, delta in stats.role_delta(role, -1).items():
+                role_deltas[column] = role_deltas.get(column, 0) + delta
+        stats.bump(**role_deltas)
+
+        self.revoked_usernames.update(username for _, username, _ in rows)
+        self.revoked_user_ids.update(user_ids)
+        self.deleted['users'] += len(rows)
+        return len(rows)
+
+    # Run after the caller commits
+    def apply(self):
+        for query_id in self.removed_query_ids:
+            dedup.duplicate_index.remove(query_id)
+        for query_id in self.reopened_query_ids - self.removed_query_ids:
+            dedup.duplicate_index.mark_answered(query_id, answered=False)
+        for username in self.revoked_usernames:
+            identity.revoke(username)
+        events.disconnect(self.revoked_user_ids)
+        if self.namespaces:
+            response_cache.invalidate(*self.namespaces)
+        if any(self.deleted.values()):
+            events.publish('content_removed', {'deleted': self.deleted,
+                                               'query_ids': sorted(self.removed_query_ids)},
+                           roles=('admin',))
+
+
+def _chunks(ids):
+    ids = sorted(ids)
+    for start in range(0, len(ids), CHUNK_SIZE):
+        yield ids[start:start + CHUNK_SIZE]
+
+
+# params: {"queries": [ids], "responses": [ids], "users": [ids],
+#          "purge_users": [ids], "partial": false}
+# Everything the users posted goes first, in chunks, so the final DELETE of
+# the accounts is small. Rows already gone (an earlier attempt) are skipped.
+@jobs.handler('moderate')
+def moderate_job(ctx, params):
+    users = set(params.get('users') or [])
+    authors = users | set(params.get('purge_users') or [])
+    query_ids = [query_id for (query_id,) in db.session.query(Query.id).filter(or_(
+        Query.id.in_(params.get('queries') or []), Query.student_id.in_(authors)))]
+    response_ids = [response_id for (response_id,) in db.session.query(Response.id).filter(or_(
+        Response.id.in_(params.get('responses') or []), Response.faculty_id.in_(authors)))]
+    user_ids = [user_id for (user_id,) in db.session.query(User.id).filter(User.id.in_(users))]
+    ctx.set_total(len(query_ids) + len(response_ids) + len(user_ids))
+
+    steps = [('queries', Moderation.delete_queries, query_ids),
+             ('responses', Moderation.delete_responses, response_ids),
+             ('users', Moderation.delete_users, user_ids)]
+    if not params.get('partial'):
+        batch = Moderation()
+        for _, method, ids in steps:
+            for chunk in _chunks(ids):
+                ctx.check()
+                method(batch, chunk)
+        db.session.commit()
+        batch.apply()
+        return {'partial': False, 'deleted': batch.deleted}
+
+    deleted = {'queries': 0, 'responses': 0, 'users': 0}
+    applied = {key: [] for key, _, _ in steps}
+    pending = {key: sorted(ids) for key, _, ids in steps}
+    for key, method, ids in steps:
+        for chunk in _chunks(ids):
+            batch = Moderation()
+            method(batch, chunk)
+            db.session.commit()
+            batch.apply()
+            for kind, count in batch.deleted.items():
+                deleted[kind] += count
+            applied[key] += chunk
+            pending[key] = pending[key][len(chunk):]
+            ctx.report({'partial': True, 'deleted': deleted, 'applied': applied, 'pending': pending})
+            ctx.advance(len(chunk))
+    return {'partial': True, 'deleted': deleted, 'applied': applied, 'pending': pending}
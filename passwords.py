@@ -0,0 +1,154 @@
+import bisect
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from flask import current_app, jsonify
+from werkzeug.security import generate_password_hash, check_password_hash
+
+# ------------------------------
+# Password hashing off the request thread
+# ------------------------------
+# Hashing is deliberately slow, so it runs on a small process pool instead of
+# the worker thread that also serves reads. At most PASSWORD_POOL_MAX_PENDING
+# hashes may be queued or running per worker; beyond that callers get
+# PoolBusy immediately (the routes answer 503) rather than piling up.
+# PASSWORD_POOL_SIZE = 0 hashes inline, as before.
+
+DEFAULT_METHOD = 'scrypt'
+DEFAULT_POOL_SIZE = max(1, (os.cpu_count() or 2) // 2)
+DEFAULT_MAX_PENDING = 64
+DEFAULT_TIMEOUT = 10
+
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+class PoolBusy(Exception):
+    pass
+
+
+class PasswordHasher:
+    def __init__(self, method=DEFAULT_METHOD, pool_size=DEFAULT_POOL_SIZE,
+                 max_pending=DEFAULT_MAX_PENDING, timeout=DEFAULT_TIMEOUT):
+        self.method = method
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.slots = threading.BoundedSemaphore(max_pending)
+        self.lock = threading.Lock()
+        self.executor = None
+        self._canonical_method = None
+
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+        self.latency_sum = 0.0
+        self.latency_counts = [0] * (len(LATENCY_BUCKETS) + 1)
+
+    def _get_executor(self):
+        # Created lazily so each forked web worker gets its own pool
+        with self.lock:
+            if self.executor is None:
+                self.executor = ProcessPoolExecutor(max_workers=self.pool_size)
+            return self.executor
+
+    def _record(self, elapsed):
+        with self.lock:
+            self.completed += 1
+            self.latency_sum += elapsed
+            self.latency_counts[bisect.bisect_left(LATENCY_BUCKETS, elapsed)] += 1
+
+    def _run(self, fn, *args):
+        if self.pool_size <= 0:
+            start = time.perf_counter()
+            result = fn(*args)
+            self._record(time.perf_counter() - start)
+            return result
+
+        if not self.slots.acquire(blocking=False):
+            with self.lock:
+                self.rejected += 1
+            raise PoolBusy('Password hashing queue is full')
+
+        start = time.perf_counter()
+        with self.lock:
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        try:
+            future = self._get_executor().submit(fn, *args)
+            try:
+                return future.result(timeout=self.timeout)
+            except FutureTimeout:
+                future.cancel()
+                raise PoolBusy('Password hashing timed out')
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+            self.slots.release()
+            self._record(time.perf_counter() - start)
+
+    @property
+    def canonical_method(self):
+        # e.g. 'scrypt' -> 'scrypt:32768:8:1', as werkzeug writes it into hashes
+        if self._canonical_method is None:
+            self._canonical_method = generate_password_hash('', method=self.method).split('$', 1)[0]
+        return self._canonical_method
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method)
+
+    # Hash a whole batch in parallel (bulk imports); bypasses the pending limit
+    def hash_many(self, passwords):
+        start = time.perf_counter()
+        if self.pool_size <= 0:
+            hashes = [generate_password_hash(p, self.method) for p in passwords]
+        else:
+            chunksize = max(1, len(passwords) // (self.pool_size * 4))
+            hashes = list(self._get_executor().map(
+                generate_password_hash, passwords, [self.method] * len(passwords), chunksize=chunksize
+            ))
+        if passwords:
+            self._record((time.perf_counter() - start) / len(passwords))
+        return hashes
+
+    def needs_rehash(self, stored_hash):
+        return stored_hash.split('$', 1)[0] != self.canonical_method
+
+    # Returns (matches, needs_rehash)
+    def verify(self, stored_hash, password):
+        matches = self._run(check_password_hash, stored_hash, password)
+        return matches, matches and self.needs_rehash(stored_hash)
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'pool_size': self.pool_size,
+                'method': self.method,
+                'in_flight': self.in_flight,
+                'peak_in_flight': self.peak_in_flight,
+                'completed': self.completed,
+                'rejected': self.rejected,
+                'latency_seconds_sum': round(self.latency_sum, 6),
+                'latency_buckets': dict(zip(
+                    [str(b) for b in LATENCY_BUCKETS] + ['+Inf'],
+                    self.latency_counts,
+                )),
+            }
+
+
+def get_hasher(app=None):
+    app = app or current_app
+    hasher = app.extensions.get('password_hasher')
+    if hasher is None:
+        hasher = PasswordHasher(
+            method=app.config.get('PASSWORD_HASH_METHOD', DEFAULT_METHOD),
+            pool_size=app.config.get('PASSWORD_POOL_SIZE', DEFAULT_POOL_SIZE),
+            max_pending=app.config.get('PASSWORD_POOL_MAX_PENDING', DEFAULT_MAX_PENDING),
+            timeout=app.config.get('PASSWORD_HASH_TIMEOUT', DEFAULT_TIMEOUT),
+        )
+        app.extensions['password_hasher'] = hasher
+    return hasher
+
+
+def busy_response():
+    return jsonify({'error': 'Server busy, please retry shortly'}), 503, {'Retry-After': '1'}
@@ -0,0 +1,202 @@
+import math
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from flask import current_app, jsonify, request
+from flask_jwt_extended import decode_token
+import metrics
+
+# ------------------------------
+# Admission control: token buckets per caller
+# ------------------------------
+# Write, auth and admin views are decorated with @ratelimit.limit('<bucket>').
+# Each request takes one token from the bucket of its client address and, if
+# it carries a valid JWT, from that user's bucket too. Login has no token
+# yet: its second bucket is keyed on (address, username), so nobody can spend
+# another user's logins from elsewhere. An empty bucket answers 429 with
+# Retry-After *before* the view runs, i.e. before the blocklist lookup, any
+# SQL or password hashing, so a looping client costs us one dict (or Redis)
+# operation per request.
+#
+#   RATE_LIMITS       bucket -> 'capacity/seconds', e.g. {'login': '10/60'}:
+#                     bursts of up to `capacity`, refilled evenly over `seconds`.
+#                     '<bucket>_addr' sets the client-address bucket apart,
+#                     e.g. login_addr, which a whole campus behind one NAT
+#                     shares at exam start
+#   RATE_LIMIT_URL    redis://... to share buckets between workers
+#   RATE_LIMIT_ENABLED
+#
+# The client address is request.remote_addr: behind a reverse proxy set
+# TRUSTED_PROXIES (see app.py) or every client shares the proxy's buckets.
+#
+# The decorator goes above @jwt_required so it runs first:
+#
+#   @query_bp.route('/new', methods=['POST'])
+#   @ratelimit.limit('post')
+#   @jwt_required()
+#   def create_query(): ...
+
+DEFAULT_LIMITS = {
+    'login': '10/60',
+    'login_addr': '300/60',
+    'post': '20/60',
+    'respond': '60/60',
+    'admin': '300/60',
+    'vote': '120/60',
+}
+MAX_ENTRIES = 100000
+
+
+def parse_limit(value):
+    try:
+        capacity, seconds = str(value).split('/')
+        capacity, seconds = int(capacity), float(seconds)
+    except ValueError:
+        raise ValueError(f"Invalid rate limit '{value}'. Use 'capacity/seconds', e.g. '10/60'")
+    if capacity < 1 or seconds <= 0:
+        raise ValueError(f"Invalid rate limit '{value}'. Capacity and seconds must be positive")
+    return capacity, capacity / seconds
+
+
+class LocalStore:
+    # In-process buckets; each worker enforces its own share
+    def __init__(self, max_entries=MAX_ENTRIES):
+        self.lock = threading.Lock()
+        self.max_entries = max_entries
+        self.buckets = OrderedDict()  # key -> (tokens, updated_at)
+
+    # Returns seconds until a token is available (0 = taken)
+    def take(self, key, capacity, rate):
+        now = time.monotonic()
+        with self.lock:
+            tokens, updated_at = self.buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated_at) * rate)
+            wait = 0.0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait = (1 - tokens) / rate
+            self.buckets[key] = (tokens, now)
+            self.buckets.move_to_end(key)
+            # Evicting the oldest bucket only ever forgives an idle caller
+            while len(self.buckets) > self.max_entries:
+                self.buckets.popitem(last=False)
+        return wait
+
+
+# Atomic refill-and-take; clock from the Redis server so workers agree
+_TAKE_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + (now - ts) * rate)
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil(capacity / rate * 1000))
+return tostring(wait)
+"""
+
+
+class RedisStore:
+    # Shared across workers; needs the optional `redis` package
+    def __init__(self, url, prefix='rl:'):
+        import redis
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+        self.script = self.client.register_script(_TAKE_SCRIPT)
+
+    def take(self, key, capacity, rate):
+        return float(self.script(keys=[self.prefix + key], args=[capacity, rate]))
+
+
+def get_store(app=None):
+    app = app or current_app
+    store = app.extensions.get('ratelimit')
+    if store is None:
+        url = app.config.get('RATE_LIMIT_URL')
+        store = RedisStore(url) if url else LocalStore()
+        app.extensions['ratelimit'] = store
+    return store
+
+
+def get_limits(app=None):
+    app = app or current_app
+    limits = app.extensions.get('ratelimit_limits')
+    if limits is None:
+        configured = dict(DEFAULT_LIMITS, **(app.config.get('RATE_LIMITS') or {}))
+        limits = {bucket: parse_limit(value) for bucket, value in configured.items() if value}
+        app.extensions['ratelimit_limits'] = limits
+    return limits
+
+
+def _token_identity():
+    # Signature and expiry only: the blocklist (and its DB lookup) is for the view
+    header = request.headers.get('Authorization', '')
+    if not header.startswith('Bearer '):
+        return None
+    try:
+        claims = decode_token(header[len('Bearer '):])
+        return claims.get(current_app.config.get('JWT_IDENTITY_CLAIM', 'sub'))
+    except Exception:
+        return None
+
+
+# [(store key, limit name)] charged for this request
+def caller_keys(bucket):
+    addr = request.remote_addr
+    limits = get_limits()
+    keys = [(f'{bucket}:addr:{addr}', f'{bucket}_addr' if f'{bucket}_addr' in limits else bucket)]
+    username = _token_identity()
+    if isinstance(username, str):
+        keys.append((f'{bucket}:user:{username}', bucket))
+    elif bucket == 'login':
+        # Unauthenticated: the username is only a claim, so scope it to the address
+        data = request.get_json(force=True, silent=True)
+        if isinstance(data, dict) and isinstance(data.get('username'), str) and data['username'].strip():
+            keys.append((f'{bucket}:user:{addr}:{data["username"].strip().lower()}', bucket))
+    return keys
+
+
+# Seconds the caller must wait before `bucket` admits them (0 = admitted)
+def check(bucket):
+    limits = get_limits()
+    store = get_store()
+    wait = 0.0
+    for key, name in caller_keys(bucket):
+        try:
+            wait = max(wait, store.take(key, *limits[name]))
+        except Exception as e:
+            # A limiter outage must not take the API down with it
+            current_app.logger.warning('Rate limiter unavailable, admitting request: %s', e)
+            metrics.get_registry().record_limit(bucket, 'error')
+            return 0.0
+    metrics.get_registry().record_limit(bucket, 'rejected' if wait else 'allowed')
+    return wait
+
+
+def too_many_requests(wait):
+    retry_after = max(1, math.ceil(wait))
+    return jsonify({'error': 'Too many requests, please retry shortly'}), 429, {'Retry-After': str(retry_after)}
+
+
+def limit(bucket):
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if current_app.config.get('RATE_LIMIT_ENABLED', True) and bucket in get_limits():
+                wait = check(bucket)
+                if wait:
+                    return too_many_requests(wait)
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,129 @@
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from flask import current_app, g, has_request_context, request
+from flask_jwt_extended import get_jwt_identity
+from flask_sqlalchemy.session import Session
+
+# ------------------------------
+# Read-replica routing with read-your-writes stickiness
+# ------------------------------
+# With REPLICA_DATABASE_URL set, views decorated with @replica.reads(...) send
+# their SELECTs to the replica; everything else (and every flush) uses the
+# primary. A view falls back to the primary for REPLICA_STICKY_SECONDS when
+#   - the caller (JWT identity or client address) wrote something, or
+#   - one of the cache namespaces the view depends on was invalidated,
+# so nobody reads their own write from a lagging replica and a stale replica
+# row never gets cached under a fresh ETag. Like identity.py the caller state
+# is per worker; the window only has to outlast the replication lag.
+#
+# Namespace writes must be seen by every worker, though: with a shared
+# response cache (RESPONSE_CACHE_URL) the write bumps the version in Redis,
+# and a worker that did not see the write would render the new version from
+# the lagging replica and store that for everyone. So the Redis backend also
+# keeps a per-namespace marker for the window, and reads() checks it.
+#
+#   @query_bp.route('/<int:query_id>')
+#   @jwt_required(optional=True)
+#   @replica.reads(lambda query_id: [f'query:{query_id}'])
+#   def get_query(query_id): ...
+
+BIND_KEY = 'replica'
+DEFAULT_STICKY_SECONDS = 5
+MAX_ENTRIES = 10000
+READ_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+_lock = threading.Lock()
+_recent = OrderedDict()  # 'user:<name>' / 'addr:<ip>' / 'ns:<namespace>' -> expires_at
+
+
+class RoutingSession(Session):
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and _wants_replica(clause):
+            return self._db.engines[BIND_KEY]
+        return super().get_bind(mapper, clause=clause, bind=bind, **kwargs)
+
+
+def _wants_replica(clause):
+    if not has_request_context() or not g.get('db_replica'):
+        return False
+    if clause is None or getattr(clause, 'is_select', False):
+        return True
+    # Raw text(): only plain SELECTs (search) may leave the primary
+    sql = getattr(clause, 'text', None)
+    return sql is not None and sql.lstrip().upper().startswith('SELECT')
+
+
+def enabled(app=None):
+    app = app or current_app
+    return bool(app.config.get('REPLICA_DATABASE_URL'))
+
+
+def sticky_seconds():
+    return current_app.config.get('REPLICA_STICKY_SECONDS', DEFAULT_STICKY_SECONDS)
+
+
+def _caller_keys():
+    keys = [f'addr:{request.remote_addr}']
+    try:
+        username = get_jwt_identity()
+    except RuntimeError:
+        # JWT not verified for this view
+        username = None
+    if isinstance(username, str):
+        keys.append(f'user:{username}')
+    return keys
+
+
+def _remember(keys):
+    expires_at = time.monotonic() + sticky_seconds()
+    with _lock:
+        for key in keys:
+            _recent[key] = expires_at
+            _recent.move_to_end(key)
+        while len(_recent) > MAX_ENTRIES:
+            _recent.popitem(last=False)
+
+
+def _any_recent(keys):
+    now = time.monotonic()
+    with _lock:
+        return any(_recent.get(key, 0) > now for key in keys)
+
+
+# Called by response_cache.invalidate() after every committed write
+def note_writes(namespaces):
+    if has_request_context() and enabled():
+        _remember(f'ns:{ns}' for ns in namespaces)
+
+
+def reads(namespaces=None):
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if enabled():
+                keys = _caller_keys()
+                depends = namespaces(**kwargs) if namespaces else []
+                keys += [f'ns:{ns}' for ns in depends]
+                g.db_replica = not _any_recent(keys) and not _written_elsewhere(depends)
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _written_elsewhere(namespaces):
+    if not namespaces:
+        return False
+    import response_cache  # here: response_cache imports this module
+    return response_cache.recently_written(namespaces)
+
+
+def _after_request(response):
+    if request.method not in READ_METHODS and response.status_code < 400 and enabled():
+        _remember(_caller_keys())
+    return response
+
+
+def init_app(app):
+    app.after_request(_after_request)
@@ -0,0 +1,196 @@
+import hashlib
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from functools import wraps
+from flask import current_app, request
+from flask_jwt_extended import get_jwt_identity
+import replica
+
+# ------------------------------
+# Version-based ETags + serialized payload cache for read endpoints
+# ------------------------------
+# Each cached view names the "namespaces" its payload depends on, e.g.
+#   feed          -> any query/response change (GET /api/queries/)
+#   query:<id>    -> one query and its responses (GET /api/queries/<id>)
+#   student:<id>  -> one student's queries (GET /api/queries/my)
+# Write routes call invalidate(...) after commit to bump those versions. The
+# ETag is derived from the versions alone, so a matching If-None-Match is
+# answered with 304 before the view runs, and a cache hit replays the stored
+# JSON bytes without touching the database or the encoder.
+#
+# Without RESPONSE_CACHE_URL the versions live in this worker's memory and
+# only its own writes bump them, so under several gunicorn workers another
+# worker keeps answering from (and 304-ing against) what it saw last. The
+# local backend therefore rolls its epoch every RESPONSE_CACHE_LOCAL_TTL
+# seconds, which expires every ETag and entry it handed out: across workers
+# a payload is at most that stale. Multi-worker deployments should set
+# RESPONSE_CACHE_URL; get_backend() warns when WEB_CONCURRENCY says there
+# is more than one worker and it is missing.
+
+DEFAULT_CACHE_SIZE = 512
+DEFAULT_LOCAL_TTL = 5
+CACHED_HEADERS = ('X-Next-Cursor',)
+
+
+class LocalBackend:
+    # Bounded in-process LRU; versions only cover this worker, so ETags and
+    # entries last `ttl` seconds at most (0 = until evicted, one worker only)
+    def __init__(self, max_entries=DEFAULT_CACHE_SIZE, ttl=DEFAULT_LOCAL_TTL):
+        self.lock = threading.Lock()
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.versions = {}
+        # New per process so a restarted worker never reuses old ETags
+        self.process = uuid.uuid4().hex[:8]
+
+    # Part of every ETag (and so of every entry key); rolls over each ttl
+    @property
+    def epoch(self):
+        if not self.ttl:
+            return self.process
+        return f'{self.process}.{int(time.time() // self.ttl)}'
+
+    def get_versions(self, namespaces):
+        with self.lock:
+            return [self.versions.get(ns, 0) for ns in namespaces]
+
+    def bump(self, namespaces, hold=0):
+        with self.lock:
+            for ns in namespaces:
+                self.versions[ns] = self.versions.get(ns, 0) + 1
+
+    # Only this worker bumps these versions, and replica.py already tracks
+    # its writes
+    def recently_bumped(self, namespaces):
+        return False
+
+    def get(self, key):
+        with self.lock:
+            value = self.entries.get(key)
+            if value is not None:
+                self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+
+class RedisBackend:
+    # Shared across workers; needs the optional `redis` package
+    def __init__(self, url, ttl=300, prefix='rc:'):
+        import redis
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+        self.client.set(prefix + 'epoch', uuid.uuid4().hex[:8], nx=True)
+        self.epoch = self.client.get(prefix + 'epoch').decode()
+
+    def get_versions(self, namespaces):
+        values = self.client.mget([self.prefix + 'v:' + ns for ns in namespaces])
+        return [int(v) if v is not None else 0 for v in values]
+
+    # hold: seconds to report the namespaces as recently_bumped, so every
+    # worker keeps renders of them off the replica (see replica.py)
+    def bump(self, namespaces, hold=0):
+        pipe = self.client.pipeline()
+        for ns in namespaces:
+            pipe.incr(self.prefix + 'v:' + ns)
+            if hold:
+                pipe.set(self.prefix + 'w:' + ns, 1, px=int(hold * 1000))
+        pipe.execute()
+
+    def recently_bumped(self, namespaces):
+        return bool(namespaces) and bool(self.client.exists(*[self.prefix + 'w:' + ns for ns in namespaces]))
+
+    def get(self, key):
+        raw = self.client.hgetall(self.prefix + 'p:' + key)
+        if not raw:
+            return None
+        body = raw.pop(b'__body__')
+        return body, {k.decode(): v.decode() for k, v in raw.items()}
+
+    def set(self, key, value):
+        body, headers = value
+        name = self.prefix + 'p:' + key
+        pipe = self.client.pipeline()
+        pipe.hset(name, mapping=dict(headers, __body__=body))
+        pipe.expire(name, self.ttl)
+        pipe.execute()
+
+
+def get_backend(app=None):
+    app = app or current_app
+    backend = app.extensions.get('response_cache')
+    if backend is None:
+        url = app.config.get('RESPONSE_CACHE_URL')
+        if url:
+            backend = RedisBackend(url, ttl=app.config.get('RESPONSE_CACHE_TTL', 300))
+        else:
+            if int(os.environ.get('WEB_CONCURRENCY') or 1) > 1:
+                app.logger.warning('RESPONSE_CACHE_URL is not set but WEB_CONCURRENCY=%s: each worker caches '
+                                   'on its own and may serve responses up to %ss stale',
+                                   os.environ['WEB_CONCURRENCY'],
+                                   app.config.get('RESPONSE_CACHE_LOCAL_TTL', DEFAULT_LOCAL_TTL))
+            backend = LocalBackend(app.config.get('RESPONSE_CACHE_SIZE', DEFAULT_CACHE_SIZE),
+                                   ttl=app.config.get('RESPONSE_CACHE_LOCAL_TTL', DEFAULT_LOCAL_TTL))
+        app.extensions['response_cache'] = backend
+    return backend
+
+
+def invalidate(*namespaces):
+    namespaces = [ns for ns in namespaces if ns]
+    get_backend().bump(namespaces, hold=replica.sticky_seconds() if replica.enabled() else 0)
+    replica.note_writes(namespaces)
+
+
+# Whether any worker invalidated one of these within the replica window
+def recently_written(namespaces):
+    return get_backend().recently_bumped(namespaces)
+
+
+def make_etag(backend, namespaces, vary_identity):
+    versions = backend.get_versions(namespaces)
+    parts = [backend.epoch, request.path, request.query_string.decode(),
+             ','.join(f'{ns}={v}' for ns, v in zip(namespaces, versions))]
+    if vary_identity:
+        parts.append(str(get_jwt_identity()))
+    return hashlib.sha1('|'.join(parts).encode()).hexdigest()[:20]
+
+
+# `namespaces` receives the view's URL kwargs and returns the namespaces the
+# payload depends on. Only 200 responses are stored.
+def cached(namespaces, vary_identity=False):
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            backend = get_backend()
+            etag = make_etag(backend, namespaces(**kwargs), vary_identity)
+
+            if request.if_none_match.contains(etag):
+                response = current_app.response_class(status=304)
+            else:
+                hit = backend.get(etag)
+                if hit is None:
+                    response = current_app.make_response(view(*args, **kwargs))
+                    if response.status_code != 200:
+                        return response
+                    headers = {h: response.headers[h] for h in CACHED_HEADERS if h in response.headers}
+                    backend.set(etag, (response.get_data(), headers))
+                else:
+                    body, headers = hit
+                    response = current_app.response_class(body, mimetype='application/json')
+                    response.headers.update(headers)
+
+            response.set_etag(etag)
+            response.headers['Cache-Control'] = 'private, no-cache'
+            return response
+        return wrapper
+    return decorator
@@ -1,6 +1,15 @@
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, current_app, jsonify, request, stream_with_context
 from flask_jwt_extended import jwt_required, get_jwt_identity, get_jwt
-from models import db, User, Query, Response
+from models import db, User
+import stats
+import identity
+import events
+import passwords
+import replica
+import jobs
+import export
+import analytics
+import ratelimit
 
 admin_bp = Blueprint('admin_bp', __name__)
 
@@ -15,30 +24,28 @@ def is_admin():
 # 📊 Admin Dashboard Overview
 # --------------------------
 @admin_bp.route('/overview', methods=['GET'])
+@ratelimit.limit('admin')
 @jwt_required()
+@replica.reads()
 def admin_overview():
     if not is_admin():
         return jsonify({'error': 'Access forbidden: Admins only'}), 403
 
-    user_count = User.query.count()
-    query_count = Query.query.count()
-    response_count = Response.query.count()
-    answered_count = Query.query.filter_by(answered=True).count()
-    pending_count = query_count - answered_count
-
-    stats = {
-        'total_users': user_count,
-        'total_queries': query_count,
-        'total_responses': response_count,
-        'answered_queries': answered_count,
-        'pending_queries': pending_count
+    counters = stats.read_stats()
+    overview = {
+        'total_users': counters.students + counters.faculty + counters.admins,
+        'total_queries': counters.total_queries,
+        'total_responses': counters.total_responses,
+        'answered_queries': counters.answered_queries,
+        'pending_queries': counters.total_queries - counters.answered_queries
     }
-    return jsonify(stats), 200
+    return jsonify(overview), 200
 
 # --------------------------
 # 👥 View All Users
 # --------------------------
 @admin_bp.route('/users', methods=['GET'])
+@ratelimit.limit('admin')
 @jwt_required()
 def view_users():
     if not is_admin():
@@ -52,6 +59,7 @@ def view_users():
 # 🔄 Promote or Demote User
 # --------------------------
 @admin_bp.route('/user/<int:user_id>/role', methods=['PUT'])
+@ratelimit.limit('admin')
 @jwt_required()
 def update_user_role(user_id):
     if not is_admin():
@@ -67,14 +75,22 @@ def update_user_role(user_id):
     if not user:
         return jsonify({'error': 'User not found'}), 404
 
+    old_role = user.role
     user.role = new_role
+    if old_role != new_role:
+        stats.bump(**stats.role_delta(old_role, -1), **stats.role_delta(new_role, 1))
     db.session.commit()
+    identity.invalidate(user.username)
+    if old_role != new_role:
+        # Their stream was subscribed with the old role's audience
+        events.disconnect([user.id])
     return jsonify({'message': f"User '{user.username}' role updated to {new_role}"}), 200
 
 # --------------------------
 # ❌ Delete User
 # --------------------------
 @admin_bp.route('/user/<int:user_id>', methods=['DELETE'])
+@ratelimit.limit('admin')
 @jwt_required()
 def delete_user(user_id):
     if not is_admin():
@@ -84,6 +100,142 @@ def delete_user(user_id):
     if not user:
         return jsonify({'error': 'User not found'}), 404
 
-    db.session.delete(user)
-    db.session.commit()
-    return jsonify({'message': f"User '{user.username}' deleted successfully"}), 200
\ No newline at end of file
+    # Removes the user and their queries and responses in the background
+    username = user.username
+    admin = identity.current_user()
+    job = jobs.enqueue('moderate', {'users': [user_id]}, created_by=admin.id if admin else None)
+    return jsonify({'message': f"User '{username}' is being deleted", 'job': jobs.serialize_job(job)}), 202, \
+        {'Location': f'/api/admin/jobs/{job.id}'}
+
+# --------------------------
+# 🔑 Password Hashing Pool Metrics
+# --------------------------
+@admin_bp.route('/password_pool', methods=['GET'])
+@ratelimit.limit('admin')
+@jwt_required()
+def password_pool_metrics():
+    if not is_admin():
+        return jsonify({'error': 'Access forbidden: Admins only'}), 403
+
+    return jsonify(passwords.get_hasher().snapshot()), 200
+
+# --------------------------
+# 📦 Full-Forum Export (streamed)
+# --------------------------
+# ?format=ndjson|csv&entity=queries,responses,users&since=&until=&gzip=true
+@admin_bp.route('/export', methods=['GET'])
+@ratelimit.limit('admin')
+@jwt_required()
+@replica.reads()
+def export_forum():
+    if not is_admin():
+        return jsonify({'error': 'Access forbidden: Admins only'}), 403
+
+    try:
+        args = export.parse_export_args(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    name = export.filename(args['entities'], args['fmt'], args['gzip'])
+    return current_app.response_class(
+        stream_with_context(export.iter_export(**args)),
+        mimetype=export.mimetype(args['fmt'], args['gzip']),
+        headers={'Content-Disposition': f'attachment; filename="{name}"',
+                 'Cache-Control': 'no-store', 'X-Accel-Buffering': 'no'},
+    )
+
+# --------------------------
+# ⏳ Background Jobs
+# --------------------------
+@admin_bp.route('/jobs', methods=['GET'])
+@ratelimit.limit('admin')
+@jwt_required()
+def list_jobs():
+    if not is_admin():
+        return jsonify({'error': 'Access forbidden: Admins only'}), 403
+
+    status = request.args.get('status')
+    if status is not None and status not in jobs.STATUSES:
+        return jsonify({'error': f"Invalid status. Use {', '.join(jobs.STATUSES)}"}), 400
+    try:
+        limit = min(max(int(request.args.get('limit', 50)), 1), 200)
+    except ValueError:
+        return jsonify({'error': 'limit must be an integer'}), 400
+    return jsonify([jobs.serialize_job(job) for job in jobs.recent(limit, status)]), 200
+
+@admin_bp.route('/jobs/<int:job_id>', methods=['GET'])
+@ratelimit.limit('admin')
+@jwt_required()
+def get_job(job_id):
+    if not is_admin():
+        return jsonify({'error': 'Access forbidden: Admins only'}), 403
+
+    try:
+        return jsonify(jobs.serialize_job(jobs.get(job_id))), 200
+    except jobs.JobNotFound as e:
+        return jsonify({'error': str(e)}), 404
+
+@admin_bp.route('/jobs/<int:job_id>/cancel', methods=['POST'])
+@ratelimit.limit('admin')
+@jwt_required()
+def cancel_job(job_id):
+    if not is_admin():
+        return jsonify({'error': 'Access forbidden: Admins only'}), 403
+
+    try:
+        return jsonify(jobs.serialize_job(jobs.cancel(job_id))), 200
+    except jobs.JobNotFound as e:
+        return jsonify({'error': str(e)}), 404
+    except jobs.JobStateError as e:
+        return jsonify({'error': str(e)}), 409
+
+@admin_bp.route('/jobs/<int:job_id>/retry', methods=['POST'])
+@ratelimit.limit('admin')
+@jwt_required()
+def retry_job(job_id):
+    if not is_admin():
+        return jsonify({'error': 'Access forbidden: Admins only'}), 403
+
+    try:
+        return jsonify(jobs.serialize_job(jobs.retry(job_id))), 202
+    except jobs.JobNotFound as e:
+        return jsonify({'error': str(e)}), 404
+    except jobs.JobStateError as e:
+        return jsonify({'error': str(e)}), 409
+
+# --------------------------
+# ⏱️ Response-Time Analytics
+# --------------------------
+# ?granularity=hour|day&since=&until=&faculty_id= (0 or absent: everyone)
+@admin_bp.route('/analytics/response-times', methods=['GET'])
+@ratelimit.limit('admin')
+@jwt_required()
+@replica.reads()
+def response_time_series():
+    if not is_admin():
+        return jsonify({'error': 'Access forbidden: Admins only'}), 403
+
+    try:
+        window = analytics.parse_window(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({
+        'granularity': window['granularity'],
+        'faculty_id': window['faculty_id'],
+        'buckets': analytics.series(**window),
+    }), 200
+
+# p50/p90 over the window, per faculty member, plus the pending backlog
+@admin_bp.route('/analytics/response-times/summary', methods=['GET'])
+@ratelimit.limit('admin')
+@jwt_required()
+@replica.reads()
+def response_time_summary():
+    if not is_admin():
+        return jsonify({'error': 'Access forbidden: Admins only'}), 403
+
+    try:
+        window = analytics.parse_window(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(analytics.summary(window['granularity'], window['since'], window['until'])), 200
@@ -0,0 +1,104 @@
+from flask import Blueprint, request, jsonify, current_app
+from flask_jwt_extended import jwt_required, get_jwt
+from models import db, Attachment, Query, Response
+import attachments
+import identity
+import ratelimit
+import replica
+
+attachment_bp = Blueprint('attachment_bp', __name__)
+
+
+# The upload is the raw request body (not multipart), so it streams straight
+# into the blob store; name it with X-Filename or ?filename=
+def upload(**parent):
+    limit = attachments.max_bytes()
+    if request.content_length is not None and request.content_length > limit:
+        return jsonify({'error': f'Attachments are limited to {limit} bytes'}), 413
+    if request.mimetype.startswith('multipart/'):
+        return jsonify({'error': 'Send the file itself as the request body, with its Content-Type'}), 415
+
+    user = identity.current_user()
+    filename = request.headers.get('X-Filename') or request.args.get('filename')
+    try:
+        attachment, stored = attachments.save(request.stream, request.mimetype, filename,
+                                              uploaded_by=user.id, **parent)
+    except attachments.UnsupportedType as e:
+        return jsonify({'error': str(e)}), 415
+    except attachments.AttachmentTooLarge as e:
+        return jsonify({'error': str(e)}), 413
+    except attachments.EmptyAttachment as e:
+        return jsonify({'error': str(e)}), 400
+
+    result = attachments.serialize_attachment(attachment)
+    result['deduplicated'] = not stored
+    return jsonify(result), 201, {'Location': result['url']}
+
+
+# Students attach evidence to their own queries
+@attachment_bp.route('/queries/<int:query_id>', methods=['POST'])
+@ratelimit.limit('post')
+@jwt_required()
+def upload_query_attachment(query_id):
+    query = db.session.get(Query, query_id)
+    if not query:
+        return jsonify({'error': 'Query not found'}), 404
+    user = identity.current_user()
+    if not user or query.student_id != user.id:
+        return jsonify({'error': 'Access forbidden: only the author can attach files'}), 403
+    return upload(query_id=query.id)
+
+
+# Faculty attach sources to their own responses
+@attachment_bp.route('/responses/<int:response_id>', methods=['POST'])
+@ratelimit.limit('respond')
+@jwt_required()
+def upload_response_attachment(response_id):
+    response = db.session.get(Response, response_id)
+    if not response:
+        return jsonify({'error': 'Response not found'}), 404
+    user = identity.current_user()
+    if not user or response.faculty_id != user.id:
+        return jsonify({'error': 'Access forbidden: only the author can attach files'}), 403
+    return upload(response_id=response.id)
+
+
+# Everything attached to a query and its responses
+@attachment_bp.route('/queries/<int:query_id>', methods=['GET'])
+@jwt_required(optional=True)
+@replica.reads()
+def list_query_attachments(query_id):
+    if db.session.get(Query, query_id) is None:
+        return jsonify({'error': 'Query not found'}), 404
+    return jsonify([attachments.serialize_attachment(a) for a in attachments.for_query(query_id)]), 200
+
+
+# The file itself: Range, If-None-Match and an immutable Cache-Control
+@attachment_bp.route('/<int:attachment_id>', methods=['GET'])
+@jwt_required(optional=True)
+@replica.reads()
+def download_attachment(attachment_id):
+    attachment = db.session.get(Attachment, attachment_id)
+    if not attachment:
+        return jsonify({'error': 'Attachment not found'}), 404
+    response = attachments.send(attachment)
+    if response is None:
+        current_app.logger.error('Blob %s of attachment %s is missing', attachment.sha256, attachment_id)
+        return jsonify({'error': 'Attachment content is missing'}), 404
+    return response
+
+
+# The uploader or an admin; the blob goes at the next gc-attachments
+@attachment_bp.route('/<int:attachment_id>', methods=['DELETE'])
+@ratelimit.limit('post')
+@jwt_required()
+def delete_attachment(attachment_id):
+    attachment = db.session.get(Attachment, attachment_id)
+    if not attachment:
+        return jsonify({'error': 'Attachment not found'}), 404
+    user = identity.current_user()
+    if not user or (attachment.uploaded_by != user.id and get_jwt().get('role') != 'admin'):
+        return jsonify({'error': 'Access forbidden'}), 403
+    db.session.delete(attachment)
+    db.session.commit()
+    return jsonify({'message': 'Attachment deleted'}), 200
@@ -1,12 +1,16 @@
 from flask import Blueprint, request, jsonify
-from werkzeug.security import generate_password_hash, check_password_hash
 from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity, get_jwt
 from models import db, User
+import stats
+import identity
+import passwords
+import ratelimit
 
 auth_bp = Blueprint('auth_bp', __name__)
 
 # ✅ Register a new user
 @auth_bp.route('/register', methods=['POST'])
+@ratelimit.limit('login')
 def register():
     data = request.get_json()
 
@@ -17,19 +21,26 @@ def register():
     if User.query.filter_by(username=data['username']).first():
         return jsonify({'error': 'Username already exists'}), 400
 
-    hashed_pw = generate_password_hash(data['password'])
     role = data['role'].lower().strip()
     if role not in ['student', 'faculty', 'admin']:
         return jsonify({'error': 'Invalid role. Must be student, faculty, or admin.'}), 400
+
+    try:
+        hashed_pw = passwords.get_hasher().hash(data['password'])
+    except passwords.PoolBusy:
+        return passwords.busy_response()
     new_user = User(username=data['username'], password_hash=hashed_pw, role=role)
     db.session.add(new_user)
+    stats.bump(**stats.role_delta(role, 1))
     db.session.commit()
+    identity.restore(new_user.username)
 
     return jsonify({'message': f"User '{data['username']}' registered successfully!"}), 201
 
 
 # ✅ Login existing user
 @auth_bp.route('/login', methods=['POST'])
+@ratelimit.limit('login')
 def login():
     data = request.get_json(force=True)
     username = data.get('username', '').strip()
@@ -52,7 +63,12 @@ def login():
     if not user:
         return jsonify({'error': 'User not found'}), 404
 
-    if not check_password_hash(user.password_hash, password):
+    hasher = passwords.get_hasher()
+    try:
+        matches, needs_rehash = hasher.verify(user.password_hash, password)
+    except passwords.PoolBusy:
+        return passwords.busy_response()
+    if not matches:
         return jsonify({'error': 'Incorrect password'}), 401
 
     # ✅ Ensure strict role matching
@@ -62,6 +78,15 @@ def login():
     if not user.active:
         return jsonify({'error': 'Account suspended. Contact admin.'}), 403
 
+    # Upgrade hashes made with an older method/cost while we have the password,
+    # only for logins that go through (no writes for refused ones)
+    if needs_rehash:
+        try:
+            user.password_hash = hasher.hash(password)
+            db.session.commit()
+        except passwords.PoolBusy:
+            pass
+
     # ✅ Generate JWT token
     token = create_access_token(identity=user.username, additional_claims={"role": user.role})
 
@@ -0,0 +1,53 @@
+from flask import Blueprint, request, jsonify, current_app
+from flask_jwt_extended import jwt_required, get_jwt_identity
+import events
+import identity
+
+events_bp = Blueprint('events_bp', __name__)
+
+
+# A short-lived ticket to open the event stream with (see events.py)
+@events_bp.route('/ticket', methods=['POST'])
+@jwt_required()
+def stream_ticket():
+    user = identity.current_user()
+    if not user:
+        return jsonify({'error': 'User not found'}), 404
+    return jsonify({'ticket': events.issue_ticket(user.username, user.role),
+                    'expires_in': events.ticket_seconds()}), 201
+
+
+# Server-Sent Events stream scoped to the logged-in user (see events.py)
+# EventSource can't send headers, so browsers pass ?ticket=<stream ticket>
+@events_bp.route('', methods=['GET'])
+@jwt_required(optional=True)
+def event_stream():
+    ticket = request.args.get('ticket')
+    if ticket:
+        try:
+            payload = events.redeem_ticket(ticket)
+        except events.InvalidTicket as e:
+            return jsonify({'error': str(e)}), 401
+        # Same checks as a JWT: deleted, suspended or re-roled since issued
+        if identity.is_token_revoked(None, payload):
+            return jsonify({'error': 'Session is no longer valid. Please log in again.'}), 401
+    elif get_jwt_identity() is None:
+        return jsonify({'error': 'Send a bearer token or ?ticket= from POST /api/events/ticket'}), 401
+
+    user = identity.current_user()
+    if not user:
+        return jsonify({'error': 'User not found'}), 404
+
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    try:
+        last_event_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        return jsonify({'error': 'Last-Event-ID must be an integer'}), 400
+
+    broker = events.get_broker()
+    sub, backlog = broker.subscribe(user.id, user.role, last_event_id)
+    return current_app.response_class(
+        events.stream(broker, sub, backlog),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
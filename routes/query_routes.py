@@ -1,20 +1,34 @@
-from flask import Blueprint, request, jsonify
-from flask_jwt_extended import jwt_required, get_jwt_identity, get_jwt
+from flask import Blueprint, request, jsonify, current_app
+from flask_jwt_extended import jwt_required, get_jwt
 from models import db, Query, Response, User
-from werkzeug.security import generate_password_hash
+from feed import (fetch_query_page, fetch_response_page, parse_feed_args, parse_response_args,
+                  page_headers, response_summary, summary_headers)
+from serializers import (FULL, parse_fieldset, query_load_options, serialize_faculty_response,
+                         serialize_query, timestamp)
+import stats
+import search
+import dedup
+import response_cache
+import identity
+import passwords
+import bulk_import
+from moderation import Moderation
+import events
+import changes
+import triage
+import activity
+import analytics
+import votes
+import replica
+import jobs
+import ratelimit
+import io
 from datetime import datetime, timezone
 from dateutil.relativedelta import relativedelta
 
 query_bp = Blueprint('query_bp', __name__)
 
 
-# Safe JWT identity helper
-def get_current_username():
-    identity = get_jwt_identity()
-    if isinstance(identity, dict):
-        return identity.get("username")
-    return identity
-
 # Helper functions for role-based access
 def is_student():
     claims = get_jwt()
@@ -24,38 +38,90 @@ def is_faculty():
     claims = get_jwt()
     return claims.get('role') == 'faculty'
 
+def current_user_id():
+    user = identity.current_user()
+    return user.id if user else None
+
+# Cache namespaces invalidated by writes to a query (see response_cache.py)
+def query_namespaces(query):
+    return ['feed', f'query:{query.id}', f'student:{query.student_id}']
 
 
-# Get all queries (for all users)
+
+# Get all queries (for all users) — keyset paginated, see feed.py
 @query_bp.route('/', methods=['GET'])
 @jwt_required(optional=True)
+@replica.reads(lambda: ['feed'])
+@response_cache.cached(lambda: ['feed'])
 def get_all_queries():
-    queries = db.session.query(Query).all()
-    data = []
-    for q in queries:
-        responses = [
-            {
-                'id': r.id,
-                'content': r.content,
-                'faculty_id': r.faculty_id,
-                'created_at': r.created_at.strftime("%Y-%m-%d %H:%M:%S") if r.created_at else None,
-            }
-            for r in q.responses
-        ]
-        data.append({
-            'id': q.id,
-            'title': q.title,
-            'description': q.description,
-            'student_id': q.student_id,
-            'created_at': q.created_at.strftime("%Y-%m-%d %H:%M:%S") if q.created_at else None,
-            'answered': q.answered,
-            'responses': responses
-        })
+    try:
+        page_args = parse_feed_args(request.args)
+        queries, next_cursor = fetch_query_page(**page_args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    data = [serialize_query(q, page_args['fieldset']) for q in queries]
+    return jsonify(data), 200, page_headers(next_cursor)
+
+
+# Ranked full-text search over titles, descriptions and responses
+@query_bp.route('/search', methods=['GET'])
+@jwt_required(optional=True)
+@replica.reads(lambda: ['feed'])
+def search_queries():
+    q = (request.args.get('q') or '').strip()
+    if not q:
+        return jsonify({'error': 'Search term (q) is required'}), 400
+
+    try:
+        limit = min(int(request.args.get('limit', search.DEFAULT_SEARCH_LIMIT)), search.MAX_SEARCH_LIMIT)
+        offset = int(request.args.get('offset', 0))
+    except ValueError:
+        return jsonify({'error': 'limit and offset must be integers'}), 400
+    if limit < 1 or offset < 0:
+        return jsonify({'error': 'limit must be positive and offset non-negative'}), 400
+    try:
+        fieldset = parse_fieldset(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    try:
+        hits = search.search_queries(q, limit=limit, offset=offset, fieldset=fieldset)
+    except Exception as e:
+        print("❌ Error searching queries:", str(e))
+        return jsonify({'error': 'Internal server error', 'details': str(e)}), 500
+
+    data = [dict(serialize_query(query, fieldset), rank=rank) for query, rank in hits]
     return jsonify(data), 200
 
 
+# Delta sync: queries/responses created, updated or deleted since a cursor
+# Call without ?since= to get the current cursor after a full load.
+@query_bp.route('/changes', methods=['GET'])
+@jwt_required(optional=True)
+def get_changes():
+    since = request.args.get('since')
+    if since is None or since == '':
+        return jsonify({'cursor': changes.latest_cursor()}), 200
+
+    try:
+        since = int(since)
+        limit = min(int(request.args.get('limit', changes.DEFAULT_LIMIT)), changes.MAX_LIMIT)
+    except ValueError:
+        return jsonify({'error': 'since and limit must be integers'}), 400
+    if since < 0 or limit < 1:
+        return jsonify({'error': 'since must be non-negative and limit positive'}), 400
+
+    try:
+        return jsonify(changes.changes_since(since, limit)), 200
+    except changes.CursorExpired:
+        return jsonify({'error': 'Cursor is too old, reload everything and start again',
+                        'cursor': changes.latest_cursor()}), 410
+
+
 # Admin view: Get all queries with responses and allow deletion
 @query_bp.route('/admin/queries', methods=['GET'])
+@ratelimit.limit('admin')
 @jwt_required()
 def admin_view_queries():
     try:
@@ -63,28 +129,14 @@ def admin_view_queries():
         if claims.get("role") != "admin":
             return jsonify({'error': 'Access forbidden: Admin only'}), 403
 
-        queries = db.session.query(Query).all()
-        data = []
-        for q in queries:
-            responses = [
-                {
-                    'id': r.id,
-                    'content': r.content,
-                    'faculty_id': r.faculty_id,
-                    'created_at': r.created_at.strftime("%Y-%m-%d %H:%M:%S") if r.created_at else None,
-                }
-                for r in q.responses
-            ]
-            data.append({
-                'id': q.id,
-                'title': q.title,
-                'description': q.description,
-                'student_id': q.student_id,
-                'created_at': q.created_at.strftime("%Y-%m-%d %H:%M:%S") if q.created_at else None,
-                'answered': q.answered,
-                'responses': responses
-            })
-        return jsonify(data), 200
+        try:
+            page_args = parse_feed_args(request.args)
+            queries, next_cursor = fetch_query_page(**page_args)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        data = [serialize_query(q, page_args['fieldset']) for q in queries]
+        return jsonify(data), 200, page_headers(next_cursor)
     except Exception as e:
         print("❌ Error loading admin queries:", str(e))
         return jsonify({'error': 'Internal server error', 'details': str(e)}), 500
@@ -93,40 +145,29 @@ def admin_view_queries():
 # Get logged-in student's queries
 @query_bp.route('/my', methods=['GET'])
 @jwt_required()
+@response_cache.cached(lambda: [f'student:{current_user_id()}'], vary_identity=True)
 def get_my_queries():
     if not is_student():
         return jsonify({'error': 'Access forbidden: Students only'}), 403
 
-    current_username = get_current_username()
-    student = db.session.query(User).filter_by(username=current_username).first()
+    student = identity.current_user()
     if not student:
         return jsonify({'error': 'User not found'}), 404
 
-    my_queries = db.session.query(Query).filter_by(student_id=student.id).all()
-    result = []
-    for q in my_queries:
-        responses = [
-            {
-                'id': r.id,
-                'content': r.content,
-                'faculty_id': r.faculty_id,
-                'created_at': r.created_at.strftime("%Y-%m-%d %H:%M:%S") if r.created_at else None,
-            }
-            for r in q.responses
-        ]
-        result.append({
-            'id': q.id,
-            'title': q.title,
-            'description': q.description,
-            'created_at': q.created_at.strftime("%Y-%m-%d %H:%M:%S") if q.created_at else None,
-            'answered': q.answered,
-            'responses': responses
-        })
-    return jsonify(result), 200
+    try:
+        page_args = parse_feed_args(request.args)
+        page_args['student_id'] = student.id
+        my_queries, next_cursor = fetch_query_page(**page_args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    result = [serialize_query(q, page_args['fieldset'], include_student=False) for q in my_queries]
+    return jsonify(result), 200, page_headers(next_cursor)
 
 
 # Post a new query (Students only)
 @query_bp.route('/new', methods=['POST'])
+@ratelimit.limit('post')
 @jwt_required()
 def create_query():
     try:
@@ -140,16 +181,42 @@ def create_query():
         if not title or not description:
             return jsonify({'error': 'Title and description are required'}), 400
 
-        current_username = get_current_username()
-        student = db.session.query(User).filter_by(username=current_username).first()
+        student = identity.current_user()
         if not student:
             return jsonify({'error': 'User not found'}), 404
 
+        # Near-duplicate check against the in-memory MinHash/LSH index
+        mode = current_app.config.get('DUPLICATE_MODE', dedup.DEFAULT_MODE)
+        duplicates = []
+        if mode != 'off':
+            threshold = current_app.config.get('DUPLICATE_THRESHOLD', dedup.DEFAULT_THRESHOLD)
+            duplicates = dedup.get_index().find(title, description, threshold=threshold)
+            if duplicates and mode == 'block':
+                return jsonify({
+                    'error': 'This claim looks like a duplicate of an existing query',
+                    'possible_duplicates': duplicates
+                }), 409
+
         new_query = Query(title=title, description=description, student_id=student.id, answered=False, created_at=datetime.now(timezone.utc))
         db.session.add(new_query)
+        db.session.flush()
+        query_id = new_query.id
+        namespaces = query_namespaces(new_query)
+        search.index_query(query_id)
+        triage.enqueue(query_id, created_at=new_query.created_at)
+        changes.record('query', [query_id])
+        stats.bump(total_queries=1)
+        analytics.record_query(new_query.created_at)
         db.session.commit()
+        dedup.duplicate_index.add(query_id, title, description)
+        response_cache.invalidate(*namespaces)
+        events.publish('query_created', {'query_id': query_id, 'title': title, 'student_id': student.id},
+                       roles=('faculty', 'admin'))
 
-        return jsonify({'message': 'Query posted successfully', 'query_id': new_query.id}), 201
+        result = {'message': 'Query posted successfully', 'query_id': query_id}
+        if duplicates:
+            result['possible_duplicates'] = duplicates
+        return jsonify(result), 201
 
     except Exception as e:
         print("❌ Error posting query:", str(e))
@@ -157,6 +224,7 @@ def create_query():
 
 # Faculty respond to a query (Allow multiple responses)
 @query_bp.route('/respond/<int:query_id>', methods=['POST'])
+@ratelimit.limit('respond')
 @jwt_required()
 def respond_to_query(query_id):
     try:
@@ -173,59 +241,185 @@ def respond_to_query(query_id):
         if not content:
             return jsonify({'error': 'Response content is required'}), 400
 
-        current_username = get_current_username()
-        faculty = db.session.query(User).filter_by(username=current_username).first()
+        faculty = identity.current_user()
         if not faculty:
             return jsonify({'error': 'User not found'}), 404
 
-        # Allow multiple responses; just mark answered once
-        new_response = Response(content=content, query_id=query.id, faculty_id=faculty.id, created_at=datetime.now(timezone.utc))
-        if not query.answered:
-            query.answered = True
+        try:
+            triage.check_can_answer(query.id, faculty.id)
+        except triage.ClaimConflict as e:
+            return jsonify({'error': str(e)}), 409
 
+        # Allow multiple responses; answered and the counts move in one place (activity.py)
+        new_response = Response(content=content, query_id=query.id, faculty_id=faculty.id, created_at=datetime.now(timezone.utc))
         db.session.add(new_response)
+        db.session.flush()
+        newly_answered = activity.record_response(query.id, new_response.created_at)
+        response_id = new_response.id
+        notice = {'query_id': query.id, 'response_id': response_id, 'title': query.title}
+        student_id = query.student_id
+        namespaces = query_namespaces(query)
+        search.index_query(query.id)
+        triage.complete(query.id)
+        changes.record('response', [response_id])
+        changes.record('query', [query.id])
+        stats.bump(total_responses=1, answered_queries=1 if newly_answered else 0)
+        if newly_answered:
+            analytics.record_first_response(query.created_at, new_response.created_at, faculty.id)
         db.session.commit()
+        if newly_answered:
+            dedup.duplicate_index.mark_answered(query_id)
+        response_cache.invalidate(*namespaces)
+        events.publish('response_added', notice, roles=('admin',), user_ids=(student_id,))
 
-        return jsonify({'message': 'Response added successfully', 'response_id': new_response.id}), 201
+        return jsonify({'message': 'Response added successfully', 'response_id': response_id}), 201
 
     except Exception as e:
         print("❌ Error adding faculty response:", str(e))
         return jsonify({'error': 'Internal server error', 'details': str(e)}), 500
 
 
+# Faculty triage queue: peek at the next pending queries
+@query_bp.route('/triage', methods=['GET'])
+@jwt_required()
+def triage_queue():
+    if not is_faculty() and get_jwt().get('role') != 'admin':
+        return jsonify({'error': 'Access forbidden: Faculty only'}), 403
+
+    try:
+        limit = min(max(int(request.args.get('limit', 20)), 1), 100)
+    except ValueError:
+        return jsonify({'error': 'limit must be an integer'}), 400
+    return jsonify(triage.peek(limit)), 200
+
+
+# Claim the next pending query with a time-limited lease (claiming again renews it)
+@query_bp.route('/triage/claim', methods=['POST'])
+@jwt_required()
+def triage_claim():
+    try:
+        if not is_faculty():
+            return jsonify({'error': 'Access forbidden: Faculty only'}), 403
+
+        faculty = identity.current_user()
+        if not faculty:
+            return jsonify({'error': 'User not found'}), 404
+
+        item = triage.claim_next(faculty.id)
+        if item is None:
+            return jsonify({'message': 'No pending queries'}), 404
+
+        query = db.session.get(Query, item.query_id)
+        return jsonify({
+            'lease_expires_at': timestamp(item.lease_expires_at),
+            'query': serialize_query(query, FULL)
+        }), 200
+    except Exception as e:
+        print("❌ Error claiming query:", str(e))
+        db.session.rollback()
+        return jsonify({'error': 'Internal server error', 'details': str(e)}), 500
+
+
+# Give a claimed query back to the queue
+@query_bp.route('/triage/<int:query_id>/release', methods=['POST'])
+@jwt_required()
+def triage_release(query_id):
+    if not is_faculty():
+        return jsonify({'error': 'Access forbidden: Faculty only'}), 403
+
+    faculty = identity.current_user()
+    if not faculty or not triage.release(query_id, faculty.id):
+        return jsonify({'error': 'You do not hold a claim on this query'}), 404
+    return jsonify({'message': f'Query {query_id} released'}), 200
+
+
+# Set a pending query's priority (Admin only); higher is served first
+@query_bp.route('/triage/<int:query_id>/priority', methods=['PATCH'])
+@jwt_required()
+def triage_priority(query_id):
+    if get_jwt().get('role') != 'admin':
+        return jsonify({'error': 'Access forbidden: Admin only'}), 403
+
+    priority = (request.get_json() or {}).get('priority')
+    if not isinstance(priority, int):
+        return jsonify({'error': 'priority must be an integer'}), 400
+    if not triage.set_priority(query_id, priority):
+        return jsonify({'error': 'Query is not pending'}), 404
+    return jsonify({'message': f'Query {query_id} priority set to {priority}'}), 200
+
+
 # Get a specific query with its responses
 @query_bp.route('/<int:query_id>', methods=['GET'])
 @jwt_required(optional=True)
+@replica.reads(lambda query_id: [f'query:{query_id}'])
+@response_cache.cached(lambda query_id: [f'query:{query_id}'])
 def get_query(query_id):
-    query = db.session.query(Query).get(query_id)
+    try:
+        fieldset = parse_fieldset(request.args, default_responses=True)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    query = db.session.get(Query, query_id, options=query_load_options(fieldset))
     if not query:
         return jsonify({'error': 'Query not found'}), 404
 
-    responses = [
-        {
-            'id': r.id,
-            'content': r.content,
-            'faculty_id': r.faculty_id,
-            'created_at': r.created_at.strftime("%Y-%m-%d %H:%M:%S") if r.created_at else None,
-        }
-        for r in query.responses
-    ]
-
-    result = {
-        'id': query.id,
-        'title': query.title,
-        'description': query.description,
-        'student_id': query.student_id,
-        'created_at': query.created_at.strftime("%Y-%m-%d %H:%M:%S") if query.created_at else None,
-        'answered': query.answered,
-        'responses': responses
-    }
+    result = serialize_query(query, fieldset)
     return jsonify(result), 200
 
 
+# Vote on a response: {"helpful": true} (students and faculty) and/or
+# {"verified": true} (faculty). Scores follow within VOTE_FLUSH_SECONDS.
+@query_bp.route('/responses/<int:response_id>/vote', methods=['PUT'])
+@ratelimit.limit('vote')
+@jwt_required()
+def vote_on_response(response_id):
+    role = get_jwt().get('role')
+    if role not in ('student', 'faculty'):
+        return jsonify({'error': 'Access forbidden: Students and faculty only'}), 403
+
+    data = request.get_json(silent=True) or {}
+    helpful, verified = data.get('helpful'), data.get('verified')
+    if helpful is None and verified is None:
+        return jsonify({'error': 'Send helpful and/or verified'}), 400
+    if any(value is not None and not isinstance(value, bool) for value in (helpful, verified)):
+        return jsonify({'error': 'helpful and verified must be true or false'}), 400
+    if verified is not None and role != 'faculty':
+        return jsonify({'error': 'Only faculty can mark a response verified'}), 403
+
+    user = identity.current_user()
+    if not user:
+        return jsonify({'error': 'User not found'}), 404
+    response = db.session.get(Response, response_id)
+    if not response:
+        return jsonify({'error': 'Response not found'}), 404
+    if response.faculty_id == user.id:
+        return jsonify({'error': 'You cannot vote on your own response'}), 403
+
+    return jsonify(votes.cast(response.id, user.id, helpful=helpful, verified=verified)), 200
+
+
+# Withdraw the caller's vote
+@query_bp.route('/responses/<int:response_id>/vote', methods=['DELETE'])
+@ratelimit.limit('vote')
+@jwt_required()
+def withdraw_vote(response_id):
+    if get_jwt().get('role') not in ('student', 'faculty'):
+        return jsonify({'error': 'Access forbidden: Students and faculty only'}), 403
+
+    user = identity.current_user()
+    if not user:
+        return jsonify({'error': 'User not found'}), 404
+    if db.session.get(Response, response_id) is None:
+        return jsonify({'error': 'Response not found'}), 404
+    if not votes.withdraw(response_id, user.id):
+        return jsonify({'error': 'You have not voted on this response'}), 404
+    return jsonify({'response_id': response_id, 'helpful': False, 'verified': False}), 200
+
+
 # Get logged-in faculty's responses
 @query_bp.route('/responses/my', methods=['GET'])
 @jwt_required()
+@replica.reads()
 def get_my_responses():
     try:
         claims = get_jwt() or {}
@@ -234,25 +428,22 @@ def get_my_responses():
         if role != "faculty":
             return jsonify({'error': 'Access forbidden: Faculty only'}), 403
 
-        current_username = get_current_username()
-        faculty = db.session.query(User).filter_by(username=current_username).first()
+        faculty = identity.current_user()
         if not faculty:
             return jsonify({'error': 'User not found'}), 404
 
-        # ✅ Fixed query syntax for SQLAlchemy
-        responses = db.session.query(Response).filter(Response.faculty_id == faculty.id).all()
-
-        result = []
-        for r in responses:
-            query = db.session.query(Query).get(r.query_id)
-            result.append({
-                'response_id': r.id,
-                'content': r.content,
-                'query_title': query.title if query else "Unknown Query",
-                'query_description': query.description if query else "No description",
-                'created_at': r.created_at.strftime("%Y-%m-%d %H:%M:%S") if r.created_at else None,
-            })
-        return jsonify(result), 200
+        try:
+            page_args = parse_response_args(request.args)
+            rows, next_cursor = fetch_response_page(faculty.id, **page_args)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        headers = page_headers(next_cursor)
+        # Summary over every matching response, sent with the first page only
+        if not page_args['after']:
+            filters = {k: page_args[k] for k in ('answered', 'since', 'until')}
+            headers.update(summary_headers(response_summary(faculty.id, **filters)))
+        return jsonify([serialize_faculty_response(row) for row in rows]), 200, headers
 
     except Exception as e:
         print("❌ Error loading faculty responses:", str(e))
@@ -261,7 +452,9 @@ def get_my_responses():
 
 # Get system statistics for Admin Dashboard
 @query_bp.route('/admin/stats', methods=['GET'])
+@ratelimit.limit('admin')
 @jwt_required()
+@replica.reads()
 def get_admin_stats():
     try:
         claims = get_jwt() or {}
@@ -269,31 +462,20 @@ def get_admin_stats():
         if role != "admin":
             return jsonify({'error': 'Access forbidden: Admin only'}), 403
 
-        users = db.session.query(User).all()
-        queries = db.session.query(Query).all()
-        responses = db.session.query(Response).all()
-
-        student_count = sum(1 for u in users if u.role == 'student')
-        faculty_count = sum(1 for u in users if u.role == 'faculty')
-        admin_count = sum(1 for u in users if u.role == 'admin')
-
-        # Safe count of answered queries
-        query_ids_with_responses = {r.query_id for r in responses}
-        answered_queries = len(query_ids_with_responses)
-        unanswered_queries = len(queries) - answered_queries
-
-        stats = {
-            'total_users': len(users),
-            'students': student_count,
-            'faculty': faculty_count,
-            'admins': admin_count,
-            'total_queries': len(queries),
-            'answered_queries': answered_queries,
-            'unanswered_queries': unanswered_queries,
-            'total_responses': len(responses)
+        # One primary-key lookup on the counters row maintained by stats.bump()
+        counters = stats.read_stats()
+        result = {
+            'total_users': counters.students + counters.faculty + counters.admins,
+            'students': counters.students,
+            'faculty': counters.faculty,
+            'admins': counters.admins,
+            'total_queries': counters.total_queries,
+            'answered_queries': counters.answered_queries,
+            'unanswered_queries': counters.total_queries - counters.answered_queries,
+            'total_responses': counters.total_responses
         }
 
-        return jsonify(stats), 200
+        return jsonify(result), 200
 
     except Exception as e:
         print("❌ Error loading admin stats:", str(e))
@@ -303,6 +485,7 @@ def get_admin_stats():
 
 # Delete a query (Admin only)
 @query_bp.route('/admin/delete_query/<int:query_id>', methods=['DELETE'])
+@ratelimit.limit('admin')
 @jwt_required()
 def delete_query(query_id):
     try:
@@ -310,18 +493,12 @@ def delete_query(query_id):
         if claims.get("role") != "admin":
             return jsonify({'error': 'Access forbidden: Admin only'}), 403
 
-        query = db.session.query(Query).get(query_id)
-        if not query:
+        # One DELETE; its responses follow through ON DELETE CASCADE
+        batch = Moderation()
+        if not batch.delete_queries([query_id]):
             return jsonify({'error': 'Query not found'}), 404
-
-        # Delete all responses linked to this query first
-        responses = db.session.query(Response).filter_by(query_id=query.id).all()
-        for r in responses:
-            db.session.delete(r)
-
-        # Then delete the query itself
-        db.session.delete(query)
         db.session.commit()
+        batch.apply()
 
         return jsonify({'message': f'Query {query_id} and all associated responses deleted successfully'}), 200
     except Exception as e:
@@ -332,6 +509,7 @@ def delete_query(query_id):
 
 # Delete a response (Admin only)
 @query_bp.route('/admin/delete_response/<int:response_id>', methods=['DELETE'])
+@ratelimit.limit('admin')
 @jwt_required()
 def delete_response(response_id):
     try:
@@ -339,20 +517,57 @@ def delete_response(response_id):
         if claims.get("role") != "admin":
             return jsonify({'error': 'Access forbidden: Admin only'}), 403
 
-        response = db.session.query(Response).get(response_id)
-        if not response:
+        batch = Moderation()
+        if not batch.delete_responses([response_id]):
             return jsonify({'error': 'Response not found'}), 404
-
-        db.session.delete(response)
         db.session.commit()
+        batch.apply()
         return jsonify({'message': f'Response {response_id} deleted successfully'}), 200
     except Exception as e:
         print("❌ Error deleting response:", str(e))
+        db.session.rollback()
+        return jsonify({'error': 'Internal server error', 'details': str(e)}), 500
+
+
+# Bulk moderation in one transaction (Admin only)
+# Body: {"queries": [ids], "responses": [ids], "users": [ids], "purge_users": [ids]}
+# purge_users removes everything those users posted but keeps their accounts.
+# "partial": true commits chunk by chunk instead (see moderation.py).
+@query_bp.route('/admin/moderate', methods=['POST'])
+@ratelimit.limit('admin')
+@jwt_required()
+def bulk_moderate():
+    try:
+        claims = get_jwt() or {}
+        if claims.get("role") != "admin":
+            return jsonify({'error': 'Access forbidden: Admin only'}), 403
+
+        data = request.get_json() or {}
+        targets = {}
+        for key in ('queries', 'responses', 'users', 'purge_users'):
+            ids = data.get(key) or []
+            if not isinstance(ids, list) or not all(isinstance(i, int) for i in ids):
+                return jsonify({'error': f'{key} must be a list of integer ids'}), 400
+            targets[key] = ids
+        if not any(targets.values()):
+            return jsonify({'error': 'Nothing to moderate'}), 400
+        if not isinstance(data.get('partial', False), bool):
+            return jsonify({'error': 'partial must be true or false'}), 400
+        targets['partial'] = data.get('partial', False)
+
+        # Runs in the background (see moderation.moderate_job); poll the job
+        job = jobs.enqueue('moderate', targets, created_by=current_user_id())
+        return jsonify({'message': 'Moderation queued', 'job': jobs.serialize_job(job)}), 202, \
+            {'Location': f'/api/admin/jobs/{job.id}'}
+    except Exception as e:
+        print("❌ Error applying moderation:", str(e))
+        db.session.rollback()
         return jsonify({'error': 'Internal server error', 'details': str(e)}), 500
 
 
 # Get all users (Admin only)
 @query_bp.route('/admin/users', methods=['GET'])
+@ratelimit.limit('admin')
 @jwt_required()
 def get_all_users():
     try:
@@ -379,6 +594,7 @@ def get_all_users():
 
 # Suspend user (Admin only)
 @query_bp.route('/admin/suspend_user/<int:user_id>', methods=['PATCH'])
+@ratelimit.limit('admin')
 @jwt_required()
 def suspend_user(user_id):
     try:
@@ -392,6 +608,8 @@ def suspend_user(user_id):
 
         user.active = False
         db.session.commit()
+        identity.revoke(user.username)
+        events.disconnect([user.id])
         return jsonify({'message': f'User {user.username} suspended successfully'}), 200
     except Exception as e:
         print("❌ Error suspending user:", str(e))
@@ -400,6 +618,7 @@ def suspend_user(user_id):
 
 # Unsuspend user (Admin only)
 @query_bp.route('/admin/unsuspend_user/<int:user_id>', methods=['PATCH'])
+@ratelimit.limit('admin')
 @jwt_required()
 def unsuspend_user(user_id):
     try:
@@ -413,6 +632,7 @@ def unsuspend_user(user_id):
 
         user.active = True
         db.session.commit()
+        identity.restore(user.username)
         return jsonify({'message': f'User {user.username} unsuspended successfully'}), 200
     except Exception as e:
         print("❌ Error unsuspending user:", str(e))
@@ -421,6 +641,7 @@ def unsuspend_user(user_id):
 
 # Delete user (Admin only)
 @query_bp.route('/admin/delete_user/<int:user_id>', methods=['DELETE'])
+@ratelimit.limit('admin')
 @jwt_required()
 def delete_user(user_id):
     try:
@@ -432,17 +653,21 @@ def delete_user(user_id):
         if not user:
             return jsonify({'error': 'User not found'}), 404
 
-        db.session.delete(user)
-        db.session.commit()
-        return jsonify({'message': f'User {user.username} deleted successfully'}), 200
+        # Removes the user and their queries and responses in the background
+        username = user.username
+        job = jobs.enqueue('moderate', {'users': [user_id]}, created_by=current_user_id())
+        return jsonify({'message': f'User {username} is being deleted', 'job': jobs.serialize_job(job)}), 202, \
+            {'Location': f'/api/admin/jobs/{job.id}'}
     except Exception as e:
         print("❌ Error deleting user:", str(e))
+        db.session.rollback()
         return jsonify({'error': 'Internal server error', 'details': str(e)}), 500
 
 
 
 # Add new user (Admin only) — can add Student, Faculty, or Admin
 @query_bp.route('/admin/add_user', methods=['POST'])
+@ratelimit.limit('admin')
 @jwt_required()
 def add_user():
     try:
@@ -464,10 +689,15 @@ def add_user():
         if db.session.query(User).filter_by(username=username).first():
             return jsonify({'error': 'Username already exists'}), 400
 
-        password_hash = generate_password_hash(password)
+        try:
+            password_hash = passwords.get_hasher().hash(password)
+        except passwords.PoolBusy:
+            return passwords.busy_response()
         new_user = User(username=username, password_hash=password_hash, role=role, active=True)
         db.session.add(new_user)
+        stats.bump(**stats.role_delta(role, 1))
         db.session.commit()
+        identity.restore(username)
 
         return jsonify({'message': f'{role.capitalize()} added successfully', 'user': {
             'id': new_user.id,
@@ -478,3 +708,30 @@ def add_user():
     except Exception as e:
         print("❌ Error adding user:", str(e))
         return jsonify({'error': 'Internal server error', 'details': str(e)}), 500
+
+
+# Bulk import users from a CSV or NDJSON request body (Admin only)
+@query_bp.route('/admin/import_users', methods=['POST'])
+@ratelimit.limit('admin')
+@jwt_required()
+def import_users():
+    try:
+        claims = get_jwt() or {}
+        if claims.get("role") != "admin":
+            return jsonify({'error': 'Access forbidden: Admin only'}), 403
+
+        fmt = bulk_import.detect_format(request.content_type, request.args.get('format'))
+        if fmt not in bulk_import.FORMATS:
+            return jsonify({'error': f"Unsupported format '{fmt}'. Use csv or ndjson"}), 400
+
+        # Read the raw body as a stream so large uploads are never buffered whole
+        text_stream = io.TextIOWrapper(request.stream, encoding='utf-8', newline='')
+        report = bulk_import.import_users(text_stream, fmt)
+        return jsonify(report), 200
+
+    except passwords.PoolBusy:
+        return passwords.busy_response()
+    except Exception as e:
+        print("❌ Error importing users:", str(e))
+        db.session.rollback()
+        return jsonify({'error': 'Internal server error', 'details': str(e)}), 500
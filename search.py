@@ -0,0 +1,143 @@
+import re
+from sqlalchemy import bindparam, text
+from models import db, Query
+from serializers import FULL, query_load_options
+
+# ------------------------------
+# Full-text search over queries and their responses
+# ------------------------------
+# Each query is indexed as one document: title (highest weight), description,
+# then the text of all its responses.
+#   PostgreSQL: queries.search_vector tsvector column with a GIN index
+#   SQLite:     query_search FTS5 virtual table keyed by rowid = queries.id
+# Write routes call index_query()/remove_query() before committing so the
+# index changes in the same transaction as the rows.
+
+DEFAULT_SEARCH_LIMIT = 20
+MAX_SEARCH_LIMIT = 100
+
+PG_SETUP = [
+    "ALTER TABLE queries ADD COLUMN IF NOT EXISTS search_vector tsvector",
+    "CREATE INDEX IF NOT EXISTS ix_queries_search_vector ON queries USING GIN (search_vector)",
+]
+
+PG_INDEX_QUERY = """
+    UPDATE queries SET search_vector =
+        setweight(to_tsvector('english', coalesce(title, '')), 'A') ||
+        setweight(to_tsvector('english', coalesce(description, '')), 'B') ||
+        setweight(to_tsvector('english', coalesce(
+            (SELECT string_agg(content, ' ') FROM responses WHERE responses.query_id = queries.id), ''
+        )), 'C')
+    WHERE {where}
+"""
+
+PG_SEARCH = """
+    SELECT q.id, ts_rank(q.search_vector, tsq) AS rank
+    FROM queries q, websearch_to_tsquery('english', :q) tsq
+    WHERE q.search_vector @@ tsq
+    ORDER BY rank DESC, q.id DESC
+    LIMIT :limit OFFSET :offset
+"""
+
+SQLITE_SETUP = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS query_search "
+    "USING fts5(title, description, responses, tokenize='porter unicode61')",
+]
+
+SQLITE_INDEX_QUERY = """
+    INSERT INTO query_search (rowid, title, description, responses)
+    SELECT q.id, coalesce(q.title, ''), coalesce(q.description, ''),
+           coalesce((SELECT group_concat(r.content, ' ') FROM responses r WHERE r.query_id = q.id), '')
+    FROM queries q WHERE {where}
+"""
+
+# bm25() is lower-is-better; weights follow the column order above
+SQLITE_SEARCH = """
+    SELECT rowid AS id, -bm25(query_search, 10.0, 4.0, 1.0) AS rank
+    FROM query_search
+    WHERE query_search MATCH :q
+    ORDER BY rank DESC, rowid DESC
+    LIMIT :limit OFFSET :offset
+"""
+
+
+def dialect():
+    return db.session.get_bind().dialect.name
+
+
+# Create the tsvector column / FTS5 table if missing
+def ensure_search_index():
+    setup = PG_SETUP if dialect() == 'postgresql' else SQLITE_SETUP
+    for statement in setup:
+        db.session.execute(text(statement))
+    db.session.commit()
+
+
+def index_query(query_id):
+    index_queries([query_id])
+
+
+def index_queries(query_ids):
+    query_ids = list(query_ids)
+    if not query_ids:
+        return
+    if dialect() == 'postgresql':
+        stmt = text(PG_INDEX_QUERY.format(where='id IN :ids'))
+    else:
+        remove_queries(query_ids)
+        stmt = text(SQLITE_INDEX_QUERY.format(where='q.id IN :ids'))
+    db.session.execute(stmt.bindparams(bindparam('ids', expanding=True)), {'ids': query_ids})
+
+
+def remove_query(query_id):
+    remove_queries([query_id])
+
+
+def remove_queries(query_ids):
+    # On PostgreSQL the vector lives on the row and goes away with it
+    query_ids = list(query_ids)
+    if query_ids and dialect() != 'postgresql':
+        stmt = text("DELETE FROM query_search WHERE rowid IN :ids")
+        db.session.execute(stmt.bindparams(bindparam('ids', expanding=True)), {'ids': query_ids})
+
+
+# Reindex every query (also exposed as `flask rebuild-search-index`)
+def rebuild_index():
+    ensure_search_index()
+    if dialect() == 'postgresql':
+        db.session.execute(text(PG_INDEX_QUERY.format(where='TRUE')))
+    else:
+        db.session.execute(text("DELETE FROM query_search"))
+        db.session.execute(text(SQLITE_INDEX_QUERY.format(where='1 = 1')))
+    db.session.commit()
+
+
+def to_fts5_match(q):
+    # Quote every term so user input can't trip FTS5 query syntax
+    terms = re.findall(r'\w+', q, flags=re.UNICODE)
+    return ' '.join('"' + term + '"' for term in terms)
+
+
+# Returns [(Query, rank), ...] best match first
+def search_queries(q, limit=DEFAULT_SEARCH_LIMIT, offset=0, fieldset=FULL):
+    if dialect() == 'postgresql':
+        sql, term = PG_SEARCH, q
+    else:
+        sql, term = SQLITE_SEARCH, to_fts5_match(q)
+        if not term:
+            return []
+
+    hits = db.session.execute(
+        text(sql), {'q': term, 'limit': limit, 'offset': offset}
+    ).all()
+    if not hits:
+        return []
+
+    ids = [hit.id for hit in hits]
+    queries = {
+        query.id: query
+        for query in db.session.query(Query)
+        .options(*query_load_options(fieldset))
+        .filter(Query.id.in_(ids))
+    }
+    return [(queries[hit.id], hit.rank) for hit in hits if hit.id in queries]
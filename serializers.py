@@ -0,0 +1,138 @@
+from collections import namedtuple
+from sqlalchemy.orm import load_only, selectinload
+from models import Query, Response
+from metrics import TimedJSONProvider
+
+# ------------------------------
+# Query / response payloads, shared by every route
+# ------------------------------
+# List endpoints accept sparse fieldsets:
+#   ?fields=id,title,created_at   only these query fields (default: all)
+#   ?include=responses            embed each query's responses
+# Only the selected columns are loaded (load_only), so skipping the Text
+# columns (description, response content) saves DB I/O as well as bytes.
+#
+# JSON_BACKEND=orjson swaps Flask's encoder for orjson (optional package).
+
+QUERY_FIELDS = ('id', 'title', 'description', 'student_id', 'created_at', 'answered',
+                'response_count', 'first_response_at', 'last_response_at')
+RESPONSE_FIELDS = ('id', 'content', 'faculty_id', 'created_at', 'helpful_count', 'verified_count', 'score')
+INCLUDES = ('responses',)
+
+# Columns the feed needs whatever was asked for (keyset cursor of either sort)
+REQUIRED_QUERY_COLUMNS = ('id', 'created_at', 'last_response_at')
+
+FieldSet = namedtuple('FieldSet', ['fields', 'responses'])
+
+FULL = FieldSet(QUERY_FIELDS, True)
+
+
+def timestamp(value):
+    # Same text as strftime("%Y-%m-%d %H:%M:%S"), without the format parsing
+    return value.isoformat(sep=' ', timespec='seconds') if value else None
+
+
+def _names(raw):
+    return [name.strip() for name in (raw or '').split(',') if name.strip()]
+
+
+# Read ?fields= and ?include=; raises ValueError on unknown names
+def parse_fieldset(args, default_responses=False):
+    fields = _names(args.get('fields'))
+    includes = _names(args.get('include'))
+    # fields=...,responses is shorthand for include=responses
+    if 'responses' in fields:
+        fields.remove('responses')
+        includes.append('responses')
+
+    unknown = [f for f in fields if f not in QUERY_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown field(s): {', '.join(unknown)}. Use {', '.join(QUERY_FIELDS)}")
+    unknown = [i for i in includes if i not in INCLUDES]
+    if unknown:
+        raise ValueError(f"Unknown include(s): {', '.join(unknown)}. Use {', '.join(INCLUDES)}")
+
+    fields = tuple(f for f in QUERY_FIELDS if f in fields) if fields else QUERY_FIELDS
+    responses = 'responses' in includes if 'include' in args or includes else default_responses
+    return FieldSet(fields, responses)
+
+
+# ORM options loading just the columns a fieldset serializes
+def query_load_options(fieldset=FULL):
+    columns = [getattr(Query, name) for name in QUERY_FIELDS
+               if name in fieldset.fields or name in REQUIRED_QUERY_COLUMNS]
+    options = [load_only(*columns)]
+    if fieldset.responses:
+        options.append(selectinload(Query.responses).load_only(
+            *[getattr(Response, name) for name in RESPONSE_FIELDS]))
+    return options
+
+
+def serialize_response(r):
+    return {
+        'id': r.id,
+        'content': r.content,
+        'faculty_id': r.faculty_id,
+        'created_at': timestamp(r.created_at),
+        'helpful_count': r.helpful_count,
+        'verified_count': r.verified_count,
+        'score': r.score,
+    }
+
+
+# A faculty member's own response with the query it answers (feed.fetch_response_page row)
+def serialize_faculty_response(row):
+    return {
+        'response_id': row.id,
+        'content': row.content,
+        'query_id': row.query_id,
+        'query_title': row.query_title,
+        'query_description': row.query_description,
+        'query_answered': row.query_answered,
+        'created_at': timestamp(row.created_at),
+    }
+
+
+_QUERY_GETTERS = {
+    'id': lambda q: q.id,
+    'title': lambda q: q.title,
+    'description': lambda q: q.description,
+    'student_id': lambda q: q.student_id,
+    'created_at': lambda q: timestamp(q.created_at),
+    'answered': lambda q: q.answered,
+    'response_count': lambda q: q.response_count,
+    'first_response_at': lambda q: timestamp(q.first_response_at),
+    'last_response_at': lambda q: timestamp(q.last_response_at),
+}
+
+
+def serialize_query(q, fieldset=FULL, include_student=True):
+    data = {name: _QUERY_GETTERS[name](q) for name in fieldset.fields
+            if include_student or name != 'student_id'}
+    if fieldset.responses:
+        data['responses'] = [serialize_response(r) for r in q.responses]
+    return data
+
+
+class OrjsonProvider(TimedJSONProvider):
+    def __init__(self, app):
+        super().__init__(app)
+        import orjson
+        self.orjson = orjson
+
+    def encode(self, obj, **kwargs):
+        option = self.orjson.OPT_PASSTHROUGH_DATETIME | self.orjson.OPT_NON_STR_KEYS
+        if kwargs.get('sort_keys', self.sort_keys):
+            option |= self.orjson.OPT_SORT_KEYS
+        if kwargs.get('indent'):
+            option |= self.orjson.OPT_INDENT_2
+        # Dates and other extras keep Flask's formatting via default()
+        return self.orjson.dumps(obj, default=self.default, option=option).decode()
+
+
+def init_app(app):
+    backend = app.config.get('JSON_BACKEND', 'default')
+    if backend == 'orjson':
+        app.json = OrjsonProvider(app)
+    elif backend != 'default':
+        raise ValueError(f"Unknown JSON_BACKEND '{backend}'. Use default or orjson")
@@ -0,0 +1,61 @@
+from sqlalchemy import func, update
+from models import db, User, Query, Response, ForumStats
+
+# ------------------------------
+# Incrementally maintained forum counters
+# ------------------------------
+# Write routes call bump() inside their own transaction, before commit, so the
+# counters move together with the rows. The dashboards read a single row.
+
+STATS_ROW_ID = 1
+
+ROLE_COLUMNS = {'student': 'students', 'faculty': 'faculty', 'admin': 'admins'}
+
+
+def role_delta(role, delta):
+    column = ROLE_COLUMNS.get((role or '').lower())
+    return {column: delta} if column else {}
+
+
+def bump(**deltas):
+    values = {col: getattr(ForumStats, col) + delta for col, delta in deltas.items() if delta}
+    if not values:
+        return
+    result = db.session.execute(
+        update(ForumStats).where(ForumStats.id == STATS_ROW_ID).values(**values)
+    )
+    if result.rowcount == 0:
+        # No counters row yet: build it from the tables. Autoflush means the
+        # pending write is already included, so the delta is not applied twice.
+        reconcile(commit=False)
+
+
+# Rebuild the counters row from scratch (also exposed as `flask reconcile-stats`)
+def reconcile(commit=True):
+    role_counts = dict(
+        db.session.query(User.role, func.count(User.id)).group_by(User.role).all()
+    )
+    total_queries, answered_queries = db.session.query(
+        func.count(Query.id),
+        func.count(Query.id).filter(Query.answered.is_(True)),
+    ).one()
+    total_responses = db.session.query(func.count(Response.id)).scalar()
+
+    row = db.session.get(ForumStats, STATS_ROW_ID) or ForumStats(id=STATS_ROW_ID)
+    for role, column in ROLE_COLUMNS.items():
+        setattr(row, column, role_counts.get(role, 0))
+    row.total_queries = total_queries
+    row.answered_queries = answered_queries
+    row.total_responses = total_responses
+    db.session.add(row)
+
+    if commit:
+        db.session.commit()
+    return row
+
+
+def read_stats():
+    row = db.session.get(ForumStats, STATS_ROW_ID)
+    if row is None:
+        row = reconcile()
+    return row
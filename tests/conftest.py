@@ -0,0 +1,60 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app  # noqa: E402
+from models import db  # noqa: E402
+import dedup  # noqa: E402
+import identity  # noqa: E402
+import migrations  # noqa: E402
+
+PASSWORD = 'correct horse battery'
+
+
+# A fresh app on a temporary SQLite file; jobs and vote flushes run inline
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + str(tmp_path / 'forum.db'),
+        'ATTACHMENT_DIR': str(tmp_path / 'attachments'),
+        'RATE_LIMIT_ENABLED': False,
+        'JOB_WORKERS': 0,
+        'JOB_SWEEP_SECONDS': 0,
+        'VOTE_FLUSH_SECONDS': 0,
+        'PASSWORD_HASH_METHOD': 'pbkdf2:sha256:1000',
+    })
+    identity.clear()
+    monkeypatch.setattr(dedup, 'duplicate_index', dedup.DuplicateIndex())
+    with app.app_context():
+        migrations.upgrade()
+    yield app
+    with app.app_context():
+        db.session.remove()
+        db.engine.dispose()
+    identity.clear()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+# login('alice', 'student') registers the user on first use and returns
+# Authorization headers for them
+@pytest.fixture
+def login(client):
+    tokens = {}
+
+    def login(username, role):
+        if username not in tokens:
+            client.post('/api/auth/register', json={'username': username, 'password': PASSWORD, 'role': role})
+            resp = client.post('/api/auth/login', json={'username': username, 'password': PASSWORD, 'role': role})
+            assert resp.status_code == 200, resp.get_json()
+            tokens[username] = resp.get_json()['token']
+        return {'Authorization': 'Bearer ' + tokens[username]}
+
+    return login
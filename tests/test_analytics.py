@@ -0,0 +1,25 @@
+from datetime import datetime, timedelta
+
+import analytics
+import stats
+from models import db, Query, User
+
+
+def test_backlog_ages_match_sorted_pending_queries(app):
+    now = datetime(2026, 3, 1, 12, 0, 0)
+    with app.app_context():
+        student = User(username='asker', password_hash='x', role='student')
+        db.session.add(student)
+        db.session.flush()
+        ages = [(n * 37) % 101 * 60 for n in range(101)]
+        db.session.add_all(Query(title=f'claim {n}', description='d', student_id=student.id, answered=n % 7 == 0,
+                                 created_at=now - timedelta(seconds=age)) for n, age in enumerate(ages))
+        db.session.commit()
+        stats.reconcile()
+
+        pending = sorted((age for n, age in enumerate(ages) if n % 7), reverse=True)
+        result = analytics.backlog(now)
+        assert result['pending'] == len(pending)
+        assert result['oldest_age_seconds'] == pending[0]
+        for q in analytics.QUANTILES:
+            assert result[f'p{round(q * 100)}_age_seconds'] == pending[round((1 - q) * (len(pending) - 1))]
@@ -0,0 +1,21 @@
+import os
+
+from models import db, Attachment
+
+
+def test_empty_upload_is_rejected_before_anything_is_stored(app, client, login):
+    author = login('author', 'student')
+    query_id = client.post('/api/queries/new', headers=author, json={
+        'title': 'Is this flyer about the water ban real',
+        'description': 'It was pinned up in the library lobby.'}).get_json()['query_id']
+    path = f'/api/attachments/queries/{query_id}'
+
+    resp = client.post(path, headers={**author, 'Content-Type': 'image/png'}, data=b'')
+    assert resp.status_code == 400
+    with app.app_context():
+        assert db.session.query(Attachment).count() == 0
+    blobs = [name for _, _, names in os.walk(app.config['ATTACHMENT_DIR']) for name in names]
+    assert blobs == []
+
+    resp = client.post(path, headers={**author, 'Content-Type': 'image/png'}, data=b'\x89PNG\r\n\x1a\n')
+    assert resp.status_code == 201 and resp.get_json()['size'] == 8
@@ -0,0 +1,35 @@
+import pytest
+
+from conftest import PASSWORD
+from models import db, User
+
+
+def stored_hash(app, username):
+    with app.app_context():
+        return db.session.query(User.password_hash).filter_by(username=username).scalar()
+
+
+@pytest.fixture
+def stale_hash(app, login):
+    login('alice', 'student')
+    # Hashes made before the method was raised
+    app.config['PASSWORD_HASH_METHOD'] = 'pbkdf2:sha256:2000'
+    app.extensions.pop('password_hasher', None)
+    return stored_hash(app, 'alice')
+
+
+def test_refused_login_does_not_rehash(app, client, stale_hash):
+    resp = client.post('/api/auth/login', json={'username': 'alice', 'password': PASSWORD, 'role': 'faculty'})
+    assert resp.status_code == 403
+    with app.app_context():
+        db.session.query(User).filter_by(username='alice').update({'active': False})
+        db.session.commit()
+    resp = client.post('/api/auth/login', json={'username': 'alice', 'password': PASSWORD, 'role': 'student'})
+    assert resp.status_code == 403
+    assert stored_hash(app, 'alice') == stale_hash
+
+
+def test_successful_login_rehashes(app, client, stale_hash):
+    resp = client.post('/api/auth/login', json={'username': 'alice', 'password': PASSWORD, 'role': 'student'})
+    assert resp.status_code == 200
+    assert stored_hash(app, 'alice').startswith('pbkdf2:sha256:2000$')
@@ -0,0 +1,22 @@
+import json
+
+
+def test_non_string_fields_are_row_errors(client, login):
+    rows = [
+        {'username': 'ok_one', 'password': 'pw-one-long', 'role': 'student'},
+        {'username': 12345, 'password': 'pw-two-long', 'role': 'student'},
+        {'username': 'bad_role', 'password': 'pw-three-long', 'role': ['student']},
+        {'username': 'bad_password', 'password': {'plain': 'x'}, 'role': 'student'},
+        {'username': 'ok_two', 'password': 'pw-four-long', 'role': 'faculty'},
+    ]
+    body = '\n'.join(json.dumps(row) for row in rows)
+    resp = client.post('/api/queries/admin/import_users?format=ndjson', headers=login('root', 'admin'),
+                       data=body, content_type='application/x-ndjson')
+    assert resp.status_code == 200, resp.get_data(as_text=True)
+    report = resp.get_json()
+    assert report['created'] == 2
+    assert [(e['line'], e['error']) for e in report['errors']] == [
+        (2, 'Username must be a string'),
+        (3, 'Role must be a string'),
+        (4, 'Password must be a string'),
+    ]
@@ -0,0 +1,30 @@
+from sqlalchemy import delete
+
+import changes
+from models import db, ChangeLog
+
+
+def post(client, login, title):
+    return client.post('/api/queries/new', headers=login('asker', 'student'), json={
+        'title': title, 'description': 'Seen on a neighbourhood group this morning.'})
+
+
+def test_cursors_survive_pruning_the_whole_log(app, client, login):
+    post(client, login, 'Is the water supply off all weekend')
+    post(client, login, 'Was the bridge closed for repairs')
+    cursor = client.get('/api/queries/changes').get_json()['cursor']
+
+    with app.app_context():
+        changes.prune(0)
+        assert changes.latest_cursor() == cursor
+    assert client.get(f'/api/queries/changes?since={cursor}').get_json()['queries'] == []
+    assert client.get(f'/api/queries/changes?since={cursor + 5}').status_code == 410
+
+    # Even with every row gone, the next write gets a fresh id
+    with app.app_context():
+        db.session.execute(delete(ChangeLog))
+        db.session.commit()
+    post(client, login, 'Are the buses free on election day')
+    delta = client.get(f'/api/queries/changes?since={cursor}').get_json()
+    assert delta['cursor'] > cursor
+    assert [q['title'] for q in delta['queries']] == ['Are the buses free on election day']
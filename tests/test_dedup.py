@@ -0,0 +1,44 @@
+from sqlalchemy import delete
+
+import changes
+from models import db, Query, User
+
+TITLE = 'Does drinking hot water every morning cure the seasonal flu'
+DESCRIPTION = 'A forwarded message says hot water every morning cures the seasonal flu within two days.'
+
+
+def post(client, login):
+    return client.post('/api/queries/new', headers=login('asker', 'student'),
+                       json={'title': TITLE, 'description': DESCRIPTION}).get_json()
+
+
+def db_first_query(app):
+    with app.app_context():
+        return db.session.query(Query.id).order_by(Query.id).first()[0]
+
+
+def test_lookup_sees_queries_written_by_other_workers(app, client, login):
+    assert 'possible_duplicates' not in post(client, login)
+    first_id = db_first_query(app)
+
+    # Another worker posts a near-copy: it reaches this worker only through the change log
+    with app.app_context():
+        author = db.session.query(User).filter_by(username='asker').one()
+        other = Query(title=TITLE + ' really', description=DESCRIPTION, student_id=author.id)
+        db.session.add(other)
+        db.session.flush()
+        other_id = other.id
+        changes.record('query', [other_id])
+        db.session.commit()
+
+    found = {d['query_id'] for d in post(client, login)['possible_duplicates']}
+    assert {first_id, other_id} <= found
+
+    # ... and deletes it again
+    with app.app_context():
+        db.session.execute(delete(Query).where(Query.id == other_id))
+        changes.record('query', [other_id], op='delete')
+        db.session.commit()
+
+    found = {d['query_id'] for d in post(client, login)['possible_duplicates']}
+    assert other_id not in found and first_id in found
@@ -0,0 +1,44 @@
+import json
+
+import events
+from models import db, User
+
+
+def open_stream(client, login, username='watcher'):
+    resp = client.post('/api/events/ticket', headers=login(username, 'student'))
+    assert resp.status_code == 201
+    stream = client.get(f"/api/events?ticket={resp.get_json()['ticket']}", buffered=False)
+    assert stream.status_code == 200
+    chunks = iter(stream.response)
+    assert next(chunks) == b'retry: 3000\n\n'
+    return chunks
+
+
+def test_token_in_query_string_is_not_accepted(client, login):
+    token = login('watcher', 'student')['Authorization'].split()[1]
+    assert client.get(f'/api/events?jwt={token}').status_code == 401
+
+
+def test_invalid_or_expired_ticket_is_refused(app, client, login):
+    assert client.get('/api/events?ticket=forged').status_code == 401
+    ticket = client.post('/api/events/ticket', headers=login('watcher', 'student')).get_json()['ticket']
+    app.config['EVENTS_TICKET_SECONDS'] = -1
+    assert client.get(f'/api/events?ticket={ticket}').status_code == 401
+
+
+def test_suspension_closes_open_stream(client, login):
+    chunks = open_stream(client, login)
+    with client.application.app_context():
+        user_id = db.session.query(User.id).filter_by(username='watcher').scalar()
+
+    resp = client.patch(f'/api/queries/admin/suspend_user/{user_id}', headers=login('root', 'admin'))
+    assert resp.status_code == 200
+    event = next(chunks).decode()
+    assert 'event: session_revoked' in event
+    assert json.loads(event.split('data: ')[1]) == {'type': 'session_revoked'}
+    assert list(chunks) == []
+    assert not events.get_broker(client.application).subscribers
+
+    # Nor can the suspended user's token get a new ticket
+    resp = client.post('/api/events/ticket', headers=login('watcher', 'student'))
+    assert resp.status_code == 401
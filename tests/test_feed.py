@@ -0,0 +1,49 @@
+from datetime import datetime, timedelta
+
+from models import db, Query, User
+
+
+def seed_queries(app, count):
+    start = datetime(2026, 1, 1)
+    with app.app_context():
+        student = User(username='asker', password_hash='x', role='student')
+        db.session.add(student)
+        db.session.flush()
+        db.session.add_all(Query(title=f'claim {n}', description='d', student_id=student.id,
+                                 created_at=start + timedelta(minutes=n)) for n in range(count))
+        db.session.commit()
+
+
+# What index.html's fetchAllPages does
+def fetch_all(client, url):
+    titles, after = [], None
+    while True:
+        resp = client.get(url + (f'&after={after}' if after else ''))
+        assert resp.status_code == 200
+        titles += [q['title'] for q in resp.get_json()]
+        after = resp.headers.get('X-Next-Cursor')
+        if not after:
+            return titles
+
+
+def test_following_next_cursor_reaches_the_newest_query(app, client):
+    seed_queries(app, 60)
+    first_page = client.get('/api/queries/?include=responses')
+    assert len(first_page.get_json()) == 50 and first_page.headers['X-Next-Cursor']
+    assert fetch_all(client, '/api/queries/?include=responses&limit=20') == [f'claim {n}' for n in range(60)]
+
+
+def test_activity_sort_pages_most_recently_answered_first(app, client):
+    seed_queries(app, 10)
+    with app.app_context():
+        for query in db.session.query(Query):
+            n = int(query.title.split()[1])
+            # Two queries tie on their last response; queries 8 and 9 have none
+            if n < 8:
+                query.last_response_at = datetime(2026, 2, 1) + timedelta(hours=min(n, 6))
+        db.session.commit()
+
+    expected = ['claim 7', 'claim 6', 'claim 5', 'claim 4', 'claim 3', 'claim 2', 'claim 1', 'claim 0']
+    assert fetch_all(client, '/api/queries/?sort=activity&limit=3') == expected
+    assert fetch_all(client, '/api/queries/?sort=activity&fields=id,title&limit=2') == expected
+    assert client.get('/api/queries/?sort=popular').status_code == 400
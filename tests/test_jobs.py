@@ -0,0 +1,49 @@
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+import jobs
+from models import db, Job
+
+
+class StopSweep(Exception):
+    pass
+
+
+# Runs the sweep thread's target in the calling thread, for one pass
+class InlineThread:
+    def __init__(self, target, **kwargs):
+        self.target = target
+
+    def start(self):
+        with pytest.raises(StopSweep):
+            self.target()
+
+
+def test_sweep_starts_with_first_request_and_requeues_orphans(app, client, monkeypatch):
+    with app.app_context():
+        # One worker died mid-run an hour ago; another before running its job
+        long_ago = datetime.utcnow() - timedelta(hours=1)
+        db.session.add_all([
+            Job(kind='moderate', params=json.dumps({}), status='running', attempts=1, max_attempts=3,
+                updated_at=long_ago),
+            Job(kind='moderate', params=json.dumps({}), status='queued', max_attempts=3, updated_at=long_ago),
+        ])
+        db.session.commit()
+
+    jobs.get_runner(app).sweep_seconds = 3600
+    sleeps = []
+
+    def sleep(seconds):
+        sleeps.append(seconds)
+        raise StopSweep()
+
+    monkeypatch.setattr(jobs.time, 'sleep', sleep)
+    monkeypatch.setattr(jobs.threading, 'Thread', InlineThread)
+
+    client.get('/')
+    client.get('/')
+    assert sleeps == [3600]  # one sweeper per process
+    with app.app_context():
+        assert [job.status for job in db.session.query(Job).order_by(Job.id)] == ['succeeded', 'succeeded']
@@ -0,0 +1,68 @@
+import pytest
+
+import moderation
+from models import db, Query, Response
+
+
+@pytest.fixture
+def forum(app, client, login):
+    app.config['JOB_MAX_ATTEMPTS'] = 1
+    query_ids, response_ids = [], []
+    for n in range(3):
+        resp = client.post('/api/queries/new', headers=login('spammer', 'student'), json={
+            'title': f'Miracle cure number {n} that doctors hide', 'description': f'Buy it now, offer {n}.'})
+        query_ids.append(resp.get_json()['query_id'])
+        resp = client.post(f'/api/queries/respond/{query_ids[-1]}', headers=login('checker', 'faculty'),
+                           json={'content': 'There is no evidence for this.'})
+        response_ids.append(resp.get_json()['response_id'])
+    return query_ids, response_ids
+
+
+def moderate(client, login, **body):
+    resp = client.post('/api/queries/admin/moderate', headers=login('root', 'admin'), json=body)
+    assert resp.status_code == 202, resp.get_json()
+    return client.get(f"/api/admin/jobs/{resp.get_json()['job']['id']}", headers=login('root', 'admin')).get_json()
+
+
+def fail_on_responses(monkeypatch):
+    def delete_responses(batch, response_ids):
+        raise RuntimeError('connection lost')
+    monkeypatch.setattr(moderation.Moderation, 'delete_responses', delete_responses)
+
+
+def remaining(app):
+    with app.app_context():
+        return db.session.query(Query).count(), db.session.query(Response).count()
+
+
+def test_failure_mid_job_rolls_back_the_whole_batch(app, client, login, forum, monkeypatch):
+    query_ids, response_ids = forum
+    monkeypatch.setattr(moderation, 'CHUNK_SIZE', 1)
+    fail_on_responses(monkeypatch)
+
+    job = moderate(client, login, queries=query_ids[:2], responses=[response_ids[2]])
+    assert job['status'] == 'failed'
+    assert job['error'] == 'connection lost'
+    assert job['result'] is None
+    assert remaining(app) == (3, 3)
+
+
+def test_partial_failure_reports_applied_and_pending(app, client, login, forum, monkeypatch):
+    query_ids, response_ids = forum
+    monkeypatch.setattr(moderation, 'CHUNK_SIZE', 1)
+    fail_on_responses(monkeypatch)
+
+    job = moderate(client, login, queries=query_ids[:2], responses=[response_ids[2]], partial=True)
+    assert job['status'] == 'failed'
+    assert job['result']['applied'] == {'queries': query_ids[:2], 'responses': [], 'users': []}
+    assert job['result']['pending'] == {'queries': [], 'responses': [response_ids[2]], 'users': []}
+    assert job['progress'] == 2
+    assert remaining(app) == (1, 1)
+
+
+def test_batch_succeeds_in_one_transaction(app, client, login, forum):
+    query_ids, response_ids = forum
+    job = moderate(client, login, queries=query_ids[:2], responses=[response_ids[2]])
+    assert job['status'] == 'succeeded'
+    assert job['result'] == {'partial': False, 'deleted': {'queries': 2, 'responses': 3, 'users': 0}}
+    assert remaining(app) == (1, 0)
@@ -0,0 +1,20 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks'))
+
+import explain  # noqa: E402
+import run  # noqa: E402
+
+
+# benchmarks/explain.py on a small seeded SQLite forum: every statement the
+# benchmark endpoints issue must be served by an index (or be in ALLOWED)
+def test_benchmark_endpoints_have_no_plan_problems(app, monkeypatch):
+    monkeypatch.setattr(run, 'app', app)
+    monkeypatch.setattr(explain, 'app', app)
+    app.config['RESPONSE_CACHE_SIZE'] = 0
+    app.extensions.pop('response_cache', None)
+
+    explained, findings = explain.check(200, import_rows=5)
+    assert explained > 100
+    assert findings == []
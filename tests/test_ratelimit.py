@@ -0,0 +1,25 @@
+import json
+
+import pytest
+
+
+@pytest.fixture
+def limited(app):
+    app.config['RATE_LIMIT_ENABLED'] = True
+    app.config['RATE_LIMITS'] = dict(app.config['RATE_LIMITS'], login='3/60', login_addr='100/60')
+    app.extensions.pop('ratelimit_limits', None)
+    app.extensions.pop('ratelimit', None)
+    return app
+
+
+@pytest.mark.parametrize('content_type', ['application/json', 'text/plain'])
+def test_login_attempts_on_one_account_are_throttled(limited, client, content_type):
+    body = json.dumps({'username': 'victim', 'password': 'wrong', 'role': 'student'})
+    codes = [client.post('/api/auth/login', data=body, content_type=content_type).status_code
+             for _ in range(4)]
+    assert codes[-1] == 429
+
+    # ... from this address only
+    resp = client.post('/api/auth/login', data=body, content_type=content_type,
+                       environ_base={'REMOTE_ADDR': '10.0.0.2'})
+    assert resp.status_code != 429
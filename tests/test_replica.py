@@ -0,0 +1,64 @@
+import shutil
+import time
+from collections import OrderedDict
+
+import pytest
+
+from app import create_app
+from models import db
+import replica
+import response_cache
+
+
+# Stands in for RedisBackend: versions and write markers seen by every worker
+class SharedBackend(response_cache.LocalBackend):
+    def __init__(self):
+        super().__init__(ttl=0)
+        self.written = {}
+
+    def bump(self, namespaces, hold=0):
+        super().bump(namespaces)
+        for ns in namespaces:
+            self.written[ns] = time.monotonic() + hold
+
+    def recently_bumped(self, namespaces):
+        return any(self.written.get(ns, 0) > time.monotonic() for ns in namespaces)
+
+
+@pytest.fixture
+def replicated(app, tmp_path, monkeypatch):
+    primary = app.config['SQLALCHEMY_DATABASE_URI']
+    # init_app adds a metadata per bind to the shared db; other apps have no replica
+    monkeypatch.setattr(db, 'metadatas', dict(db.metadatas))
+    app = create_app(dict(app.config, REPLICA_DATABASE_URL='sqlite:///' + str(tmp_path / 'replica.db')))
+    assert app.config['SQLALCHEMY_DATABASE_URI'] == primary
+    app.extensions['response_cache'] = SharedBackend()
+    monkeypatch.setattr(replica, '_recent', OrderedDict())
+    yield app
+    with app.app_context():
+        db.session.remove()
+        for engine in db.engines.values():
+            engine.dispose()
+
+
+def test_shared_cache_keeps_other_workers_writes_off_the_replica(replicated, tmp_path):
+    client = replicated.test_client()
+    client.post('/api/auth/register', json={'username': 'author', 'password': 'correct horse battery',
+                                            'role': 'student'})
+    token = client.post('/api/auth/login', json={'username': 'author', 'password': 'correct horse battery',
+                                                 'role': 'student'}).get_json()['token']
+    # The replica stops here: it has the author but none of their queries
+    shutil.copy(tmp_path / 'forum.db', tmp_path / 'replica.db')
+    client.post('/api/queries/new', headers={'Authorization': 'Bearer ' + token}, json={
+        'title': 'Was the stadium photo taken this year', 'description': 'It is shared as last weekend.'})
+
+    # Another worker: it never saw the write, only the shared backend did
+    replica._recent.clear()
+    feed = client.get('/api/queries/')
+    assert [q['title'] for q in feed.get_json()] == ['Was the stadium photo taken this year']
+
+    # Once the window has passed, renders go back to the (lagging) replica
+    backend = replicated.extensions['response_cache']
+    backend.written.clear()
+    backend.entries.clear()
+    assert client.get('/api/queries/').get_json() == []
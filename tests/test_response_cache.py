@@ -0,0 +1,19 @@
+import response_cache
+
+
+def test_local_cache_expires_other_workers_writes(app, client, login, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(response_cache.time, 'time', lambda: now[0])
+    feed = client.get('/api/queries/')
+    assert feed.get_json() == []
+
+    # Another worker's write: committed, but never bumped this worker's versions
+    client.post('/api/queries/new', headers=login('author', 'student'), json={
+        'title': 'Was the stadium photo taken this year', 'description': 'It is shared as last weekend.'})
+    app.extensions['response_cache'].versions.clear()
+
+    assert client.get('/api/queries/', headers={'If-None-Match': feed.headers['ETag']}).status_code == 304
+    now[0] += response_cache.DEFAULT_LOCAL_TTL
+    fresh = client.get('/api/queries/', headers={'If-None-Match': feed.headers['ETag']})
+    assert fresh.status_code == 200
+    assert [q['title'] for q in fresh.get_json()] == ['Was the stadium photo taken this year']
@@ -0,0 +1,70 @@
+from models import db, ResponseVote
+
+
+def post_answered_query(client, login):
+    resp = client.post('/api/queries/new', headers=login('author', 'student'), json={
+        'title': 'Does the new vaccine study show what the post claims',
+        'description': 'A screenshot of the abstract is going around with a different conclusion.'})
+    assert resp.status_code == 201, resp.get_json()
+    query_id = resp.get_json()['query_id']
+    resp = client.post(f'/api/queries/respond/{query_id}', headers=login('checker', 'faculty'),
+                       json={'content': 'The abstract says the opposite; see the journal page.'})
+    assert resp.status_code == 201, resp.get_json()
+    return query_id, resp.get_json()['response_id']
+
+
+def embedded_response(body, query_id, response_id):
+    query = next(q for q in body if q['id'] == query_id)
+    return next(r for r in query['responses'] if r['id'] == response_id)
+
+
+def test_vote_refreshes_feeds_with_responses(client, login):
+    query_id, response_id = post_answered_query(client, login)
+    author = login('author', 'student')
+
+    # Warm the cached feed and /my, both embedding the response
+    feed = client.get('/api/queries/?include=responses')
+    my = client.get('/api/queries/my?include=responses', headers=author)
+    assert embedded_response(feed.get_json(), query_id, response_id)['score'] == 0
+    assert embedded_response(my.get_json(), query_id, response_id)['score'] == 0
+
+    for user, role, vote in (('reader', 'student', {'helpful': True}),
+                             ('reviewer', 'faculty', {'verified': True})):
+        resp = client.put(f'/api/queries/responses/{response_id}/vote', headers=login(user, role), json=vote)
+        assert resp.status_code == 200, resp.get_json()
+
+    feed_after = client.get('/api/queries/?include=responses', headers={'If-None-Match': feed.headers['ETag']})
+    assert feed_after.status_code == 200
+    response = embedded_response(feed_after.get_json(), query_id, response_id)
+    assert (response['helpful_count'], response['verified_count'], response['score']) == (1, 1, 6)
+
+    my_after = client.get('/api/queries/my?include=responses',
+                          headers={**author, 'If-None-Match': my.headers['ETag']})
+    assert my_after.status_code == 200
+    assert embedded_response(my_after.get_json(), query_id, response_id)['score'] == 6
+
+
+def test_withdrawn_vote_refreshes_feed(client, login):
+    query_id, response_id = post_answered_query(client, login)
+    reader = login('reader', 'student')
+    client.put(f'/api/queries/responses/{response_id}/vote', headers=reader, json={'helpful': True})
+    feed = client.get('/api/queries/?include=responses')
+    assert embedded_response(feed.get_json(), query_id, response_id)['score'] == 1
+
+    assert client.delete(f'/api/queries/responses/{response_id}/vote', headers=reader).status_code == 200
+    feed_after = client.get('/api/queries/?include=responses', headers={'If-None-Match': feed.headers['ETag']})
+    assert feed_after.status_code == 200
+    assert embedded_response(feed_after.get_json(), query_id, response_id)['score'] == 0
+
+
+def test_withdraw_deletes_only_an_existing_vote(app, client, login):
+    query_id, response_id = post_answered_query(client, login)
+    path = f'/api/queries/responses/{response_id}/vote'
+    assert client.delete(path, headers=login('reader', 'student')).status_code == 404
+    assert client.delete(path, headers=login('boss', 'admin')).status_code == 403
+
+    client.put(path, headers=login('reader', 'student'), json={'helpful': True})
+    assert client.delete(path, headers=login('reader', 'student')).status_code == 200
+    assert client.delete(path, headers=login('reader', 'student')).status_code == 404
+    with app.app_context():
+        assert db.session.query(ResponseVote).count() == 0
@@ -0,0 +1,171 @@
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import and_, or_, update
+from models import db, Query, TriageItem
+from serializers import timestamp
+
+# ------------------------------
+# Faculty triage queue with leased claims
+# ------------------------------
+# triage_items holds exactly the unanswered queries, so it plays the role of
+# a partial index on queries WHERE answered = false: ordered by
+# (priority DESC, created_at, query_id), the next free item is the first
+# index entry whose lease is empty or expired.
+#
+# Claiming is race-free on both backends:
+#   PostgreSQL  SELECT ... FOR UPDATE SKIP LOCKED, so concurrent claimers
+#               walk past each other's rows instead of waiting
+#   elsewhere   compare-and-set UPDATE ... WHERE the lease is still free,
+#               retried on the next candidate if another claimer won
+
+DEFAULT_LEASE_SECONDS = 900
+DEFAULT_PRIORITY = 0
+CAS_ATTEMPTS = 5
+
+
+class ClaimConflict(Exception):
+    pass
+
+
+def lease_seconds():
+    return current_app.config.get('TRIAGE_LEASE_SECONDS', DEFAULT_LEASE_SECONDS)
+
+
+def free_condition(now):
+    return or_(TriageItem.claimed_by.is_(None), TriageItem.lease_expires_at < now)
+
+
+def ordered():
+    return db.session.query(TriageItem).order_by(
+        TriageItem.priority.desc(), TriageItem.created_at, TriageItem.query_id
+    )
+
+
+def enqueue(query_id, created_at=None, priority=None):
+    if priority is None:
+        priority = current_app.config.get('TRIAGE_DEFAULT_PRIORITY', DEFAULT_PRIORITY)
+    db.session.add(TriageItem(query_id=query_id, priority=priority,
+                              created_at=created_at or datetime.utcnow()))
+
+
+def complete(query_id):
+    complete_many([query_id])
+
+
+def complete_many(query_ids):
+    query_ids = list(query_ids)
+    if query_ids:
+        db.session.query(TriageItem).filter(TriageItem.query_id.in_(query_ids)) \
+            .delete(synchronize_session=False)
+
+
+# Put queries that lost their last response back in the queue
+def requeue(query_ids):
+    query_ids = set(query_ids)
+    if not query_ids:
+        return
+    queued = {qid for (qid,) in db.session.query(TriageItem.query_id).filter(TriageItem.query_id.in_(query_ids))}
+    for query_id, created_at in db.session.query(Query.id, Query.created_at) \
+            .filter(Query.id.in_(query_ids - queued)):
+        enqueue(query_id, created_at=created_at)
+
+
+# Raises ClaimConflict if another faculty member holds a live lease
+def check_can_answer(query_id, faculty_id):
+    item = db.session.get(TriageItem, query_id)
+    if item and item.claimed_by not in (None, faculty_id) and item.lease_expires_at \
+            and item.lease_expires_at > datetime.utcnow():
+        raise ClaimConflict(f'Query {query_id} is claimed by another faculty member')
+
+
+def current_claim(faculty_id, now):
+    return db.session.query(TriageItem).filter(
+        TriageItem.claimed_by == faculty_id, TriageItem.lease_expires_at >= now
+    ).order_by(TriageItem.lease_expires_at).first()
+
+
+# Returns the claimed (or renewed) TriageItem, or None if the queue is empty
+def claim_next(faculty_id):
+    now = datetime.utcnow()
+    expires = now + timedelta(seconds=lease_seconds())
+
+    # One live lease per faculty member: claiming again renews it
+    held = current_claim(faculty_id, now)
+    if held:
+        held.lease_expires_at = expires
+        db.session.commit()
+        return held
+
+    if db.session.get_bind().dialect.name == 'postgresql':
+        item = ordered().filter(free_condition(now)).limit(1) \
+            .with_for_update(skip_locked=True).first()
+        if item is None:
+            db.session.rollback()
+            return None
+        item.claimed_by = faculty_id
+        item.lease_expires_at = expires
+        db.session.commit()
+        return item
+
+    for _ in range(CAS_ATTEMPTS):
+        candidate = ordered().with_entities(TriageItem.query_id, TriageItem.claimed_by) \
+            .filter(free_condition(now)).first()
+        if candidate is None:
+            return None
+        won = db.session.execute(
+            update(TriageItem)
+            .where(and_(TriageItem.query_id == candidate.query_id, free_condition(now)))
+            .values(claimed_by=faculty_id, lease_expires_at=expires)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        db.session.commit()
+        if won:
+            return db.session.get(TriageItem, candidate.query_id)
+    return None
+
+
+def release(query_id, faculty_id):
+    released = db.session.execute(
+        update(TriageItem)
+        .where(and_(TriageItem.query_id == query_id, TriageItem.claimed_by == faculty_id))
+        .values(claimed_by=None, lease_expires_at=None)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    db.session.commit()
+    return bool(released)
+
+
+def set_priority(query_id, priority):
+    updated = db.session.execute(
+        update(TriageItem).where(TriageItem.query_id == query_id).values(priority=priority)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    db.session.commit()
+    return bool(updated)
+
+
+def peek(limit):
+    now = datetime.utcnow()
+    items = ordered().limit(limit).all()
+    return [{
+        'query_id': item.query_id,
+        'priority': item.priority,
+        'created_at': timestamp(item.created_at),
+        'claimed_by': item.claimed_by if item.lease_expires_at and item.lease_expires_at >= now else None,
+    } for item in items]
+
+
+# Rebuild the queue from queries.answered (also exposed as `flask rebuild-triage`)
+def rebuild():
+    existing = {row.query_id: row for row in db.session.query(TriageItem)}
+    pending = db.session.query(Query.id, Query.created_at).filter(Query.answered.isnot(True)).all()
+    pending_ids = set()
+    for query_id, created_at in pending:
+        pending_ids.add(query_id)
+        if query_id not in existing:
+            enqueue(query_id, created_at=created_at)
+    stale = set(existing) - pending_ids
+    if stale:
+        db.session.query(TriageItem).filter(TriageItem.query_id.in_(stale)).delete(synchronize_session=False)
+    db.session.commit()
+    return len(pending_ids)
@@ -0,0 +1,212 @@
+import threading
+from datetime import datetime
+from flask import current_app
+from sqlalchemy import delete, false, func, inspect, select, text, true, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from models import db, Query, Response, ResponseVote
+import changes
+import response_cache
+
+# ------------------------------
+# Helpful / verified votes with write-buffered counters
+# ------------------------------
+# A vote is one row per (response, user), upserted and committed by the
+# request; nothing else is written then, so a burst of votes on one popular
+# response never queues on that response's row. The response id goes into
+# this worker's VoteBuffer, and a background thread recounts the buffered
+# responses every VOTE_FLUSH_SECONDS (sooner once VOTE_FLUSH_BATCH are
+# waiting) with one UPDATE, so get_query reads ready-made scores and orders
+# by them through ix_responses_query_score.
+#
+# Flushes recount from response_votes instead of adding deltas, so running
+# one twice, or from two workers, is harmless. Crash safety comes from
+# response_votes.counted: every vote clears it, and a flush sets it before
+# recounting in the same transaction. Responses whose votes were still only
+# in the memory of a dead worker keep uncounted rows, which the flusher picks
+# up (ix_response_votes_uncounted) whenever it has nothing buffered.
+#
+#   score = helpful votes + VERIFIED_WEIGHT * verified votes
+#
+#   VOTE_FLUSH_SECONDS  how stale scores may get (0 = recount in the request)
+#   VOTE_FLUSH_BATCH    buffered responses that trigger an early flush
+
+DEFAULT_FLUSH_SECONDS = 2.0
+DEFAULT_FLUSH_BATCH = 500
+VERIFIED_WEIGHT = 5
+COUNTER_COLUMNS = ('helpful_count', 'verified_count', 'score')
+
+
+def _count(flag):
+    return select(func.count()).select_from(ResponseVote).where(
+        ResponseVote.response_id == Response.id, flag == true()).scalar_subquery()
+
+
+# Recount the given responses from their votes inside the caller's
+# transaction. Returns the ids of the queries they belong to.
+def recount(response_ids):
+    response_ids = sorted(set(response_ids))
+    if not response_ids:
+        return []
+    # Claim the votes first: a vote cast after this point stays uncounted
+    db.session.execute(
+        update(ResponseVote).where(ResponseVote.response_id.in_(response_ids), ResponseVote.counted == false())
+        .values(counted=True).execution_options(synchronize_session=False)
+    )
+    helpful, verified = _count(ResponseVote.helpful), _count(ResponseVote.verified)
+    db.session.execute(
+        update(Response).where(Response.id.in_(response_ids))
+        .values(helpful_count=helpful, verified_count=verified, score=helpful + VERIFIED_WEIGHT * verified)
+        .execution_options(synchronize_session=False)
+    )
+    rows = db.session.query(Response.id, Response.query_id).filter(Response.id.in_(response_ids)).all()
+    changes.record('response', [response_id for response_id, _ in rows])
+    return sorted({query_id for _, query_id in rows})
+
+
+# Cached reads that embed these queries' responses: the query itself, the
+# feed and its author's /my (both with ?include=responses)
+def namespaces(query_ids):
+    if not query_ids:
+        return set()
+    rows = db.session.query(Query.id, Query.student_id).filter(Query.id.in_(query_ids)).all()
+    result = {'feed'}
+    for query_id, student_id in rows:
+        result.update((f'query:{query_id}', f'student:{student_id}'))
+    return result
+
+
+def flush(response_ids):
+    query_ids = recount(response_ids)
+    stale = namespaces(query_ids)
+    db.session.commit()
+    if stale:
+        response_cache.invalidate(*stale)
+    return len(query_ids)
+
+
+def uncounted(limit=DEFAULT_FLUSH_BATCH):
+    return [response_id for (response_id,) in db.session.query(ResponseVote.response_id)
+            .filter(ResponseVote.counted == false()).distinct().limit(limit)]
+
+
+class VoteBuffer:
+    def __init__(self, app, interval=DEFAULT_FLUSH_SECONDS, batch=DEFAULT_FLUSH_BATCH):
+        self.app = app
+        self.interval = interval
+        self.batch = batch
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.pending = set()
+        self.thread = None
+
+    def add(self, response_id):
+        if not self.interval:
+            flush([response_id])
+            return
+        with self.lock:
+            self.pending.add(response_id)
+            full = len(self.pending) >= self.batch
+            if self.thread is None:
+                # Started lazily so each forked web worker gets its own thread
+                self.thread = threading.Thread(target=self._loop, name='vote-flush', daemon=True)
+                self.thread.start()
+        if full:
+            self.wake.set()
+
+    def take(self):
+        with self.lock:
+            response_ids, self.pending = self.pending, set()
+        return response_ids
+
+    def _loop(self):
+        while True:
+            self.wake.wait(self.interval)
+            self.wake.clear()
+            self.drain()
+
+    # Flush what is buffered, or else whatever a dead worker left uncounted
+    def drain(self):
+        with self.app.app_context():
+            response_ids = self.take()
+            try:
+                flush(response_ids or uncounted(self.batch))
+            except Exception:
+                db.session.rollback()
+                self.app.logger.exception('Vote flush failed; %s responses stay uncounted', len(response_ids))
+                with self.lock:
+                    self.pending.update(response_ids)
+            finally:
+                db.session.remove()
+
+
+def get_buffer(app=None):
+    app = app or current_app._get_current_object()
+    buffer = app.extensions.get('votes')
+    if buffer is None:
+        buffer = VoteBuffer(app, interval=app.config.get('VOTE_FLUSH_SECONDS', DEFAULT_FLUSH_SECONDS),
+                            batch=app.config.get('VOTE_FLUSH_BATCH', DEFAULT_FLUSH_BATCH))
+        app.extensions['votes'] = buffer
+    return buffer
+
+
+# Upsert the caller's vote; None leaves that flag as it is. Commits.
+def cast(response_id, user_id, helpful=None, verified=None):
+    now = datetime.utcnow()
+    changed = {'counted': False, 'updated_at': now}
+    if helpful is not None:
+        changed['helpful'] = helpful
+    if verified is not None:
+        changed['verified'] = verified
+    dialect = db.session.get_bind().dialect.name
+    stmt = (pg_insert if dialect == 'postgresql' else sqlite_insert)(ResponseVote).values(
+        response_id=response_id, user_id=user_id, helpful=bool(helpful), verified=bool(verified),
+        counted=False, updated_at=now)
+    db.session.execute(stmt.on_conflict_do_update(
+        index_elements=[ResponseVote.response_id, ResponseVote.user_id], set_=changed))
+    vote = db.session.execute(
+        select(ResponseVote.helpful, ResponseVote.verified)
+        .where(ResponseVote.response_id == response_id, ResponseVote.user_id == user_id)
+    ).one()
+    db.session.commit()
+    get_buffer().add(response_id)
+    return {'response_id': response_id, 'helpful': vote.helpful, 'verified': vote.verified}
+
+
+# Delete the caller's vote; False when there was none. Commits. The response
+# is recounted in the same transaction: with the row gone, nothing would be
+# left for recover() to find if this worker died before its next flush.
+def withdraw(response_id, user_id):
+    deleted = db.session.execute(delete(ResponseVote).where(
+        ResponseVote.response_id == response_id, ResponseVote.user_id == user_id)).rowcount
+    if not deleted:
+        db.session.rollback()
+        return False
+    flush([response_id])
+    return True
+
+
+# Recount responses no flush has covered yet, e.g. after a crash (called by
+# the job runner's recovery sweep and by `flask flush-votes`);
+# everything=True recounts every voted response
+def recover(everything=False):
+    if everything:
+        db.session.execute(update(ResponseVote).values(counted=False))
+        db.session.commit()
+    recovered = 0
+    while True:
+        response_ids = uncounted()
+        if not response_ids:
+            return recovered
+        flush(response_ids)
+        recovered += len(response_ids)
+
+
+def ensure_columns():
+    existing = {column['name'] for column in inspect(db.engine).get_columns('responses')}
+    dialect = db.engine.dialect
+    for name in COUNTER_COLUMNS:
+        if name not in existing:
+            column_type = Response.__table__.c[name].type.compile(dialect=dialect)
+            db.session.execute(text(f"ALTER TABLE responses ADD COLUMN {name} {column_type} NOT NULL DEFAULT 0"))
+    db.session.commit()